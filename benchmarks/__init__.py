@@ -0,0 +1 @@
+##Intentionally empty for initialising modules
\ No newline at end of file
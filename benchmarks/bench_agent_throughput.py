@@ -0,0 +1,41 @@
+"""Measures how many concurrent Agent.invoke() calls finish per second against a fake LLM.
+
+The blocking fake sleeps synchronously, like the sync Groq client did inside the event loop,
+the async fake awaits, like the AsyncGroq backend does.
+
+Run from the repository root:
+    python -m benchmarks.bench_agent_throughput --concurrency 20 --latency 0.2
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from agent import Agent
+from benchmarks.fakes import FakeCompletionBackend
+
+
+async def run(concurrency: int, backend: FakeCompletionBackend) -> float:
+    agents = [Agent(backend=backend) for _ in range(concurrency)]
+    start = time.perf_counter()
+    await asyncio.gather(*[agent.invoke("What is on my calendar?", session=None) for agent in agents])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    for name, blocking in [("blocking", True), ("async", False)]:
+        backend = FakeCompletionBackend(latency=args.latency, blocking=blocking)
+        elapsed = asyncio.run(run(args.concurrency, backend))
+        print(f"{name:>8}: {args.concurrency} invocations in {elapsed:.2f} s ({args.concurrency / elapsed:.1f}/s)")
+
+
+if __name__ == "__main__":
+    main()
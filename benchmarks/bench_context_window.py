@@ -0,0 +1,81 @@
+"""Checks that the context window of a long tool loop stays within its token budget.
+
+Runs --iterations ReAct iterations, each an assistant tool call followed by an observation of
+a random size, once with XML tool calls and once with native tool calls and tool messages.
+After every message the window has to fit the budget, and no observation may be left in it
+without the message which called the tool.
+
+Run from the repository root:
+    python -m benchmarks.bench_context_window --iterations 200 --budget 6000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from utils.completion_utils import ContextWindow, approximate_token_count, build_prompt_structure, message_text
+
+
+def turn(mode: str, index: int, rng: random.Random) -> list[dict]:
+    #One iteration of the agent: the completion with the tool calls and what the tools returned
+    observations = ["x" * rng.choice([100, 2000, 8000, 30000]) for _ in range(rng.randint(1, 3))]
+    if mode == "xml":
+        return [
+            build_prompt_structure(f'<thought>Step {index}.</thought><tool_call>{{"name": "read_mail", "id": {index}}}</tool_call>', "assistant"),
+            build_prompt_structure(str(dict(enumerate(observations))), "user", tag="observation"),
+        ]
+    calls = [{"id": f"call_{index}_{i}", "type": "function", "function": {"name": "read_mail", "arguments": "{}"}} for i in range(len(observations))]
+    return [{"role": "assistant", "content": "", "tool_calls": calls}] + [
+        {"role": "tool", "tool_call_id": call["id"], "content": observation}
+        for call, observation in zip(calls, observations)
+    ]
+
+
+def check(window: ContextWindow, budget: int) -> None:
+    messages = list(window)
+    assert window.total_tokens == sum(approximate_token_count(message_text(msg)) for msg in messages), "The token count drifted"
+    assert window.total_tokens <= budget, f"The window holds {window.total_tokens} tokens, the budget is {budget}"
+    for previous, msg in zip(messages, messages[1:]):
+        if window._is_observation(msg):
+            assert previous["role"] == "assistant" or window._is_observation(previous), "An observation lost its tool call"
+
+
+def run(mode: str, iterations: int, budget: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    window = ContextWindow(
+        [build_prompt_structure("You are a helpful assistant.", "system"), build_prompt_structure("Read my mail.", "user", tag="question")],
+        token_budget=budget,
+        pinned=2,
+    )
+    appended, largest = 0, 0
+    for index in range(iterations):
+        for msg in turn(mode, index, rng):
+            window.append(msg)
+            appended += 1
+            check(window, budget)
+            largest = max(largest, window.total_tokens)
+    return {"appended": appended, "kept": len(window) - 2, "largest": largest}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--budget", type=int, default=6000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for mode in ("xml", "native"):
+        start = time.perf_counter()
+        result = run(mode, args.iterations, args.budget, args.seed)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(
+            f"{mode:>6}: {result['appended']} messages appended, {result['kept']} kept, "
+            f"at most {result['largest']} of {args.budget} tokens, {elapsed:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Compares the sequential thread lookup with the batched get_emails against a fake Gmail backend.
+
+Run from the repository root:
+    python -m benchmarks.bench_get_emails --threads 250
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from utils.tools_utils import get_emails
+from benchmarks.fakes import FakeGmailService, generate_mailbox, load_fixture
+
+
+def get_emails_sequential(days_into_the_past: int, service) -> str:
+    #The previous implementation: one full threads().get() per listed thread
+    out_string = ""
+    query = f'category:primary newer_than:{days_into_the_past}d'
+    threads = []
+    page_token = None
+    while True:
+        threads_result = service.users().threads().list(userId='me', q=query, pageToken=page_token).execute()
+        threads.extend(threads_result.get('threads', []))
+        page_token = threads_result.get('nextPageToken')
+        if not page_token:
+            break
+
+    for thread in threads:
+        thread_data = service.users().threads().get(userId='me', id=thread['id']).execute()
+        messages = thread_data.get('messages', [])
+        if messages:
+            headers = messages[0]['payload']['headers']
+            subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '(No Subject)')
+            out_string += f"Thread ID: {thread['id']}, Subject: {subject} \n"
+    return out_string
+
+
+def run(fn, threads, **kwargs):
+    service = FakeGmailService(threads)
+    start = time.perf_counter()
+    result = fn(3, service, **kwargs)
+    return result, service.round_trips, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=250)
+    parser.add_argument("--fixture", type=str, default="", help="Recorded mailbox as JSON list of threads")
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    threads = load_fixture(args.fixture) if args.fixture else generate_mailbox(args.threads)
+
+    sequential, sequential_trips, sequential_time = run(get_emails_sequential, threads)
+    batched, batched_trips, batched_time = run(get_emails, threads, batch_size=args.batch_size)
+    assert sequential == batched, "Batched output differs from the sequential output"
+
+    print(f"threads: {len(threads)}")
+    print(f"sequential: {sequential_trips} round trips, {sequential_time * 1000:.1f} ms")
+    print(f"batched:    {batched_trips} round trips, {batched_time * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Compares the live calendar and mail reads with reads from the local mirror.
+
+Every round trip to the fake Google backends blocks for --latency seconds. Reports the latency
+and round trips of a live read, a mirror read and a delta sync after a few changes, next to
+the cost of the initial full sync.
+
+Run from the repository root:
+    python -m benchmarks.bench_mirror --events 3000 --threads 2000 --latency 0.05
+"""
+import argparse
+import datetime as dt
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from utils.mirror_utils import LocalMirror
+from utils.tools_utils import format_appointments, format_emails, get_appointments, get_emails
+from benchmarks.fakes import FakeCalendarService, FakeGmailService, generate_calendar, generate_mailbox
+
+
+def timed(fn, services) -> tuple[float, int]:
+    round_trips = sum(service.round_trips for service in services)
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    return elapsed * 1000, sum(service.round_trips for service in services) - round_trips
+
+
+def change(calendar: FakeCalendarService, gmail: FakeGmailService, n_changes: int) -> None:
+    #Direct changes on the fakes, as if they were made in another client
+    events = list(calendar._events)
+    for event_id in events[:n_changes]:
+        calendar._events[event_id] = {**calendar._events[event_id], "summary": "Moved"}
+        calendar._changed(event_id)
+    for thread in generate_mailbox(n_changes, seed=7):
+        gmail.add_thread(thread)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=3000)
+    parser.add_argument("--threads", type=int, default=2000)
+    parser.add_argument("--changes", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds every round trip blocks")
+    args = parser.parse_args()
+
+    start = dt.datetime.now() - dt.timedelta(days=1)
+    calendar = FakeCalendarService(generate_calendar(args.events, seed=1, start=start), latency=args.latency)
+    gmail = FakeGmailService(generate_mailbox(args.threads, seed=2), latency=args.latency)
+    services = [calendar, gmail]
+    mirror = LocalMirror(os.path.join(tempfile.mkdtemp(prefix="agent-assistant-mirror-"), "mirror.sqlite3"))
+
+    rows = [
+        ("live appointments", lambda: get_appointments(7, calendar)),
+        ("live emails", lambda: get_emails(3, gmail)),
+        ("full sync", lambda: (mirror.sync("calendar", calendar), mirror.sync("gmail", gmail))),
+        ("mirror appointments", lambda: format_appointments(7, mirror.list_events(7))),
+        ("mirror emails", lambda: format_emails(mirror.list_threads(3))),
+        (f"delta sync ({args.changes} changes)", lambda: (mirror.sync("calendar", calendar), mirror.sync("gmail", gmail))),
+    ]
+
+    print(f"{args.events} events, {args.threads} threads, {args.latency * 1000:.0f} ms per round trip")
+    for name, fn in rows:
+        if name.startswith("delta"):
+            change(calendar, gmail, args.changes)
+        ms, round_trips = timed(fn, services)
+        print(f"{name:>26}: {ms:9.1f} ms, {round_trips:4d} round trips")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Checks that the system prompt stays the same size over many invocations of one agent.
+
+Run from the repository root:
+    python -m benchmarks.bench_prompt_size --invocations 1000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from agent import Agent
+from benchmarks.fakes import FakeCompletionBackend
+
+TOOLS = [
+    SimpleNamespace(
+        name=f"tool_{i}",
+        description=f"Does thing number {i}.",
+        inputSchema={"type": "object", "properties": {"value": {"type": "string"}}},
+    )
+    for i in range(8)
+]
+
+
+async def run(invocations: int) -> FakeCompletionBackend:
+    backend = FakeCompletionBackend()
+    agent = Agent(backend=backend)
+    for _ in range(invocations):
+        #The client rebinds the tool list before every message
+        agent.bind_tools(TOOLS)
+        await agent.invoke("What is on my calendar?", session=None)
+    return backend
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--invocations", type=int, default=1000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    backend = asyncio.run(run(args.invocations))
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.invocations} invocations in {elapsed:.2f} s")
+    print(f"prompt size: first {backend.prompt_chars[0]} chars, last {backend.prompt_chars[-1]} chars")
+    assert len(set(backend.prompt_chars)) == 1, "The prompt size changed between invocations"
+
+
+if __name__ == "__main__":
+    main()
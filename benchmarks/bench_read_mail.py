@@ -0,0 +1,83 @@
+"""Compares reading an email through format='raw' with the format='full' text part lookup.
+
+Reports the bytes received from the fake Gmail backend, the peak Python memory, the latency
+and the size of the returned text for a message with a large attachment.
+
+Run from the repository root:
+    python -m benchmarks.bench_read_mail --body-kib 256 --attachment-kib 4096
+"""
+import argparse
+import base64
+import email
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from utils.tools_utils import read_message
+from utils.completion_utils import approximate_token_count
+from benchmarks.fakes import FakeBackend, FakeGmailService, full_message, generate_mime_message
+
+
+def read_message_raw(message_id: str, service) -> str | None:
+    #The previous implementation: download the whole message and walk the MIME tree
+    email_message = service.users().messages().get(userId='me', id=message_id, format='raw').execute()
+    mime_msg = email.message_from_bytes(base64.urlsafe_b64decode(email_message['raw'].encode('ASCII')))
+    if mime_msg.is_multipart():
+        for part in mime_msg.walk():
+            if "attachment" in str(part.get('Content-Disposition') or ''):
+                continue
+            if part.get_content_type() == 'text/plain':
+                return part.get_payload(decode=True).decode(errors="replace")
+        return None
+    return mime_msg.get_payload(decode=True).decode(errors="replace")
+
+
+def run(fn, raw_messages: dict, message_id: str) -> dict:
+    service = FakeGmailService([], raw_messages=raw_messages)
+    start = time.perf_counter()
+    fn(message_id, service)
+    elapsed = time.perf_counter() - start
+
+    service = FakeGmailService([], raw_messages=raw_messages)
+    tracemalloc.start()
+    text = fn(message_id, service)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    FakeBackend.count_bytes = True
+    service = FakeGmailService([], raw_messages=raw_messages)
+    fn(message_id, service)
+    FakeBackend.count_bytes = False
+
+    return {
+        "ms": elapsed * 1000,
+        "received_kib": service.backend.bytes_received / 1024,
+        "peak_kib": peak / 1024,
+        "tokens": approximate_token_count(text or ""),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--body-kib", type=int, default=256)
+    parser.add_argument("--attachment-kib", type=int, default=4096)
+    args = parser.parse_args()
+
+    raw_messages = {"large": generate_mime_message(args.body_kib, args.attachment_kib, seed=1)}
+    #The conversion to format='full' stands in for work on Google's side
+    full_message(raw_messages["large"])
+
+    print(f"message: {args.body_kib} KiB text, {args.attachment_kib} KiB attachment")
+    for name, fn in [("raw", read_message_raw), ("text part", read_message)]:
+        result = run(fn, raw_messages, "large")
+        print(
+            f"{name:>10}: {result['ms']:8.1f} ms, {result['received_kib']:9.1f} KiB received, "
+            f"{result['peak_kib']:9.1f} KiB peak memory, {result['tokens']:6d} tokens returned"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Compares the streaming agent with and without speculative dispatch of side-effect-free tools.
+
+The scripted model writes a thought and two read-only tool calls in one completion and answers
+after the observation. Without speculation both calls start once the completion is complete,
+with it the first one starts as soon as its </tool_call> is streamed. Every completion takes
+--llm-latency seconds, spread over its chunks, every Google round trip --google-latency seconds.
+
+Run from the repository root:
+    python -m benchmarks.bench_speculative --llm-latency 0.6 --google-latency 0.02
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from fastmcp import Client
+
+from agent import Agent
+from utils.tracing_utils import tracer
+from benchmarks.fakes import FakeCompletionBackend
+from benchmarks.suite import Fixtures, ToolServerHarness
+
+SPECULATIVE_TOOLS = ["get_upcoming_appointments", "display_recent_emails", "read_mail", "search_emails"]
+
+TOOL_CALLS = [
+    ("display_recent_emails", {"days_into_the_past": 3}),
+    ("get_upcoming_appointments", {"days_into_the_future": 7}),
+]
+
+
+def scripted_completion(messages: list) -> str:
+    if str(messages[-1]["content"]).startswith("<observation>"):
+        return "<response>Here is your week and your inbox.</response>"
+    calls = "".join(
+        f'<tool_call>{json.dumps({"name": name, "arguments": arguments, "id": i})}</tool_call>'
+        for i, (name, arguments) in enumerate(TOOL_CALLS)
+    )
+    return f"<thought>I need the recent emails and the appointments of the week.</thought>{calls}"
+
+
+async def run(agent: Agent, session, harness: ToolServerHarness, google_latency: float) -> tuple[float, list[float]]:
+    harness.reset()
+    for service in harness.services.values():
+        service.backend.latency = google_latency
+    overlaps = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        async for event in agent.invoke_stream("What does my week look like and what is in my inbox?", session):
+            if event.type == "observation":
+                overlaps.append(event.data.get("speculative_overlap_ms", 0.0))
+        return (time.perf_counter() - start) * 1000, overlaps
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm-latency", type=float, default=0.6)
+    parser.add_argument("--google-latency", type=float, default=0.02)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tracer.exporter = None
+    harness = ToolServerHarness(Fixtures())
+    print(f"{args.llm_latency * 1000:.0f} ms per completion, {args.google_latency * 1000:.0f} ms per Google round trip")
+
+    async with Client(harness.tool_server.mcp) as client:
+        tools = (await client.session.list_tools()).tools
+        for name, speculative_tools in [("sequential", None), ("speculative", SPECULATIVE_TOOLS)]:
+            agent = Agent(backend=FakeCompletionBackend(scripted_completion, latency=args.llm_latency), speculative_tools=speculative_tools)
+            agent.bind_tools(tools)
+            runs = [await run(agent, client.session, harness, args.google_latency) for _ in range(args.repeat)]
+            ms = sorted(ms for ms, _ in runs)[len(runs) // 2]
+            overlap = sorted(sum(overlaps) for _, overlaps in runs)[len(runs) // 2]
+            print(f"{name:>12}: {ms:8.1f} ms per request, {overlap:6.1f} ms tool latency overlapped with the completion")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
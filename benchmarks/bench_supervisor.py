@@ -0,0 +1,113 @@
+"""Compares a compound request answered by one agent step by step with the supervisor and its workers.
+
+The request needs one tool per subtask (calendar, mail, briefing). The single agent calls one
+tool per iteration. The supervisor sends a request of one domain straight to its worker, and
+otherwise plans once, runs one worker per subtask concurrently and streams the merge of their
+results. Both run through invoke_stream, like in the app. Every completion of the fake Groq server takes --llm-latency seconds,
+every Google round trip --google-latency seconds.
+
+Run from the repository root:
+    python -m benchmarks.bench_supervisor --llm-latency 0.3 --google-latency 0.02
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from fastmcp import Client
+
+from agent import Agent
+from supervisor import Supervisor
+from utils.completion_utils import AsyncGroqBackend
+from utils.tracing_utils import tracer
+from benchmarks.fakes import FakeCompletionServer
+from benchmarks.suite import Fixtures, ToolServerHarness
+
+SUBTASKS = [
+    ("calendar", "get_upcoming_appointments", {"days_into_the_future": 7}),
+    ("mail", "display_recent_emails", {"days_into_the_past": 3}),
+    ("news", "create_morning_briefing", {}),
+]
+
+#The request of the first n subtasks
+QUESTIONS = [
+    "What does my week look like?",
+    "What does my week look like and what is in my inbox?",
+    "What does my week look like, what is in my inbox and what is the news?",
+]
+
+
+def tool_call(name: str, arguments: dict, id: int = 0) -> str:
+    return f'<tool_call>{json.dumps({"name": name, "arguments": arguments, "id": id})}</tool_call>'
+
+
+def scripted_completion(n_subtasks: int):
+    def respond(messages: list) -> str:
+        system, last = str(messages[0]["content"]), str(messages[-1]["content"])
+        if "morning briefing" in last:
+            return "Good morning! Here is your day."
+        if "supervisor of a team" in system:
+            plan = [{"worker": worker, "task": f"Use {name}."} for worker, name, _ in SUBTASKS[:n_subtasks]]
+            return f"<plan>{json.dumps(plan)}</plan>"
+        if "Your team has worked" in system:
+            return "Here is everything you asked for."
+
+        #The agent calls the tools it knows one after the other and answers once it has all observations
+        known = [(name, arguments) for _, name, arguments in SUBTASKS[:n_subtasks] if name in system]
+        observations = sum(1 for message in messages if str(message["content"]).startswith("<observation>"))
+        if observations < len(known):
+            name, arguments = known[observations]
+            return f"<thought>I need {name}.</thought>{tool_call(name, arguments, observations)}"
+        return "<response>Done.</response>"
+    return respond
+
+
+async def run(agent, question: str, session, harness: ToolServerHarness, google_latency: float) -> float:
+    harness.reset()
+    for service in harness.services.values():
+        service.backend.latency = google_latency
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        async for _ in agent.invoke_stream(question, session):
+            pass
+        return (time.perf_counter() - start) * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--google-latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    tracer.exporter = None
+    harness = ToolServerHarness(Fixtures())
+    print(f"{args.llm_latency * 1000:.0f} ms per completion, {args.google_latency * 1000:.0f} ms per Google round trip")
+
+    for n_subtasks in range(1, len(SUBTASKS) + 1):
+        with FakeCompletionServer(scripted_completion(n_subtasks), latency=args.llm_latency) as server:
+            os.environ["GROQ_BASE_URL"] = server.base_url
+            os.environ.setdefault("groq_api_key", "offline")
+            backend = AsyncGroqBackend(api_key="offline")
+
+            async with Client(harness.tool_server.mcp) as client:
+                tools = (await client.session.list_tools()).tools
+                agent = Agent(backend=backend)
+                agent.bind_tools([tool for tool in tools if tool.name in {name for _, name, _ in SUBTASKS[:n_subtasks]}])
+                supervisor = Supervisor(backend=backend)
+                supervisor.bind_tools(tools)
+
+                question = QUESTIONS[n_subtasks - 1]
+                for name, runner in [("single agent", agent), ("supervisor", supervisor)]:
+                    requests = server.requests
+                    ms = await run(runner, question, client.session, harness, args.google_latency)
+                    print(f"{n_subtasks} subtasks, {name:>12}: {ms:8.1f} ms, {server.requests - requests:2d} completions")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
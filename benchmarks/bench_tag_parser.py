@@ -0,0 +1,106 @@
+"""Microbenchmark and fuzz corpus for the ReAct tag parsers.
+
+Times three extract_tag_content scans against one extract_tags pass and the streaming
+TagStreamParser on large completions, the latter fed in small chunks which are cut before the
+timing, also on a completion full of stray "<" characters. Then it checks on a seeded corpus of malformed
+completions that the parsers never fail and that the streaming parser, fed in random
+chunks, agrees with extract_tags.
+
+Run from the repository root:
+    python -m benchmarks.bench_tag_parser --size 200000 --fuzz 5000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from utils.extraction_utils import REACT_TAGS, TagStreamParser, extract_tag_content, extract_tags
+
+FRAGMENTS = [
+    "<thought>", "</thought>", "<tool_call>", "</tool_call>", "<response>", "</response>",
+    "<THOUGHT>", "</Response>", "<", ">", "</", "<b>", "</b>", "a < b", "x > y", "<tool",
+    "_call>", "{\"name\": \"read_mail\", \"arguments\": {\"thread_id\": \"1\"}, \"id\": 0}",
+    "Some words ", "\n", "  ", "ümlaut ", "<observation>", "</observation>",
+]
+
+
+def large_completion(size: int) -> str:
+    block = (
+        "<thought>I need to read the mails one by one to answer this.</thought>\n"
+        "<tool_call>{\"name\": \"read_mail\", \"arguments\": {\"thread_id\": \"18c2\"}, \"id\": 0}</tool_call>\n"
+        + "Filler text the model produced between tags. " * 10 + "\n"
+    )
+    return block * (size // len(block)) + "<response>" + "The answer. " * 50 + "</response>"
+
+
+def fuzz_corpus(n: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    return ["".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 40))) for _ in range(n)]
+
+
+def chunked(text: str, rng: random.Random) -> list[str]:
+    chunks = []
+    position = 0
+    while position < len(text):
+        step = rng.randint(1, 12)
+        chunks.append(text[position:position + step])
+        position += step
+    return chunks
+
+
+def parse_chunks(chunks: list[str]) -> dict:
+    parser = TagStreamParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.close()
+    return parser.results()
+
+
+def parse_streaming(text: str, rng: random.Random) -> dict:
+    return parse_chunks(chunked(text, rng))
+
+
+def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=200_000, help="Characters of the large completion")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--fuzz", type=int, default=5000, help="Number of fuzzed completions")
+    args = parser.parse_args()
+
+    text = large_completion(args.size)
+    rng = random.Random(0)
+
+    three_scans = timed(lambda: [extract_tag_content(text, tag) for tag in REACT_TAGS], args.repeat)
+    single_pass = timed(lambda: extract_tags(text), args.repeat)
+    chunks = chunked(text, rng)
+    streaming = timed(lambda: parse_chunks(chunks), max(1, args.repeat // 10))
+    stray_text = "<thought>" + "a < b " * (args.size // 6) + "</thought>"
+    stray = timed(lambda: parse_chunks([stray_text]), max(1, args.repeat // 10))
+
+    print(f"completion size: {len(text)} chars")
+    print(f"extract_tag_content x3: {three_scans:.2f} ms")
+    print(f"extract_tags:           {single_pass:.2f} ms")
+    print(f"TagStreamParser:        {streaming:.2f} ms in {len(chunks)} chunks")
+    print(f"TagStreamParser, stray '<' in one chunk: {stray:.2f} ms")
+
+    mismatches = 0
+    for completion in fuzz_corpus(args.fuzz):
+        if parse_streaming(completion, rng) != extract_tags(completion):
+            mismatches += 1
+            print(f"mismatch: {completion!r}")
+    print(f"fuzz: {args.fuzz} completions, {mismatches} mismatches")
+    assert mismatches == 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Compares the time until the user sees the first token for Agent.invoke and Agent.invoke_stream.
+
+Run from the repository root:
+    python -m benchmarks.bench_time_to_first_token --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from agent import Agent
+from benchmarks.fakes import FakeCompletionBackend
+
+RESPONSE = "<thought>The user greets me, no tool is needed.</thought><response>" + "Hello there! " * 40 + "</response>"
+
+
+async def time_invoke(latency: float) -> float:
+    agent = Agent(backend=FakeCompletionBackend(RESPONSE, latency=latency))
+    start = time.perf_counter()
+    await agent.invoke("Hi!", session=None)
+    return time.perf_counter() - start
+
+
+async def time_invoke_stream(latency: float) -> float:
+    agent = Agent(backend=FakeCompletionBackend(RESPONSE, latency=latency))
+    start = time.perf_counter()
+    async for event in agent.invoke_stream("Hi!", session=None):
+        if event.type in ("thought_delta", "response_delta"):
+            return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds the fake model needs for the whole completion")
+    args = parser.parse_args()
+
+    print(f"invoke:        first visible token after {asyncio.run(time_invoke(args.latency)) * 1000:.0f} ms")
+    print(f"invoke_stream: first visible token after {asyncio.run(time_invoke_stream(args.latency)) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
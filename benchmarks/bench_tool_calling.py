@@ -0,0 +1,105 @@
+"""Compares the XML ReAct prompt with native function calling on the same tool-using request.
+
+Both agents bind all tools of the tool server and answer a request which needs --tools tool
+calls, one per iteration. The XML agent carries the tool catalog and the worked example in its
+system prompt, the native agent sends the input schemas as tools= and gets structured tool
+calls back. The prompt tokens are counted by the fake Groq server from the characters it
+receives, tool schemas included. Every completion takes --llm-latency seconds.
+
+Run from the repository root:
+    python -m benchmarks.bench_tool_calling --llm-latency 0.3 --tools 2
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from fastmcp import Client
+
+from agent import Agent
+from utils.completion_utils import AsyncGroqBackend
+from utils.tracing_utils import tracer
+from benchmarks.fakes import FakeCompletionServer
+from benchmarks.suite import Fixtures, ToolServerHarness
+
+TOOL_CALLS = [
+    ("get_upcoming_appointments", {"days_into_the_future": 7}),
+    ("display_recent_emails", {"days_into_the_past": 3}),
+    ("search_emails", {"query": "invoice from the dentist", "top_k": 5}),
+]
+
+
+def scripted_completion(n_tools: int):
+    #Calls the tools one after the other in the format of the agent's mode, then answers
+    def respond(messages: list):
+        if messages[-1]["role"] == "tool":
+            done = sum(1 for message in messages if message.get("tool_calls"))
+            if done < n_tools:
+                name, arguments = TOOL_CALLS[done]
+                return {"content": "", "tool_calls": [{"name": name, "arguments": arguments}]}
+            return "Here is your week and your inbox."
+        if "<tool_call>" in str(messages[0]["content"]):
+            done = sum(1 for message in messages if str(message["content"]).startswith("<observation>"))
+            if done < n_tools:
+                name, arguments = TOOL_CALLS[done]
+                call = json.dumps({"name": name, "arguments": arguments, "id": done})
+                return f"<thought>I need {name}.</thought><tool_call>{call}</tool_call>"
+            return "<response>Here is your week and your inbox.</response>"
+        #The first completion of the native agent
+        name, arguments = TOOL_CALLS[0]
+        return {"content": "", "tool_calls": [{"name": name, "arguments": arguments}]}
+    return respond
+
+
+async def run(agent: Agent, question: str, session, harness: ToolServerHarness, stream: bool) -> float:
+    harness.reset()
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        if stream:
+            async for _ in agent.invoke_stream(question, session):
+                pass
+        else:
+            await agent.invoke(question, session)
+        return (time.perf_counter() - start) * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--tools", type=int, default=2, choices=range(1, len(TOOL_CALLS) + 1))
+    args = parser.parse_args()
+
+    tracer.exporter = None
+    harness = ToolServerHarness(Fixtures())
+    question = "What does my week look like and what is in my inbox?"
+    print(f"{args.llm_latency * 1000:.0f} ms per completion, {args.tools} tool calls per request")
+
+    with FakeCompletionServer(scripted_completion(args.tools), latency=args.llm_latency) as server:
+        os.environ["GROQ_BASE_URL"] = server.base_url
+        backend = AsyncGroqBackend(api_key="offline")
+
+        async with Client(harness.tool_server.mcp) as client:
+            tools = (await client.session.list_tools()).tools
+            for stream in (False, True):
+                for tool_mode in ("xml", "native"):
+                    agent = Agent(backend=backend, tool_mode=tool_mode)
+                    agent.bind_tools(tools)
+                    first = len(server.script.prompt_chars)
+                    ms = await run(agent, question, client.session, harness, stream)
+
+                    prompt_tokens = [chars // 4 for chars in server.script.prompt_chars[first:]]
+                    name = f"{tool_mode} {'stream' if stream else 'invoke'}"
+                    print(
+                        f"{name:>14}: {ms:8.1f} ms, {len(prompt_tokens)} completions, "
+                        f"{prompt_tokens[0]:5d} prompt tokens in the first turn, {sum(prompt_tokens):6d} in total"
+                    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+"""Measures the system prompt of the agent with the full tool catalog and with the top-k tool retrieval.
+
+The tools of the tool server are mixed with generated tools of other Google services, up to
+--max-tools in total. For every catalog size it reports the prompt tokens of the ReAct system
+prompt with all tools and with the --top-k selected ones, the time a selection takes, and how
+often the tool a question needs is among the selected ones (recall@k).
+
+Run from the repository root:
+    python -m benchmarks.bench_tool_retrieval --top-k 5 --max-tools 500
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from fastmcp import Client
+from mcp.types import Tool
+
+from agent import Agent, compile_system_prompt
+from utils.completion_utils import approximate_token_count
+from benchmarks.fakes import FakeCompletionBackend
+from benchmarks.suite import Fixtures, ToolServerHarness
+
+#Questions and the tool of the tool server they need
+QUESTIONS = [
+    ("What appointments do I have in the next days?", "get_upcoming_appointments"),
+    ("Please delete my dentist appointment on Friday.", "delete_upcoming_appointments"),
+    ("Create an appointment with Anna tomorrow at 3pm.", "create_upcoming_appointment"),
+    ("Move my appointment with Tom to 5pm.", "update_upcoming_appointment"),
+    ("Show me my recent emails.", "display_recent_emails"),
+    ("Read the email in thread 18c2f.", "read_mail"),
+    ("Find the email with the invoice from the dentist.", "search_emails"),
+    ("Send an email to anna@example.com that I am running late.", "send_mail"),
+    ("Give me my morning briefing.", "create_morning_briefing"),
+]
+
+SERVICES = ["drive", "docs", "sheets", "slides", "tasks", "contacts", "keep", "photos", "youtube", "maps", "meet", "chat", "forms", "sites", "analytics"]
+OBJECTS = ["file", "folder", "document", "comment", "row", "permission", "label", "note", "album", "video", "playlist", "place", "space", "message", "report"]
+VERBS = ["list", "get", "create", "update", "delete", "share", "export", "search", "move", "copy"]
+
+
+def generate_tools(n: int, seed: int = 0) -> list[Tool]:
+    #Tools of other services whose descriptions share the common verbs with the real ones
+    rng = random.Random(seed)
+    tools = []
+    while len(tools) < n:
+        service, obj, verb = rng.choice(SERVICES), rng.choice(OBJECTS), rng.choice(VERBS)
+        name = f"{verb}_{service}_{obj}_{len(tools)}"
+        description = (
+            f"\n    {verb.capitalize()}s a {obj} in Google {service.capitalize()} of the user.\n\n"
+            f"    Parameters:\n        {obj}_id (str): The ID of the {obj}.\n\n"
+            f"    Returns:\n        str: A confirmation or the {obj} as formatted text.\n    "
+        )
+        tools.append(Tool(
+            name=name,
+            description=description,
+            inputSchema={
+                "type": "object",
+                "properties": {f"{obj}_id": {"title": f"{obj.capitalize()} Id", "type": "string"}},
+                "required": [f"{obj}_id"],
+            },
+        ))
+    return tools
+
+
+def measure(tools: list[Tool], top_k: int) -> dict:
+    agent = Agent(backend=FakeCompletionBackend(), tool_top_k=top_k)
+    agent.bind_tools(tools)
+    full_tokens = approximate_token_count(compile_system_prompt(agent.system_prompt, agent.tool_signatures))
+
+    prompt_tokens, hits, seconds = [], 0, 0.0
+    for question, expected in QUESTIONS:
+        start = time.perf_counter()
+        selected = agent._select_tools(question)
+        seconds += time.perf_counter() - start
+        hits += expected in {tool.name for tool in selected}
+        prompt_tokens.append(approximate_token_count(str(list(agent._build_chat_history(question, selected))[0]["content"])))
+
+    return {
+        "full_tokens": full_tokens,
+        "top_k_tokens": max(prompt_tokens),
+        "select_ms": seconds / len(QUESTIONS) * 1000,
+        "recall": hits / len(QUESTIONS),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--max-tools", type=int, default=500)
+    args = parser.parse_args()
+
+    harness = ToolServerHarness(Fixtures())
+    async with Client(harness.tool_server.mcp) as client:
+        server_tools = (await client.session.list_tools()).tools
+
+    print(f"top {args.top_k} tools per question, recall over {len(QUESTIONS)} questions")
+    sizes = [len(server_tools)] + [n for n in (50, 100, 200, 500, 1000) if len(server_tools) < n <= args.max_tools]
+    for n in sizes:
+        result = measure(server_tools + generate_tools(n - len(server_tools)), args.top_k)
+        print(
+            f"{n:5d} tools: full catalog {result['full_tokens']:7d} prompt tokens, "
+            f"top {args.top_k} {result['top_k_tokens']:5d}, {result['select_ms']:6.2f} ms per selection, "
+            f"recall@{args.top_k} {result['recall']:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+"""Load test of the MCP tool server with many concurrent in-memory clients and stubbed Google services.
+
+Every Google round trip blocks for --latency seconds. In "sync" mode the tools block the server's
+event loop, in "threaded" mode they run on the tool thread pool, so throughput should grow almost
+linearly with the number of clients until the per-tool concurrency limit or the pool is saturated.
+
+Run from the repository root:
+    python -m benchmarks.bench_tool_server_load --clients 1 2 4 8 16 --latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from fastmcp import Client
+
+import src.mcp_server.tool_server as tool_server
+from benchmarks.fakes import FakeCalendarService, FakeGmailService, generate_calendar, generate_mailbox
+
+
+def install_fake_services(latency: float) -> dict:
+    services = {
+        "calendar": FakeCalendarService(generate_calendar(50), latency=latency),
+        "gmail": FakeGmailService(generate_mailbox(50), latency=latency),
+    }
+    tool_server.setup_server()
+    tool_server.get_service = lambda api_name, version: services[api_name]
+    #Every call has to reach the (fake) Google API
+    tool_server.read_cache.max_entries = 0
+    return services
+
+
+async def simulated_client(calls: int) -> None:
+    async with Client(tool_server.mcp) as client:
+        for _ in range(calls):
+            await client.call_tool("get_upcoming_appointments", {"days_into_the_future": 7})
+
+
+async def run(clients: int, calls: int) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*[simulated_client(calls) for _ in range(clients)])
+    return clients * calls / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--calls", type=int, default=10, help="Tool calls per client")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per Google round trip")
+    parser.add_argument("--tool-concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    install_fake_services(args.latency)
+    tool_server.tool_executor.default_concurrency = args.tool_concurrency
+
+    for mode in ("sync", "threaded"):
+        tool_server.tool_executor.mode = mode
+        for clients in args.clients:
+            tool_server.tool_executor.reset()
+            throughput = asyncio.run(run(clients, args.calls))
+            stats = tool_server.tool_executor.stats().get("get_upcoming_appointments", {})
+            print(f"{mode:>8} | {clients:>3} clients | {throughput:7.1f} calls/s | max queued {stats.get('max_queued', 0)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,652 @@
+import json
+import time
+import email
+import base64
+import random
+import functools
+import asyncio
+import threading
+import datetime as dt
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeBackend:
+    #Sizing the responses costs time, so it is only switched on for runs which are not timed
+    count_bytes = False
+
+    def __init__(self, latency: float = 0.0):
+        """Counts the HTTP round trips a fake Google service would have made.
+
+        Args:
+            latency (float): Seconds every round trip blocks, like a request to Google would.
+        """
+        self.latency = latency
+        self.round_trips = 0
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+
+    def round_trip(self) -> None:
+        with self._lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def receive(self, response) -> None:
+        #The size of the JSON body Google would have sent
+        if not self.count_bytes:
+            return
+        size = len(json.dumps(response)) if response is not None else 0
+        with self._lock:
+            self.bytes_received += size
+
+
+class FakeRequest:
+    def __init__(self, backend: FakeBackend, handler, **kwargs):
+        self._backend = backend
+        self._handler = handler
+        self._kwargs = kwargs
+        self.headers = {}
+
+    def _run(self):
+        return self._handler(**self._kwargs)
+
+    def execute(self):
+        self._backend.round_trip()
+        response = self._run()
+        self._backend.receive(response)
+        return response
+
+
+class FakeBatchHttpRequest:
+    def __init__(self, backend: FakeBackend, callback=None):
+        self._backend = backend
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request: FakeRequest, callback=None, request_id=None):
+        self._requests.append((request, callback or self._callback, request_id or str(len(self._requests))))
+
+    def execute(self):
+        self._backend.round_trip()
+        for request, callback, request_id in self._requests:
+            try:
+                response, exception = request._run(), None
+            except Exception as error:
+                response, exception = None, error
+            self._backend.receive(response)
+            if callback is not None:
+                callback(request_id, response, exception)
+
+
+MAIL_TOPICS = ["invoice", "meeting", "flight", "dentist", "birthday", "contract", "delivery", "password", "holiday", "insurance"]
+MAIL_WORDS = ["the", "please", "find", "attached", "regards", "tomorrow", "about", "your", "order", "confirm", "thanks", "update", "next", "week", "team"]
+
+
+def generate_mailbox(n_threads: int, seed: int = 0) -> list[dict]:
+    """Generates a deterministic mailbox fixture in the shape of Gmail thread resources."""
+    rng = random.Random(seed)
+    #The bodies have their own generator, so the ids do not depend on them
+    body_rng = random.Random(seed + 1)
+    #Dates are relative to now, so the threads fall into the time window of the mail queries
+    now_ms = int(time.time() * 1000)
+    threads = []
+    for i in range(n_threads):
+        thread_id = f"{rng.getrandbits(64):016x}"
+        messages = []
+        topic = body_rng.choice(MAIL_TOPICS)
+        for j in range(rng.randint(1, 4)):
+            words = body_rng.choices(MAIL_WORDS, k=body_rng.randint(20, 200)) + [topic] * body_rng.randint(1, 3)
+            body_rng.shuffle(words)
+            text = " ".join(words).encode()
+            messages.append({
+                "id": f"{thread_id}{j}",
+                "threadId": thread_id,
+                "labelIds": ["INBOX", "CATEGORY_PERSONAL"],
+                "internalDate": str(now_ms - rng.randint(0, 2 * 86400 * 1000)),
+                "payload": {
+                    "mimeType": "text/plain",
+                    "headers": [
+                        {"name": "From", "value": f"sender{i}@example.com"},
+                        {"name": "Subject", "value": f"Subject of thread {i}"},
+                    ],
+                    "body": {"data": base64.urlsafe_b64encode(text).decode(), "size": len(text)},
+                },
+                "snippet": " ".join(words[:20]),
+            })
+        threads.append({"id": thread_id, "messages": messages})
+    return threads
+
+
+def generate_mime_message(body_kib: int, attachment_kib: int = 0, seed: int = 0) -> str:
+    """Generates a multipart message with a text, an HTML and an attachment part, encoded like format='raw'."""
+    rng = random.Random(seed)
+    words = ["meeting", "budget", "review", "project", "deadline", "update", "team", "quarter", "draft", "call"]
+    text = ""
+    while len(text) < body_kib * 1024:
+        text += " ".join(rng.choice(words) for _ in range(12)) + ".\n"
+
+    message = MIMEMultipart("mixed")
+    message["Subject"] = f"Large message {seed}"
+    message["From"] = "sender@example.com"
+    alternative = MIMEMultipart("alternative")
+    alternative.attach(MIMEText(text, "plain"))
+    alternative.attach(MIMEText("<html><body>" + text.replace("\n", "<br>") + "</body></html>", "html"))
+    message.attach(alternative)
+    if attachment_kib:
+        attachment = MIMEBase("application", "octet-stream")
+        attachment.set_payload(base64.b64encode(rng.randbytes(attachment_kib * 1024)).decode())
+        attachment["Content-Transfer-Encoding"] = "base64"
+        attachment["Content-Disposition"] = 'attachment; filename="report.bin"'
+        message.attach(attachment)
+    return base64.urlsafe_b64encode(message.as_bytes()).decode()
+
+
+def load_fixture(path: str):
+    with open(path) as file:
+        return json.load(file)
+
+
+class FakeGmailService:
+    def __init__(self, threads: list[dict], page_size: int = 500, latency: float = 0.0, raw_messages: dict | None = None):
+        """Replays a recorded mailbox through the subset of the Gmail API the tools use.
+
+        Args:
+            threads (list[dict]): Gmail thread resources, e.g. from generate_mailbox or load_fixture.
+            page_size (int): The maximum page size threads().list returns, regardless of maxResults.
+            latency (float): Seconds every round trip blocks.
+            raw_messages (dict | None): Message ids mapped to their format='raw' encoding.
+        """
+        self.backend = FakeBackend(latency)
+        self._threads = {thread["id"]: thread for thread in threads}
+        self._order = [thread["id"] for thread in threads]
+        self._page_size = page_size
+        self._messages = FakeGmailMessages(self, raw_messages or {})
+        self.sent = self._messages.sent
+        self.history_id = 1000
+        self.min_history_id = 0
+        self._history = []
+
+    @property
+    def round_trips(self) -> int:
+        return self.backend.round_trips
+
+    def users(self):
+        return self
+
+    def threads(self):
+        return self
+
+    def messages(self):
+        return self._messages
+
+    def history(self):
+        return FakeGmailHistory(self)
+
+    def getProfile(self, userId):
+        return FakeRequest(self.backend, lambda: {"emailAddress": "me@example.com", "historyId": str(self.history_id)})
+
+    def add_thread(self, thread: dict) -> None:
+        """Delivers a new thread, recorded in the history like Gmail does."""
+        self._threads[thread["id"]] = thread
+        self._order.insert(0, thread["id"])
+        self._messages.add(thread["messages"])
+        self.history_id += 1
+        self._history.append({
+            "id": str(self.history_id),
+            "messagesAdded": [{"message": {"id": message["id"], "threadId": thread["id"]}} for message in thread["messages"]],
+        })
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatchHttpRequest(self.backend, callback=callback)
+
+    def list(self, userId, q=None, maxResults=100, pageToken=None):
+        return FakeRequest(self.backend, self._list, maxResults=maxResults, pageToken=pageToken)
+
+    def get(self, userId, id, format="full", metadataHeaders=None):
+        return FakeRequest(self.backend, self._get, id=id, format=format, metadataHeaders=metadataHeaders)
+
+    def _list(self, maxResults, pageToken):
+        start = int(pageToken or 0)
+        end = start + min(maxResults, self._page_size)
+        result = {"threads": [{"id": thread_id} for thread_id in self._order[start:end]]}
+        if end < len(self._order):
+            result["nextPageToken"] = str(end)
+        return result
+
+    def _get(self, id, format, metadataHeaders):
+        thread = self._threads[id]
+        if format != "metadata":
+            return thread
+
+        wanted = set(metadataHeaders or [])
+        messages = []
+        for message in thread["messages"]:
+            headers = [h for h in message["payload"]["headers"] if not wanted or h["name"] in wanted]
+            messages.append({
+                "id": message["id"],
+                "threadId": id,
+                "labelIds": message.get("labelIds", []),
+                "internalDate": message.get("internalDate", "0"),
+                "payload": {"headers": headers},
+            })
+        return {"id": id, "messages": messages}
+
+
+class FakeGmailHistory:
+    def __init__(self, gmail: FakeGmailService):
+        self._gmail = gmail
+
+    def list(self, userId, startHistoryId, pageToken=None, historyTypes=None):
+        def handler():
+            start = int(startHistoryId)
+            #Gmail keeps the history for about a week, older ids are answered with 404
+            if start < self._gmail.min_history_id:
+                raise http_error(404)
+            records = [record for record in self._gmail._history if int(record["id"]) > start]
+            return {"history": records, "historyId": str(self._gmail.history_id)}
+        return FakeRequest(self._gmail.backend, handler)
+
+
+@functools.lru_cache(maxsize=64)
+def full_message(raw: str) -> tuple[dict, dict]:
+    """Converts a format='raw' message into its format='full' payload and the data of its attachments.
+
+    Like Gmail, the payload holds the data of the text parts inline and only an attachment id
+    for attachments and for parts above 512 KiB.
+    """
+    mime_message = email.message_from_bytes(base64.urlsafe_b64decode(raw))
+    attachments = {}
+
+    def convert(part, part_id: str) -> dict:
+        resource = {
+            "partId": part_id,
+            "mimeType": part.get_content_type(),
+            "filename": part.get_filename() or "",
+            "headers": [{"name": name, "value": str(value)} for name, value in part.items()],
+        }
+        if part.is_multipart():
+            resource["body"] = {"size": 0}
+            resource["parts"] = [convert(child, f"{part_id}.{i}" if part_id else str(i)) for i, child in enumerate(part.get_payload())]
+            return resource
+
+        content = part.get_payload(decode=True) or b""
+        data = base64.urlsafe_b64encode(content).decode()
+        if resource["filename"] or len(content) > 512 * 1024:
+            attachment_id = f"attachment{len(attachments)}"
+            attachments[attachment_id] = data
+            resource["body"] = {"size": len(content), "attachmentId": attachment_id}
+        else:
+            resource["body"] = {"size": len(content), "data": data}
+        return resource
+
+    return convert(mime_message, ""), attachments
+
+
+class FakeGmailMessages:
+    def __init__(self, gmail: FakeGmailService, raw_messages: dict):
+        self.backend = gmail.backend
+        self._raw = raw_messages
+        self._mailbox = {}
+        self.sent = []
+        self.add(message for thread_id in gmail._order for message in gmail._threads[thread_id]["messages"])
+
+    def add(self, messages) -> None:
+        #The messages of the mailbox, newest thread first like messages().list
+        new = {message["id"]: message for message in messages}
+        self._mailbox = {**new, **self._mailbox} if self._mailbox else new
+
+    def list(self, userId, q=None, maxResults=100, pageToken=None):
+        def handler():
+            ids = list(self._mailbox)
+            start = int(pageToken or 0)
+            end = start + min(maxResults, 500)
+            result = {"messages": [{"id": id, "threadId": self._mailbox[id]["threadId"]} for id in ids[start:end]]}
+            if end < len(ids):
+                result["nextPageToken"] = str(end)
+            return result
+        return FakeRequest(self.backend, handler)
+
+    def get(self, userId, id, format="full"):
+        def handler():
+            if id in self._mailbox and id not in self._raw:
+                return self._mailbox[id]
+            if id not in self._raw:
+                raise http_error(404)
+            if format == "raw":
+                return {"id": id, "raw": self._raw[id]}
+            return {"id": id, "payload": full_message(self._raw[id])[0]}
+        return FakeRequest(self.backend, handler)
+
+    def attachments(self):
+        return FakeGmailAttachments(self.backend, self._raw)
+
+    def send(self, userId, body):
+        def handler():
+            self.sent.append(body)
+            return {"id": f"sent{len(self.sent)}"}
+        return FakeRequest(self.backend, handler)
+
+
+class FakeGmailAttachments:
+    def __init__(self, backend: FakeBackend, raw_messages: dict):
+        self.backend = backend
+        self._raw = raw_messages
+
+    def get(self, userId, messageId, id):
+        def handler():
+            data = full_message(self._raw[messageId])[1][id]
+            return {"size": len(data) * 3 // 4, "data": data}
+        return FakeRequest(self.backend, handler)
+
+
+def http_error(status: int):
+    from googleapiclient.errors import HttpError
+    from httplib2 import Response
+
+    return HttpError(Response({"status": status}), b"")
+
+
+def generate_calendar(n_events: int, seed: int = 0, start: dt.datetime | None = None) -> list[dict]:
+    """Generates a deterministic calendar fixture in the shape of Calendar event resources.
+
+    The events follow each other every half hour from `start` on, by default from a fixed date.
+    """
+    rng = random.Random(seed)
+    start = start or dt.datetime(2025, 1, 6, 8, 0)
+    events = []
+    for i in range(n_events):
+        begin = start + dt.timedelta(minutes=30 * i + rng.randint(0, 20))
+        events.append({
+            "id": f"event{i:06d}",
+            "etag": f"\"{rng.getrandbits(32)}\"",
+            "summary": f"Appointment {i}",
+            "start": {"dateTime": begin.isoformat() + "+01:00"},
+            "end": {"dateTime": (begin + dt.timedelta(minutes=rng.choice([15, 30, 60]))).isoformat() + "+01:00"},
+            "htmlLink": f"https://calendar.google.com/event?eid=event{i:06d}",
+        })
+    return events
+
+
+class FakeCalendarService:
+    def __init__(self, events: list[dict], latency: float = 0.0):
+        """Replays a recorded calendar through the subset of the Calendar API the tools use.
+
+        The time window of list requests is ignored, every request returns the first page of events.
+        Requests without a time window list all events page by page and end with a sync token,
+        which later requests use to get the changed and deleted events.
+
+        Args:
+            events (list[dict]): Calendar event resources, e.g. from generate_calendar or load_fixture.
+            latency (float): Seconds every round trip blocks.
+        """
+        self.backend = FakeBackend(latency)
+        self._events = {event["id"]: event for event in events}
+        self._version = 0
+        self._changes = []
+        self.min_sync_version = 0
+
+    @property
+    def round_trips(self) -> int:
+        return self.backend.round_trips
+
+    def events(self):
+        return self
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatchHttpRequest(self.backend, callback=callback)
+
+    @property
+    def etag(self) -> str:
+        return f'"{self._version}"'
+
+    def _changed(self, event_id: str) -> None:
+        self._version += 1
+        self._changes.append((self._version, event_id))
+
+    def _sync(self, sync_token: str) -> dict:
+        version = int(sync_token.removeprefix("sync"))
+        if version < self.min_sync_version:
+            raise http_error(410)
+        changed = dict.fromkeys(event_id for changed_at, event_id in self._changes if changed_at > version)
+        items = [self._events.get(event_id, {"id": event_id, "status": "cancelled"}) for event_id in changed]
+        return {"items": items, "nextSyncToken": f"sync{self._version}"}
+
+    def _page(self, max_results: int, page_token: str | None) -> dict:
+        start = int(page_token or 0)
+        events = list(self._events.values())
+        result = {"items": events[start:start + max_results]}
+        if start + max_results < len(events):
+            result["nextPageToken"] = str(start + max_results)
+        else:
+            result["nextSyncToken"] = f"sync{self._version}"
+        return result
+
+    def list(self, calendarId, timeMin=None, timeMax=None, maxResults=250, singleEvents=True, orderBy=None, syncToken=None, pageToken=None):
+        def handler():
+            if syncToken:
+                return self._sync(syncToken)
+            if timeMin is None:
+                return self._page(maxResults, pageToken)
+            if request.headers.get("If-None-Match") == self.etag:
+                raise http_error(304)
+            return {"etag": self.etag, "items": list(self._events.values())[:maxResults]}
+        request = FakeRequest(self.backend, handler)
+        return request
+
+    def get(self, calendarId, eventId):
+        return FakeRequest(self.backend, lambda: self._events[eventId])
+
+    def insert(self, calendarId, body):
+        def handler():
+            event = {**body, "id": f"event{len(self._events):06d}", "htmlLink": "https://calendar.google.com/event"}
+            self._events[event["id"]] = event
+            self._changed(event["id"])
+            return event
+        return FakeRequest(self.backend, handler)
+
+    def patch(self, calendarId, eventId, body, sendUpdates=None):
+        def handler():
+            self._events[eventId] = {**self._events[eventId], **body}
+            self._changed(eventId)
+            return self._events[eventId]
+        return FakeRequest(self.backend, handler)
+
+    def delete(self, calendarId, eventId, sendNotifications=False):
+        def handler():
+            del self._events[eventId]
+            self._changed(eventId)
+        return FakeRequest(self.backend, handler)
+
+
+class FakeCompletionBackend:
+    def __init__(self, responses=None, latency: float = 0.0, blocking: bool = False):
+        """Stands in for the LLM so the agent can be benchmarked offline.
+
+        Args:
+            responses (str | list[str] | Callable): A fixed completion, a script of completions
+                                                    replayed in order, or a function of the messages.
+                                                    A completion with native tool calls is a dict with
+                                                    'content' and 'tool_calls' of names and arguments.
+            latency (float): Seconds every completion takes.
+            blocking (bool): Sleep synchronously, like a sync client inside the event loop would.
+        """
+        self.responses = "<response>Done.</response>" if responses is None else responses
+        self.latency = latency
+        self.blocking = blocking
+        self.calls = 0
+        self.prompt_chars = []
+
+    def _next_response(self, messages: list) -> str:
+        if callable(self.responses):
+            return self.responses(messages)
+        if isinstance(self.responses, list):
+            return self.responses[min(self.calls, len(self.responses) - 1)]
+        return self.responses
+
+    def _record(self, messages: list, tools: list | None = None) -> tuple[str, list[dict]]:
+        #Returns the content and the native tool calls of the next completion.
+        #The tool schemas count towards the prompt, like they do for a real model
+        from utils.completion_utils import message_text
+
+        response = self._next_response(messages)
+        self.calls += 1
+        prompt_chars = sum(len(message_text(message)) for message in messages)
+        self.prompt_chars.append(prompt_chars + (len(json.dumps(tools)) if tools else 0))
+
+        if not isinstance(response, dict):
+            return response, []
+        tool_calls = [
+            {"id": f"call_{self.calls}_{i}", "name": tool_call["name"], "arguments": tool_call.get("arguments", {})}
+            for i, tool_call in enumerate(response.get("tool_calls", []))
+        ]
+        return response.get("content", ""), tool_calls
+
+    async def complete(self, messages: list, model: str, **options):
+        from utils.completion_utils import CompletionResult, ToolCall
+
+        if self.blocking:
+            time.sleep(self.latency)
+        elif self.latency:
+            await asyncio.sleep(self.latency)
+
+        content, tool_calls = self._record(messages, options.get("tools"))
+        return CompletionResult(
+            content=content,
+            prompt_tokens=self.prompt_chars[-1] // 4,
+            completion_tokens=(len(content) + len(json.dumps(tool_calls))) // 4 if tool_calls else len(content) // 4,
+            tool_calls=[ToolCall(**tool_call) for tool_call in tool_calls],
+        )
+
+    async def stream(self, messages: list, model: str, chunk_size: int = 4, **options):
+        #The latency is spread over the chunks like the generation time of a real model
+        from utils.completion_utils import ToolCall
+
+        content, tool_calls = self._record(messages, options.get("tools"))
+        chunks = [content[start:start + chunk_size] for start in range(0, len(content), chunk_size)]
+        for chunk in chunks:
+            await asyncio.sleep(self.latency / (len(chunks) + len(tool_calls)))
+            yield chunk
+        for tool_call in tool_calls:
+            await asyncio.sleep(self.latency / (len(chunks) + len(tool_calls)))
+            yield ToolCall(**tool_call)
+
+
+class FakeCompletionServer:
+    def __init__(self, responses=None, latency: float = 0.0, chunk_size: int = 4):
+        """Serves the OpenAI compatible chat completions endpoint of Groq on localhost.
+
+        Point the Groq clients at it with the GROQ_BASE_URL environment variable, so the
+        real client code, including its HTTP handling, runs against scripted completions.
+
+        Args:
+            responses (str | list[str] | Callable): Like FakeCompletionBackend.
+            latency (float): Seconds every completion takes.
+            chunk_size (int): Characters per streamed chunk.
+        """
+        self.script = FakeCompletionBackend(responses)
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-groq", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _complete(self, body: dict) -> tuple[str, list[dict], int]:
+        with self._lock:
+            self.requests += 1
+            #With tool_choice "none" the model may only answer
+            tools = body.get("tools") if body.get("tool_choice") != "none" else None
+            content, tool_calls = self.script._record(body["messages"], body.get("tools"))
+            if tools is None and tool_calls:
+                content, tool_calls = content or "Done.", []
+            prompt_chars = self.script.prompt_chars[-1]
+        if self.latency:
+            time.sleep(self.latency)
+        return content, tool_calls, prompt_chars // 4
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            #Headers and body are separate writes, Nagle would hold the body back for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, content_type: str, payload: bytes) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                if not self.path.endswith("/chat/completions"):
+                    self._send(404, "application/json", b'{"error": {"message": "not found"}}')
+                    return
+
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                content, tool_calls, prompt_tokens = server._complete(body)
+                finish_reason = "tool_calls" if tool_calls else "stop"
+                completion_tokens = (len(content) + len(json.dumps(tool_calls))) // 4 if tool_calls else len(content) // 4
+                completion = {
+                    "id": f"chatcmpl-{server.requests}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body["model"],
+                }
+
+                calls = [
+                    {"id": tool_call["id"], "type": "function", "function": {"name": tool_call["name"], "arguments": json.dumps(tool_call["arguments"])}}
+                    for tool_call in tool_calls
+                ]
+
+                if not body.get("stream"):
+                    message = {"role": "assistant", "content": content or None}
+                    if calls:
+                        message["tool_calls"] = calls
+                    completion["choices"] = [{"index": 0, "message": message, "finish_reason": finish_reason}]
+                    completion["usage"] = {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    }
+                    self._send(200, "application/json", json.dumps(completion).encode())
+                    return
+
+                events = []
+                for start in range(0, len(content), server.chunk_size):
+                    chunk = {**completion, "object": "chat.completion.chunk", "choices": [
+                        {"index": 0, "delta": {"content": content[start:start + server.chunk_size]}, "finish_reason": None}
+                    ]}
+                    events.append(f"data: {json.dumps(chunk)}\n\n")
+                #Like the real API, every tool call arrives as one delta with its index
+                for index, call in enumerate(calls):
+                    chunk = {**completion, "object": "chat.completion.chunk", "choices": [
+                        {"index": 0, "delta": {"tool_calls": [{"index": index, **call}]}, "finish_reason": None}
+                    ]}
+                    events.append(f"data: {json.dumps(chunk)}\n\n")
+                chunk = {**completion, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]}
+                events.append(f"data: {json.dumps(chunk)}\n\n")
+                events.append("data: [DONE]\n\n")
+                self._send(200, "text/event-stream", "".join(events).encode())
+
+        return Handler
@@ -0,0 +1,90 @@
+"""Records the fixtures of the benchmark suite from the Google account of token.json.
+
+The recordings contain real mail and calendar data, keep them out of version control.
+
+Run from the repository root:
+    python -m benchmarks.record_fixtures recordings/ --threads 2000 --days 30 --messages 20
+    python -m benchmarks.suite --fixtures recordings/
+"""
+import argparse
+import datetime as dt
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from utils.google_api_utils import get_service
+
+
+def record_mailbox(service, max_threads: int) -> list[dict]:
+    threads = []
+    page_token = None
+    while len(threads) < max_threads:
+        result = service.users().threads().list(userId="me", maxResults=500, pageToken=page_token).execute()
+        threads.extend(result.get("threads", []))
+        page_token = result.get("nextPageToken")
+        if not page_token:
+            break
+
+    return [
+        service.users().threads().get(userId="me", id=thread["id"], format="metadata").execute()
+        for thread in threads[:max_threads]
+    ]
+
+
+def record_calendar(service, days: int) -> list[dict]:
+    now = dt.datetime.utcnow()
+    events = []
+    page_token = None
+    while True:
+        result = service.events().list(
+            calendarId="primary",
+            timeMin=(now - dt.timedelta(days=days)).isoformat() + "Z",
+            timeMax=(now + dt.timedelta(days=days)).isoformat() + "Z",
+            singleEvents=True,
+            orderBy="startTime",
+            pageToken=page_token,
+        ).execute()
+        events.extend(result.get("items", []))
+        page_token = result.get("nextPageToken")
+        if not page_token:
+            return events
+
+
+def record_messages(service, mailbox: list[dict], count: int) -> dict:
+    #The largest messages are the interesting ones for read_mail
+    messages = [message for thread in mailbox for message in thread.get("messages", [])]
+    messages.sort(key=lambda message: message.get("sizeEstimate", 0), reverse=True)
+    return {
+        message["id"]: service.users().messages().get(userId="me", id=message["id"], format="raw").execute()["raw"]
+        for message in messages[:count]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory", type=str)
+    parser.add_argument("--threads", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=30, help="Days before and after today to record events of")
+    parser.add_argument("--messages", type=int, default=20, help="Number of raw messages to record")
+    args = parser.parse_args()
+
+    gmail = get_service("gmail", "v1")
+    calendar = get_service("calendar", "v3")
+    mailbox = record_mailbox(gmail, args.threads)
+    fixtures = {
+        "mailbox.json": mailbox,
+        "calendar.json": record_calendar(calendar, args.days),
+        "messages.json": record_messages(gmail, mailbox, args.messages),
+    }
+
+    os.makedirs(args.directory, exist_ok=True)
+    for name, data in fixtures.items():
+        with open(os.path.join(args.directory, name), "w") as file:
+            json.dump(data, file)
+        print(f"{name}: {len(data)} entries")
+
+
+if __name__ == "__main__":
+    main()
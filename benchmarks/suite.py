@@ -0,0 +1,385 @@
+"""Offline benchmark suite: replays fixtures through fake Google services and a fake Groq server.
+
+Every scenario runs cold (empty caches, fresh fakes) unless its name says otherwise, and reports
+its latency distribution, the Google API round trips and LLM requests of one run, and the peak
+Python memory. The scenarios cover get_emails, get_appointments, building the email search index,
+the ReAct loop of Agent.invoke end to end over an in-memory MCP session (also with a warm
+completion cache), and every tool of the tool server on its own.
+
+With --check the results are compared with benchmarks/baselines.json and the exit code is 1
+if a scenario got slower, made more round trips or needed more memory than allowed.
+
+Run from the repository root:
+    python -m benchmarks.suite --check
+    python -m benchmarks.suite --update                 # record new baselines
+    python -m benchmarks.suite --fixtures recordings/   # replay fixtures from record_fixtures
+"""
+import argparse
+import asyncio
+import contextlib
+import inspect
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from fastmcp import Client
+
+from agent import Agent
+from utils.cache_utils import CompletionCache
+from utils.completion_utils import AsyncGroqBackend, CachedBackend
+from utils.search_utils import MailSearchIndex
+from utils.session_utils import call_tool
+from utils.tools_utils import get_appointments, get_emails
+from utils.tracing_utils import percentile, tracer
+from benchmarks.fakes import (
+    FakeBackend,
+    FakeCalendarService,
+    FakeCompletionServer,
+    FakeGmailService,
+    generate_calendar,
+    generate_mailbox,
+    generate_mime_message,
+    load_fixture,
+)
+
+BASELINES = os.path.join(ROOT, "benchmarks", "baselines.json")
+
+
+@dataclass
+class Scenario:
+    """
+    A data class to represent one benchmark.
+
+    Attributes:
+        name (str): The name in the report and the baselines.
+        prepare (Callable): Builds the state of one cold run, not timed.
+        execute (Callable): Runs once on that state and returns its counters. May be async.
+        repeat (int | None): Overrides the number of timed runs.
+    """
+
+    name: str
+    prepare: Callable
+    execute: Callable
+    repeat: int | None = None
+
+
+class Fixtures:
+    def __init__(self, directory: str = ""):
+        """The mailbox, calendar and raw messages the fakes replay.
+
+        Args:
+            directory (str): A directory with mailbox.json, calendar.json and messages.json as
+                             written by record_fixtures. Missing files are generated.
+        """
+        def load(name, generate):
+            path = os.path.join(directory, name)
+            return load_fixture(path) if directory and os.path.exists(path) else generate()
+
+        self.mailbox = load("mailbox.json", lambda: generate_mailbox(2000))
+        self.calendar = load("calendar.json", lambda: generate_calendar(3000))
+        self.raw_messages = load("messages.json", lambda: {
+            "large": generate_mime_message(body_kib=256, attachment_kib=2048, seed=1),
+            **{f"small{i}": generate_mime_message(body_kib=2, seed=i) for i in range(5)},
+        })
+        #The largest message is the one read_mail is benchmarked with
+        self.large_message_id = max(self.raw_messages, key=lambda message_id: len(self.raw_messages[message_id]))
+
+    def gmail(self) -> FakeGmailService:
+        return FakeGmailService(self.mailbox, raw_messages=self.raw_messages)
+
+    def calendar_service(self) -> FakeCalendarService:
+        return FakeCalendarService(self.calendar)
+
+
+def scripted_completion(messages: list) -> str:
+    #Plays a model which asks for the calendar and the inbox, then answers from the observation
+    last = str(messages[-1]["content"])
+    if "morning briefing" in last:
+        return "Good morning! " + "Here is what your day looks like. " * 20
+    if "<observation>" in last:
+        return "<thought>I have everything I need.</thought><response>You have a busy week and new emails.</response>"
+    return (
+        "<thought>I need the calendar and the inbox.</thought>"
+        '<tool_call>{"name": "get_upcoming_appointments", "arguments": {"days_into_the_future": 7}, "id": 0}</tool_call>'
+        '<tool_call>{"name": "display_recent_emails", "arguments": {"days_into_the_past": 3}, "id": 1}</tool_call>'
+    )
+
+
+class ToolServerHarness:
+    def __init__(self, fixtures: Fixtures):
+        """Runs the real tool server against fresh fakes for every run.
+
+        get_service, the shared store and the search index of the tool server are pointed at the
+        fakes and a temporary directory, everything else is the production code.
+        """
+        from utils.cache_utils import FileStore
+        from src.mcp_server import tool_server
+        from src.utils import completion_utils
+
+        self.fixtures = fixtures
+        self.tool_server = tool_server
+        self.services = {}
+        tool_server.setup_server()
+        tool_server.get_service = lambda api_name, version, identity="default": self.services[api_name]
+        directory = tempfile.mkdtemp(prefix="agent-assistant-bench-")
+        tool_server.shared_store = FileStore(directory)
+        tool_server.search_index = MailSearchIndex(os.path.join(directory, "search.sqlite3"))
+        #The briefing completion must not be answered from the cache file of the real server
+        self.completion_cache = completion_utils._completion_cache = CompletionCache()
+
+    def reset(self) -> None:
+        self.services = {"gmail": self.fixtures.gmail(), "calendar": self.fixtures.calendar_service()}
+        self.tool_server.read_cache.clear()
+        self.tool_server.message_cache.clear()
+        self.tool_server.shared_store.delete("briefing")
+        self.completion_cache.clear()
+
+    @property
+    def round_trips(self) -> int:
+        return sum(service.round_trips for service in self.services.values())
+
+    @property
+    def bytes_received(self) -> int:
+        return sum(service.backend.bytes_received for service in self.services.values())
+
+
+def counters(backend) -> dict:
+    return {"round_trips": backend.round_trips, "bytes_received": backend.bytes_received}
+
+
+def build_scenarios(fixtures: Fixtures, harness: ToolServerHarness, server: FakeCompletionServer, session, tools: list) -> list[Scenario]:
+    scenarios = [
+        Scenario(
+            "get_emails",
+            fixtures.gmail,
+            lambda gmail: (get_emails(3, gmail), counters(gmail.backend))[1],
+        ),
+        Scenario(
+            "get_appointments",
+            fixtures.calendar_service,
+            lambda calendar: (get_appointments(7, calendar), counters(calendar.backend))[1],
+        ),
+        Scenario(
+            "search_index",
+            lambda: (fixtures.gmail(), MailSearchIndex(os.path.join(tempfile.mkdtemp(prefix="agent-assistant-bench-"), "search.sqlite3"))),
+            lambda state: (state[1].update(state[0]), counters(state[0].backend))[1],
+            repeat=5,
+        ),
+    ]
+
+    backend = AsyncGroqBackend(api_key="offline")
+
+    def prepare_agent():
+        harness.reset()
+        agent = Agent(backend=backend)
+        agent.bind_tools(tools)
+        return agent, server.requests
+
+    async def run_agent(state):
+        agent, requests_before = state
+        await agent.invoke("What does my week look like?", session)
+        return {"round_trips": harness.round_trips, "bytes_received": harness.bytes_received, "llm_calls": server.requests - requests_before}
+
+    scenarios.append(Scenario("react_loop", prepare_agent, run_agent))
+
+    #The same question again: the completions come from the cache, the tools still run
+    cached_backend = CachedBackend(backend, CompletionCache())
+
+    def prepare_cached_agent():
+        harness.reset()
+        agent = Agent(backend=cached_backend)
+        agent.bind_tools(tools)
+        return agent, server.requests
+
+    scenarios.append(Scenario("react_loop_cached", prepare_cached_agent, run_agent))
+
+    event_ids = [event["id"] for event in fixtures.calendar[:20]]
+    tool_calls = {
+        "get_upcoming_appointments": {"days_into_the_future": 7},
+        "delete_upcoming_appointments": {"appointment_ids": event_ids},
+        "create_upcoming_appointment": {
+            "appointment_name": "Benchmark",
+            "appointment_start_date": "2025-04-24T14:00:00+02:00",
+            "appointment_end_date": "2025-04-24T15:00:00+02:00",
+        },
+        "update_upcoming_appointment": {"appointment_id": event_ids[0], "new_appointment_name": "Renamed"},
+        "display_recent_emails": {"days_into_the_past": 3},
+        "read_mail": {"thread_id": fixtures.large_message_id},
+        "search_emails": {"query": "invoice from the dentist"},
+        "send_mail": {"message_text": "Hello", "to": "friend@example.com", "subject": "Benchmark"},
+        "create_morning_briefing": {},
+    }
+
+    def prepare_tool():
+        #In production the search index is kept current in the background, the tool only searches it
+        if not harness.tool_server.search_index.is_ready():
+            harness.reset()
+            harness.tool_server.update_search_index()
+        harness.reset()
+        return server.requests
+
+    def tool_runner(name, arguments):
+        async def run_tool(requests_before):
+            result = await call_tool(session, name, arguments)
+            if result.isError:
+                raise RuntimeError(f"{name} failed: {result.content[0].text}")
+            return {"round_trips": harness.round_trips, "bytes_received": harness.bytes_received, "llm_calls": server.requests - requests_before}
+        return run_tool
+
+    for name, arguments in tool_calls.items():
+        scenarios.append(Scenario(f"tool.{name}", prepare_tool, tool_runner(name, arguments)))
+
+    return scenarios
+
+
+async def measure(scenario: Scenario, repeat: int) -> dict:
+    async def run_once():
+        state = scenario.prepare()
+        #The agent and the tools print their progress, which would bury the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            counters = scenario.execute(state)
+            if inspect.isawaitable(counters):
+                counters = await counters
+            return time.perf_counter() - start, counters
+
+    #The first run warms up imports and connections and is not reported
+    await run_once()
+
+    latencies = []
+    for _ in range(scenario.repeat or repeat):
+        elapsed, _ = await run_once()
+        latencies.append(elapsed * 1000)
+    latencies.sort()
+
+    FakeBackend.count_bytes = True
+    try:
+        _, counters = await run_once()
+    finally:
+        FakeBackend.count_bytes = False
+
+    tracemalloc.start()
+    try:
+        await run_once()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "round_trips": counters.get("round_trips", 0),
+        "received_kib": round(counters.get("bytes_received", 0) / 1024, 1),
+        "llm_calls": counters.get("llm_calls", 0),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+async def run_suite(fixtures: Fixtures, repeat: int, only: str) -> dict:
+    #Spans would end up in the trace file of the real agent
+    tracer.exporter = None
+
+    with FakeCompletionServer(scripted_completion) as server:
+        os.environ["GROQ_BASE_URL"] = server.base_url
+        os.environ.setdefault("groq_api_key", "offline")
+
+        harness = ToolServerHarness(fixtures)
+        harness.tool_server.tool_executor.reset()
+
+        async with Client(harness.tool_server.mcp) as client:
+            tools = (await client.session.list_tools()).tools
+            scenarios = build_scenarios(fixtures, harness, server, client.session, tools)
+
+            results = {}
+            for scenario in scenarios:
+                if only and only not in scenario.name:
+                    continue
+                results[scenario.name] = await measure(scenario, repeat)
+                print(format_row(scenario.name, results[scenario.name]), flush=True)
+            return results
+
+
+def format_row(name: str, result: dict) -> str:
+    return (
+        f"{name:<38}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+        f"{result['round_trips']:>8}{result['received_kib']:>12.1f}{result['llm_calls']:>6}{result['peak_kib']:>12.1f}"
+    )
+
+
+def find_regressions(results: dict, baselines: dict, latency_tolerance: float, memory_tolerance: float) -> list[str]:
+    """
+    Compares the results with the stored baselines.
+
+    Round trips, received bytes and LLM requests are deterministic and may not grow at all.
+    Latency and memory may exceed the baseline by their tolerance factor plus a small
+    absolute slack for noise.
+
+    Args:
+        results (dict): The results of this run keyed by scenario.
+        baselines (dict): The stored results keyed by scenario.
+        latency_tolerance (float): The allowed factor on the baseline p50 latency.
+        memory_tolerance (float): The allowed factor on the baseline peak memory.
+
+    Returns:
+        list[str]: A description of every regression.
+    """
+    regressions = []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            continue
+
+        for counter in ("round_trips", "received_kib", "llm_calls"):
+            if counter in baseline and result[counter] > baseline[counter]:
+                regressions.append(f"{name}: {counter} {baseline[counter]} -> {result[counter]}")
+        if result["p50_ms"] > baseline["p50_ms"] * latency_tolerance + 2.0:
+            regressions.append(f"{name}: p50 {baseline['p50_ms']:.2f} ms -> {result['p50_ms']:.2f} ms")
+        if result["peak_kib"] > baseline["peak_kib"] * memory_tolerance + 256:
+            regressions.append(f"{name}: peak memory {baseline['peak_kib']:.0f} KiB -> {result['peak_kib']:.0f} KiB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per scenario")
+    parser.add_argument("--only", type=str, default="", help="Only run scenarios whose name contains this")
+    parser.add_argument("--fixtures", type=str, default="", help="Directory with recorded fixtures")
+    parser.add_argument("--check", action="store_true", help="Exit with 1 on a regression against the baselines")
+    parser.add_argument("--update", action="store_true", help="Store the results as the new baselines")
+    parser.add_argument("--latency-tolerance", type=float, default=2.0)
+    parser.add_argument("--memory-tolerance", type=float, default=1.25)
+    args = parser.parse_args()
+
+    print(f"{'scenario':<38}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'trips':>8}{'recv KiB':>12}{'llm':>6}{'peak KiB':>12}")
+    results = asyncio.run(run_suite(Fixtures(args.fixtures), args.repeat, args.only))
+
+    baselines = load_fixture(BASELINES) if os.path.exists(BASELINES) else {}
+    if args.update:
+        baselines.update(results)
+        with open(BASELINES, "w") as file:
+            json.dump(dict(sorted(baselines.items())), file, indent=2)
+            file.write("\n")
+        print(f"\nStored the baselines of {len(results)} scenarios in {os.path.relpath(BASELINES, ROOT)}")
+
+    if args.check:
+        regressions = find_regressions(results, baselines, args.latency_tolerance, args.memory_tolerance)
+        if regressions:
+            print("\nRegressions against the baselines:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against the baselines.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,20 @@
-from typing import Union
+from typing import AsyncIterator, Union
+from dataclasses import dataclass, field
+from functools import lru_cache
 from colorama import Fore
+from mcp.types import Tool
+from mcp.shared.exceptions import McpError
+import asyncio
+import time
 import json
-import os
-
-from groq import Groq
 
 from utils.tools_utils import get_fn_signature
-from utils.completion_utils import build_prompt_structure, ChatHistory
-from utils.extraction_utils import extract_tag_content
+from utils.completion_utils import build_prompt_structure, approximate_token_count, ContextWindow, CompletionBackend, CompletionResult, ToolCall, get_default_backend
+from utils.extraction_utils import extract_tags, TagStreamParser
+from utils.retrieval_utils import ToolRetriever, Embedder
+from utils.session_utils import call_tool
+from utils.config_loader import config
+from utils.tracing_utils import tracer, Span
 
 BASE_SYSTEM_PROMPT = ""
 
@@ -79,28 +86,220 @@ If no tool is suitable for the question, respond freely within <response></respo
 Please make sure NOT to include <response></response>-tags when you make an tool_call!!
 """
 
+#With native function calling the tools travel as schemas in the request, so the prompt needs neither the catalog nor the tag format
+NATIVE_SYSTEM_PROMPT = """
+You are an agent designed solve complex tasks by utilizing the provided tools and your own knowledge.
+
+Only call tools when they are needed, and only with values grounded in the user query or prior tool results.
+Tools which do not depend on each other can be called at once. When you have everything you need,
+answer the user directly.
+"""
+
+#Shown next to the selected tools when an agent only sees the tools which match the question,
+#so the model can still reach every tool of the server
+FIND_TOOLS = Tool(
+    name="find_tools",
+    description=(
+        "Finds further tools when none of the listed tools fits. With a query it returns the signatures "
+        "of the matching tools, which can be called afterwards. Without a query it lists the names and "
+        "descriptions of all tools."
+    ),
+    inputSchema={
+        "type": "object",
+        "properties": {"query": {"type": "string", "description": "What the tool should do, e.g. 'delete an appointment'."}},
+    },
+)
+
+@lru_cache(maxsize=32)
+def compile_system_prompt(base_prompt: str, tool_signatures: str) -> str:
+    """
+    Renders the system prompt for a base prompt and a tool catalog.
+
+    Args:
+        base_prompt (str): The system prompt of the agent.
+        tool_signatures (str): The rendered signatures of the bound tools, empty if there are none.
+
+    Returns:
+        str: The complete system prompt.
+    """
+    if not tool_signatures:
+        return base_prompt
+    return base_prompt + "\n" + REACT_SYSTEM_PROMPT % tool_signatures
+
+def latest_user_message(message: Union[str, list]) -> str:
+    """
+    Returns the text of the latest user message of a request.
+
+    Args:
+        message (str | list): The user request, or the chat history as a list of role/content dicts.
+
+    Returns:
+        str: The request itself, or the content of the last user entry of the chat history.
+    """
+    if isinstance(message, list):
+        for entry in reversed(message):
+            if isinstance(entry, dict) and entry.get("role") == "user":
+                return str(entry.get("content") or "")
+    return str(message)
+
+@dataclass
+class AgentEvent:
+    """
+    A data class to represent an event yielded by Agent.invoke_stream.
+
+    Attributes:
+        type (str): One of 'thought_delta', 'tool_call_start', 'tool_call_end', 'observation' or 'response_delta'.
+        content (str): The new text for delta events, the observation text otherwise.
+        data (dict): The tool call id, name and arguments for tool call events.
+    """
+
+    type: str
+    content: str = ""
+    data: dict = field(default_factory=dict)
+
+class SpeculativeDispatch:
+
+    def __init__(self, agent: "Agent", session, parent: Span | None = None):
+        """The tool calls of one turn which were started while their completion was still streaming.
+
+        Only calls of the agent's speculative tools are started early. Once the completion is
+        complete, every tool call of the turn claims the early call with the same name and
+        arguments. Calls nothing claims, e.g. because the turn answered instead of calling tools,
+        are cancelled and their results never reach the model.
+
+        Args:
+            agent (Agent): The agent whose tools are called.
+            session (ClientSession): The MCP session used to call the tools.
+            parent (Span | None): The span of the turn.
+        """
+        self.agent = agent
+        self.session = session
+        self.parent = parent
+        #Shared with the calls dispatched after the completion, so the turn keeps its concurrency limit
+        self.semaphore = asyncio.Semaphore(agent.max_concurrent_tool_calls)
+        self.completed_at = None
+        self.started = 0
+        self.claimed = 0
+        self.overlap_seconds = 0.0
+        self._calls = {}
+
+    @staticmethod
+    def _key(name: str, arguments: dict) -> tuple[str, str]:
+        return name, json.dumps(arguments, sort_keys=True, default=str)
+
+    def start(self, name: str, arguments: dict) -> None:
+        key = self._key(name, arguments)
+        if name not in self.agent.speculative_tools or name not in (self.agent.tools_dict or {}) or key in self._calls:
+            return
+        tool_call = self.agent._format_tool({"name": name, "arguments": arguments})
+        call = {"task": None, "started_at": time.perf_counter(), "finished_at": None}
+        call["task"] = asyncio.create_task(self.agent._call_tool(tool_call, self.session, self.semaphore, self.parent))
+        call["task"].add_done_callback(lambda _: call.update(finished_at=time.perf_counter()))
+        self._calls[key] = call
+        self.started += 1
+
+    def start_tagged(self, tool_call_str: str) -> None:
+        #A <tool_call> which does not parse is left to the turn, which answers it with an error observation
+        try:
+            tool_call = json.loads(tool_call_str)
+            self.start(tool_call["name"], tool_call.get("arguments") or {})
+        except (json.JSONDecodeError, KeyError, TypeError):
+            pass
+
+    def complete(self) -> None:
+        self.completed_at = time.perf_counter()
+
+    def claim(self, name: str, arguments: dict) -> asyncio.Task | None:
+        """Returns the early call of the tool call, or None if it was not started early."""
+        call = self._calls.pop(self._key(name, arguments), None)
+        if call is None:
+            return None
+        #The part of the call which ran while the completion was still being written
+        completed_at = self.completed_at or time.perf_counter()
+        self.overlap_seconds += max(0.0, min(call["finished_at"] or completed_at, completed_at) - call["started_at"])
+        self.claimed += 1
+        return call["task"]
+
+    def cancel(self) -> int:
+        """Cancels the calls nothing claimed and returns their number."""
+        for call in self._calls.values():
+            if call["task"].done() and not call["task"].cancelled():
+                #Retrieved so a failed call which is discarded is not reported as unhandled
+                call["task"].exception()
+            call["task"].cancel()
+        discarded = len(self._calls)
+        self._calls = {}
+        return discarded
+
 #Additional agent wrapper class for multi agentic workflows
 #Makes creating more agents easier
 class Agent:
 
-    def __init__(self, model: str = "llama3-70b-8192", system_prompt: str = BASE_SYSTEM_PROMPT,):
+    def __init__(
+        self,
+        model: str = "llama3-70b-8192",
+        system_prompt: str = BASE_SYSTEM_PROMPT,
+        max_concurrent_tool_calls: int = 4,
+        tool_call_timeout: float = 30.0,
+        backend: CompletionBackend | None = None,
+        context_token_budget: int | None = 6000,
+        tool_mode: str = "xml",
+        tool_top_k: int | None = None,
+        tool_embedder: Embedder | None = None,
+        speculative_tools: list[str] | None = None,
+        write_tools: list[str] | None = None,
+    ):
+        if tool_mode not in ("xml", "native"):
+            raise ValueError(f"Unknown tool mode: {tool_mode}")
+        #A write tool called before its turn is validated could send a mail the model never meant to send
+        write_tools = config.get_completion_cache_write_tools() if write_tools is None else write_tools
+        unsafe = sorted(set(speculative_tools or ()) & set(write_tools))
+        if unsafe:
+            raise ValueError(f"Tools with side effects cannot be called speculatively: {', '.join(unsafe)}")
         self.tools = None
         self.tools_dict = None
+        self.tool_signatures = ""
+        self.tool_schemas = {}
+        #With more bound tools than tool_top_k, every question only sees the tool_top_k best matching ones
+        self.tool_top_k = tool_top_k
+        self.tool_embedder = tool_embedder
+        self.tool_retriever = None
+        #Side-effect-free tools which may be called before their completion finished streaming
+        self.speculative_tools = frozenset(speculative_tools or ())
+        #"xml" renders the tools into the ReAct prompt, "native" passes them as tools= to the completion API
+        self.tool_mode = tool_mode
         self.model = model
-        self.client = Groq(api_key=os.environ.get("groq_api_key"))
+        self.backend = backend or get_default_backend()
         self.system_prompt = system_prompt
         self.context = ""
-
-    def _model(self, history: list, verbose: int = 0, log_title: str = "COMPLETION", log_color: str = ""):
-        chat_completion = self.client.chat.completions.create(
-            messages=history,
-            model=self.model,
-        )
+        self.max_concurrent_tool_calls = max_concurrent_tool_calls
+        self.tool_call_timeout = tool_call_timeout
+        self.context_token_budget = context_token_budget
+
+    async def _complete(self, history: list, verbose: int = 0, log_title: str = "COMPLETION", log_color: str = "", **options) -> CompletionResult:
+        with tracer.span("llm.complete", "llm", model=self.model) as span:
+            chat_completion = await self.backend.complete(list(history), self.model, **options)
+            span.set(
+                prompt_tokens=chat_completion.prompt_tokens,
+                completion_tokens=chat_completion.completion_tokens,
+                cached=chat_completion.cached,
+                tool_calls=len(chat_completion.tool_calls),
+            )
 
         if verbose > 0:
             print(log_color, f"\n\n{log_title}\n\n", chat_completion)
 
-        return str(chat_completion.choices[0].message.content)
+        return chat_completion
+
+    async def _model(self, history: list, verbose: int = 0, log_title: str = "COMPLETION", log_color: str = ""):
+        return (await self._complete(history, verbose, log_title, log_color)).content
+
+    def _tool_options(self, tools: list, final: bool = False) -> dict:
+        #The request parameters of a native completion. The final one may not call tools anymore,
+        #but the schemas stay in the request so the earlier tool calls in the history remain valid
+        if self.tool_mode != "native" or not tools:
+            return {}
+        return {"tools": [self.tool_schemas[tool.name] for tool in tools], "tool_choice": "none" if final else "auto"}
 
     def bind_tools(self, tools: Union[str, list[str]]):
         if tools:
@@ -108,9 +307,51 @@ class Agent:
             self.tools_dict = {
                 tool.name: tool for tool in self.tools
             }
+            #The rendered prompt is cached per (base prompt, tool signatures),
+            #so rebinding an identical tool list reuses the compiled prompt
+            self.tool_signatures = self._get_tool_signatures()
+            for tool in self.tools:
+                #Tools the server does not declare read-only are never called speculatively
+                if tool.name in self.speculative_tools and not (tool.annotations and tool.annotations.readOnlyHint):
+                    raise ValueError(f"The tool {tool.name} is not read-only and cannot be called speculatively")
+            self.tool_retriever = None
+            if self.tool_top_k and len(self.tools) > self.tool_top_k:
+                self.tool_retriever = ToolRetriever(self.tools, self.tool_embedder)
+                self.tools_dict[FIND_TOOLS.name] = FIND_TOOLS
+            self.tool_schemas = {
+                tool.name: {
+                    "type": "function",
+                    "function": {"name": tool.name, "description": tool.description or "", "parameters": tool.inputSchema},
+                }
+                for tool in self.tools_dict.values()
+            }
 
-    def _get_tool_signatures(self) -> str:
-        return "".join([get_fn_signature(tool) for tool in self.tools])
+    def _get_tool_signatures(self, tools: list | None = None) -> str:
+        return "".join([get_fn_signature(tool) for tool in (self.tools if tools is None else tools)])
+
+    def _select_tools(self, message: Union[str, list], parent: Span | None = None) -> list:
+        #The tools shown to the model for one question, all of them unless there are more than tool_top_k
+        if self.tool_retriever is None:
+            return self.tools or []
+        with tracer.span("agent.select_tools", "retrieval", parent=parent, tools=len(self.tools)) as span:
+            #The client passes the whole chat history, earlier topics must not steer the ranking
+            selected = self.tool_retriever.select(latest_user_message(message), self.tool_top_k)
+            span.set(selected=[tool.name for tool in selected])
+        return selected + [FIND_TOOLS]
+
+    def _find_tools(self, query: str) -> str:
+        if not query:
+            return "\n".join(f"{tool.name}: {(tool.description or '').strip().split(chr(10))[0]}" for tool in self.tools)
+        found = self.tool_retriever.select(query, self.tool_top_k)
+        return self._get_tool_signatures(found) if found else f"No tool matches '{query}'."
+
+    def _add_found_tools(self, tools: list, tool_calls: list[dict]) -> list:
+        #Tools found with find_tools are offered as native tools in the following completions
+        tools = list(tools)
+        for tool_call in tool_calls:
+            if tool_call["name"] == FIND_TOOLS.name and tool_call["arguments"].get("query"):
+                tools += [tool for tool in self.tool_retriever.select(tool_call["arguments"]["query"], self.tool_top_k) if tool not in tools]
+        return tools
     
     def _format_tool(self, tool: str) -> dict:
         formatted_tool = {
@@ -123,56 +364,357 @@ class Agent:
         }
         return formatted_tool
     
-    async def process_tool_call(self, tool_calls_content: list, session):
-        for tool_call_str in tool_calls_content:
-            tool_call = json.loads(tool_call_str)
-            tool_call = self._format_tool(tool_call)
-            tool_name = tool_call["function"]["name"]
-
-            print(Fore.LIGHTYELLOW_EX + f"\Agent using tool: {tool_name} with arguments: {tool_call["function"]["parameters"]}")
-
-            observation = await session.call_tool(
-                tool_call["function"]["name"],
-                arguments=tool_call["function"]["parameters"],
-            )
-            
+    async def _call_tool(self, tool_call: dict, session, semaphore: asyncio.Semaphore, parent: Span | None = None) -> str:
+        tool_name = tool_call["function"]["name"]
+        arguments = tool_call["function"]["parameters"]
+
+        if tool_name == FIND_TOOLS.name and self.tool_retriever is not None:
+            return self._find_tools(str(arguments.get("query") or ""))
+
+        async with semaphore:
+            print(Fore.LIGHTYELLOW_EX + f"\nAgent using tool: {tool_name} with arguments: {arguments}")
+            #The tool server continues the trace from the traceparent of this span
+            with tracer.span("mcp.call_tool", "mcp", parent=parent, tool=tool_name) as span:
+                try:
+                    observation = await asyncio.wait_for(
+                        call_tool(session, tool_name, arguments, traceparent=span.traceparent),
+                        timeout=self.tool_call_timeout,
+                    )
+                except asyncio.TimeoutError:
+                    span.set(timed_out=True)
+                    return f"The tool {tool_name} did not answer within {self.tool_call_timeout} seconds."
+                except McpError as error:
+                    #An error of the tool becomes its observation, so the other tool calls of the turn are kept.
+                    #Connection errors are raised, so the session manager can reconnect and retry
+                    span.set(error=str(error))
+                    return f"The tool {tool_name} failed: {error}"
+
+        #A tool which returns None, e.g. send_mail after an HttpError, has no content
+        if not observation.content:
+            return f"The tool {tool_name} returned no result."
         return observation.content[0].text
-    
-    async def invoke(self, message: str, session, max_iterations: int = 10):
-        user_prompt = build_prompt_structure(message, 'user', tag="question")
 
-        if self.tools:
-            self.system_prompt += (
-                "\n" + REACT_SYSTEM_PROMPT % self._get_tool_signatures()
-            )
+    @staticmethod
+    def _parse_tool_calls(tool_calls_content: list) -> list[dict]:
+        #A <tool_call> which is not a JSON object with a name is answered with an error observation
+        tool_calls = []
+        for i, tool_call_str in enumerate(tool_calls_content):
+            try:
+                tool_call = json.loads(tool_call_str)
+            except json.JSONDecodeError as error:
+                tool_call = {"id": i, "error": f"The tool call is not valid JSON: {error}"}
+            else:
+                if not isinstance(tool_call, dict) or not isinstance(tool_call.get("name"), str):
+                    tool_call = {"id": i, "error": f"The tool call {tool_call_str} has no tool name."}
+            tool_call.setdefault("id", i)
+            tool_call.setdefault("name", "")
+            if not isinstance(tool_call.get("arguments"), dict):
+                tool_call["arguments"] = {}
+            tool_calls.append(tool_call)
+        return tool_calls
+
+    @staticmethod
+    async def _tool_error(message: str) -> str:
+        return message
+
+    def _dispatch_tool_calls(self, tool_calls: list[dict], session, parent: Span | None = None, speculation: SpeculativeDispatch | None = None) -> list[asyncio.Task]:
+        semaphore = speculation.semaphore if speculation is not None else asyncio.Semaphore(self.max_concurrent_tool_calls)
+        tasks = []
+        for tool_call in tool_calls:
+            if "error" in tool_call:
+                tasks.append(asyncio.create_task(self._tool_error(tool_call["error"])))
+                continue
+            if tool_call["name"] not in (self.tools_dict or {}):
+                tasks.append(asyncio.create_task(self._tool_error(f"The tool {tool_call['name']} does not exist.")))
+                continue
+            task = speculation.claim(tool_call["name"], tool_call["arguments"]) if speculation is not None else None
+            tasks.append(task or asyncio.create_task(self._call_tool(self._format_tool(tool_call), session, semaphore, parent)))
+        return tasks
+
+    async def process_tool_call(self, tool_calls_content: list, session) -> dict:
+        """Dispatches all tool calls of one completion concurrently.
+
+        Args:
+            tool_calls_content (list): The JSON strings found inside the <tool_call> tags.
+            session (ClientSession): The MCP session used to call the tools.
+
+        Returns:
+            dict: The observations keyed by the id of their tool call.
+        """
+        tool_calls = self._parse_tool_calls(tool_calls_content)
+        observations = await asyncio.gather(*self._dispatch_tool_calls(tool_calls, session))
+
+        return {
+            tool_call.get("id", i): observation
+            for i, (tool_call, observation) in enumerate(zip(tool_calls, observations))
+        }
 
-        chat_history = ChatHistory(
+    @staticmethod
+    def _tool_messages(completion: CompletionResult, observations: list[str]) -> list[dict]:
+        #The assistant message with the native tool calls, followed by one tool message per result
+        messages = [{
+            "role": "assistant",
+            "content": completion.content,
+            "tool_calls": [tool_call.to_message() for tool_call in completion.tool_calls],
+        }]
+        for tool_call, observation in zip(completion.tool_calls, observations):
+            messages.append({"role": "tool", "tool_call_id": tool_call.id, "content": observation})
+        return messages
+
+    def _build_chat_history(self, message: str, tools: list | None = None) -> ContextWindow:
+        user_prompt = build_prompt_structure(message, 'user', tag="question")
+        if self.tool_mode == "native":
+            system_prompt = self.system_prompt + "\n" + NATIVE_SYSTEM_PROMPT if self.tools else self.system_prompt
+        elif self.tool_retriever is not None:
+            system_prompt = compile_system_prompt(self.system_prompt, self._get_tool_signatures(tools or []))
+        else:
+            system_prompt = compile_system_prompt(self.system_prompt, self.tool_signatures)
+
+        #The tool schemas of a native request are part of the prompt as well, so they are taken off the budget
+        token_budget = self.context_token_budget
+        schemas = self._tool_options(tools or []).get("tools")
+        if token_budget is not None and schemas:
+            token_budget -= approximate_token_count(json.dumps(schemas))
+
+        #The system prompt and the question stay pinned, old observations get summarized or evicted
+        return ContextWindow(
             [
-                build_prompt_structure(self.system_prompt, role='system'),
+                build_prompt_structure(system_prompt, role='system'),
                 user_prompt
-            ]
+            ],
+            token_budget=token_budget,
+            pinned=2,
         )
 
-        if self.tools:            
-            for _ in range(max_iterations):
-                completion = self._model(chat_history)
-                response = extract_tag_content(str(completion), "response")
-
-                if response.found:
-                    return response.content[0]
-                
-                thought = extract_tag_content(str(completion), "thought")
-                tool_calls = extract_tag_content(str(completion), "tool_call")
-                chat_history.append(
-                    build_prompt_structure(completion, "assistant")
-                )
-
-                print(Fore.MAGENTA + f"\n Agent thought: {thought.content}")
-
-                if tool_calls.found:
-                    observations =  await self.process_tool_call(tool_calls.content, session)
-                    print(Fore.BLUE + f"\n Agent observations: {observations}")
+    async def invoke(self, message: str, session, max_iterations: int = 10):
+        if self.speculative_tools:
+            #Tool calls can only start early while the completion streams
+            answer = [event.content async for event in self.invoke_stream(message, session, max_iterations) if event.type == "response_delta"]
+            return "".join(answer).strip()
+        if self.tool_mode == "native":
+            return await self._invoke_native(message, session, max_iterations)
+
+        with tracer.span("agent.invoke", "agent", model=self.model):
+            chat_history = self._build_chat_history(message, self._select_tools(message))
+
+            if self.tools:
+                for iteration in range(max_iterations):
+                    with tracer.span("agent.iteration", "iteration", index=iteration):
+                        completion = await self._model(chat_history)
+                        with tracer.span("agent.parse_tags", "parse"):
+                            tags = extract_tags(str(completion))
+                        response = tags["response"]
+
+                        if response.found:
+                            return response.content[0]
+
+                        thought = tags["thought"]
+                        tool_calls = tags["tool_call"]
+                        chat_history.append(
+                            build_prompt_structure(completion, "assistant")
+                        )
+
+                        print(Fore.MAGENTA + f"\n Agent thought: {thought.content}")
+
+                        if tool_calls.found:
+                            observations =  await self.process_tool_call(tool_calls.content, session)
+                            print(Fore.BLUE + f"\n Agent observations: {observations}")
+                            chat_history.append(
+                                build_prompt_structure(f"{observations}", "user", tag="observation")
+                            )
+            return await self._model(chat_history)
+
+    async def _invoke_native(self, message: str, session, max_iterations: int) -> str:
+        #The loop of invoke with structured tool calls, nothing has to be parsed from the completion
+        with tracer.span("agent.invoke", "agent", model=self.model, tool_mode="native"):
+            tools = self._select_tools(message)
+            chat_history = self._build_chat_history(message, tools)
+
+            if self.tools:
+                for iteration in range(max_iterations):
+                    with tracer.span("agent.iteration", "iteration", index=iteration):
+                        completion = await self._complete(chat_history, **self._tool_options(tools))
+                        if not completion.tool_calls:
+                            return completion.content
+
+                        tool_calls = [{"id": call.id, "name": call.name, "arguments": call.arguments} for call in completion.tool_calls]
+                        observations = await asyncio.gather(*self._dispatch_tool_calls(tool_calls, session))
+                        print(Fore.BLUE + f"\n Agent observations: {observations}")
+                        for tool_message in self._tool_messages(completion, observations):
+                            chat_history.append(tool_message)
+                        tools = self._add_found_tools(tools, tool_calls)
+            return (await self._complete(chat_history, **self._tool_options(tools, final=True))).content
+
+    async def _run_tool_calls(self, tool_calls: list[dict], session, parent: Span, speculation: SpeculativeDispatch | None = None) -> AsyncIterator[AgentEvent]:
+        #Runs the tool calls concurrently and reports them as they start and end, the last event is the observation
+        tasks = self._dispatch_tool_calls(tool_calls, session, parent=parent, speculation=speculation)
+        pending = {}
+
+        for i, (tool_call, task) in enumerate(zip(tool_calls, tasks)):
+            pending[task] = {"id": tool_call.get("id", i), "name": tool_call["name"], "arguments": tool_call["arguments"]}
+            yield AgentEvent("tool_call_start", data=pending[task])
+
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield AgentEvent("tool_call_end", task.result(), data=pending.pop(task))
+        finally:
+            #A caller which stops listening also stops the tool calls
+            for task in pending:
+                task.cancel()
+
+        observations = {
+            tool_call.get("id", i): task.result()
+            for i, (tool_call, task) in enumerate(zip(tool_calls, tasks))
+        }
+        data = {"results": [task.result() for task in tasks]}
+        if speculation is not None:
+            data["speculative_overlap_ms"] = speculation.overlap_seconds * 1000
+        yield AgentEvent("observation", f"{observations}", data=data)
+
+    async def _stream_completion(
+        self,
+        history: list,
+        tags: dict,
+        final: bool = False,
+        parent: Span | None = None,
+        options: dict | None = None,
+        speculation: SpeculativeDispatch | None = None,
+    ) -> AsyncIterator[AgentEvent]:
+        #Streams one completion, translating the content of the tags into events as it arrives.
+        #The closed tags are collected in the tags dict, the raw completion under the key None.
+        #In the final completion text outside of any tag is part of the answer as well.
+        #Native tool calls are collected under the key "tool_calls", the text around them is not tagged,
+        #so it is held back until the completion shows whether it is the answer or a thought.
+        #With a speculation, side-effect-free tool calls start as soon as they are complete.
+        parser = TagStreamParser()
+        chunks = []
+        parse_seconds = 0.0
+
+        def to_agent_events(tag_events: list) -> list[AgentEvent]:
+            events = []
+            for event in tag_events:
+                if event.kind == "close":
+                    tags.setdefault(event.tag, []).append(event.text)
+                    if event.tag == "tool_call" and speculation is not None:
+                        speculation.start_tagged(event.text)
+                elif event.kind == "delta" and event.tag == "thought":
+                    events.append(AgentEvent("thought_delta", event.text))
+                elif event.kind == "delta" and (event.tag == "response" or (final and event.tag is None)):
+                    events.append(AgentEvent("response_delta", event.text))
+            return events
+
+        #The span stays open across yields, so it is not made the current span
+        span = tracer.start("llm.stream", "llm", parent=parent, model=self.model, prompt_tokens=history.total_tokens)
+        try:
+            async for chunk in self.backend.stream(list(history), self.model, **(options or {})):
+                if not chunks:
+                    span.set(first_token_ms=(time.time_ns() - span.start_ns) / 1e6)
+                if isinstance(chunk, ToolCall):
+                    tags.setdefault("tool_calls", []).append(chunk)
+                    if speculation is not None:
+                        speculation.start(chunk.name, chunk.arguments)
+                    continue
+                if self.tool_mode == "native":
+                    chunks.append(chunk)
+                    if final:
+                        yield AgentEvent("response_delta", chunk)
+                    continue
+                chunks.append(chunk)
+                parse_started = time.perf_counter()
+                tag_events = parser.feed(chunk)
+                parse_seconds += time.perf_counter() - parse_started
+                for event in to_agent_events(tag_events):
+                    yield event
+
+            if self.tool_mode != "native":
+                for event in to_agent_events(parser.close()):
+                    yield event
+            elif not final and chunks:
+                #Text next to tool calls, e.g. "Let me check your calendar", is not part of the answer
+                yield AgentEvent("thought_delta" if "tool_calls" in tags else "response_delta", "".join(chunks))
+            tags[None] = "".join(chunks)
+            if speculation is not None:
+                speculation.complete()
+        finally:
+            span.set(completion_tokens=approximate_token_count("".join(chunks)), parse_ms=parse_seconds * 1000)
+            tracer.end(span)
+
+    async def invoke_stream(self, message: str, session, max_iterations: int = 10) -> AsyncIterator[AgentEvent]:
+        """Runs the same loop as invoke, but yields events while the completions stream in.
+
+        Args:
+            message (str): The user request.
+            session (ClientSession): The MCP session used to call the tools.
+            max_iterations (int): The maximum number of Thought → Action → Observation steps.
+
+        Yields:
+            AgentEvent: Thought and response deltas, tool call starts and ends and observations.
+        """
+        #The caller may resume this generator from different tasks, so the spans
+        #are passed on explicitly instead of being set as the current span
+        root = tracer.start("agent.invoke_stream", "agent", model=self.model)
+        error = None
+        try:
+            async for event in self._iterate_stream(message, session, max_iterations, root):
+                yield event
+        except Exception as exception:
+            error = exception
+            raise
+        finally:
+            tracer.end(root, error)
+
+    async def _iterate_stream(self, message: str, session, max_iterations: int, root: Span) -> AsyncIterator[AgentEvent]:
+        tools = self._select_tools(message, parent=root)
+        chat_history = self._build_chat_history(message, tools)
+
+        if self.tools:
+            for index in range(max_iterations):
+                iteration = tracer.start("agent.iteration", "iteration", parent=root, index=index)
+                speculation = SpeculativeDispatch(self, session, iteration) if self.speculative_tools else None
+                try:
+                    tags = {}
+                    async for event in self._stream_completion(chat_history, tags, parent=iteration, options=self._tool_options(tools), speculation=speculation):
+                        yield event
+
+                    if self.tool_mode == "native":
+                        #A native completion without tool calls is the streamed answer
+                        if "tool_calls" not in tags:
+                            return
+                        completion = CompletionResult(tags[None], tool_calls=tags["tool_calls"])
+                        tool_calls = [{"id": call.id, "name": call.name, "arguments": call.arguments} for call in completion.tool_calls]
+                        async for event in self._run_tool_calls(tool_calls, session, iteration, speculation):
+                            yield event
+                        for tool_message in self._tool_messages(completion, event.data["results"]):
+                            chat_history.append(tool_message)
+                        tools = self._add_found_tools(tools, tool_calls)
+                        continue
+
+                    if "response" in tags:
+                        return
+
                     chat_history.append(
-                        build_prompt_structure(f"{observations}", "user")
+                        build_prompt_structure(tags[None], "assistant")
                     )
-        return self._model(chat_history)
\ No newline at end of file
+
+                    if "tool_call" in tags:
+                        tool_calls = self._parse_tool_calls(tags["tool_call"])
+                        async for event in self._run_tool_calls(tool_calls, session, iteration, speculation):
+                            yield event
+                        chat_history.append(
+                            build_prompt_structure(event.content, "user", tag="observation")
+                        )
+                finally:
+                    if speculation is not None:
+                        #Early calls of a turn which answered, failed or was abandoned are discarded
+                        discarded = speculation.cancel()
+                        iteration.set(
+                            speculative_started=speculation.started,
+                            speculative_discarded=discarded,
+                            speculative_overlap_ms=speculation.overlap_seconds * 1000,
+                        )
+                    tracer.end(iteration)
+
+        async for event in self._stream_completion(chat_history, {}, final=True, parent=root, options=self._tool_options(tools, final=True)):
+            yield event
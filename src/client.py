@@ -1,28 +1,72 @@
-import asyncio
-import nest_asyncio
-
 import streamlit as st
 
-from mcp import ClientSession
-from mcp.client.sse import sse_client
 from utils.config_loader import config
+from utils.session_utils import MCPSessionManager
+from utils.retrieval_utils import load_embedder
 from agent import Agent
+from supervisor import Supervisor
 
-supervisor_agent = Agent()
 MCP_ENDPOINT = config.get_mcp_endpoint()
-nest_asyncio.apply()
 
-async def query_model(chat_history):
-    async with sse_client(url=MCP_ENDPOINT) as (read, write):
-        async with ClientSession(read, write) as session:
-            await session.initialize()
-            tools_result = await session.list_tools()
-            supervisor_agent.bind_tools(tools_result.tools)
-            result = await supervisor_agent.invoke(chat_history, session)
-            return result
+#Streamlit re-executes this script on every message,
+#cached resources live for the whole server process
+@st.cache_resource
+def get_session_manager() -> MCPSessionManager:
+    return MCPSessionManager(MCP_ENDPOINT)
+
+@st.cache_resource
+def get_supervisor_agent() -> Agent | Supervisor:
+    tool_top_k = config.get_agent_tool_top_k()
+    #The tool retriever ranks with the embedding model of the email search, if one is set
+    tool_embedder = load_embedder(config.get_search_embedding_model()) if tool_top_k else None
+    options = {
+        "tool_mode": config.get_agent_tool_mode(),
+        "tool_top_k": tool_top_k,
+        "tool_embedder": tool_embedder,
+        "speculative_tools": config.get_agent_speculative_tools(),
+    }
+    if config.get_agent_mode() == "supervisor":
+        return Supervisor(**options)
+    return Agent(**options)
+
+session_manager = get_session_manager()
+supervisor_agent = get_supervisor_agent()
+
+async def prepare_session():
+    tools = await session_manager.list_tools()
+    if supervisor_agent.tools is not tools:
+        supervisor_agent.bind_tools(tools)
+    return await session_manager.get_session()
+
+def render_events(events, status):
+    """Shows thoughts and tool calls in the status box and yields the response tokens."""
+    thought = ""
+    thought_box = status.empty()
+
+    for event in events:
+        if event.type == "thought_delta":
+            thought += event.content
+            thought_box.markdown(f"_{thought}_")
+        elif event.type == "tool_call_start":
+            thought = ""
+            thought_box = status.empty()
+            status.markdown(f"Calling `{event.data['name']}` with `{event.data['arguments']}`")
+            status.update(label=f"Running {event.data['name']}...")
+        elif event.type == "tool_call_end":
+            status.markdown(f"`{event.data['name']}` finished")
+        elif event.type == "response_delta":
+            status.update(label="Done", state="complete")
+            yield event.content
 
 st.title("Your personal assisstant!")
 
+#Hit rate and saved latency of the completion cache, if the agent uses one
+cache_stats = getattr(supervisor_agent.backend, "stats", None)
+if cache_stats is not None:
+    with st.sidebar:
+        st.caption("Completion cache")
+        st.json(cache_stats())
+
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
@@ -36,9 +80,13 @@ if prompt := st.chat_input("What is up?"):
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    response = asyncio.run(query_model(st.session_state.messages))
-
     with st.chat_message("assistant"):
-        st.markdown(response)
+        session = session_manager.run(prepare_session())
+        status = st.status("Thinking...")
+        events = session_manager.iterate(
+            supervisor_agent.invoke_stream(st.session_state.messages, session)
+        )
+        response = st.write_stream(render_events(events, status))
+        status.update(label="Done", state="complete")
 
     st.session_state.messages.append({"role": "assistant", "content": response})
@@ -0,0 +1,104 @@
+import time
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from mcp.server.lowlevel.server import request_ctx
+
+from utils.tracing_utils import tracer
+
+
+def incoming_traceparent() -> str | None:
+    """Returns the traceparent the client sent in the _meta of the current MCP request."""
+    request = request_ctx.get(None)
+    if request is None or request.meta is None:
+        return None
+    return getattr(request.meta, "traceparent", None)
+
+
+class ToolExecutor:
+    def __init__(
+        self,
+        mode: str = "threaded",
+        max_workers: int = 16,
+        default_concurrency: int = 4,
+        concurrency_overrides: dict | None = None,
+    ):
+        """Runs the blocking tool functions on a bounded thread pool.
+
+        FastMCP awaits async tools on its event loop, so a synchronous tool which waits on
+        Google blocks every other client. Tools wrapped with offload become async handlers
+        which hand the blocking work to the pool, limited per tool by a semaphore.
+
+        Args:
+            mode (str): 'threaded' to offload the tools, 'sync' to run them on the event loop.
+            max_workers (int): The number of threads shared by all tools.
+            default_concurrency (int): How many calls of one tool may run at the same time.
+            concurrency_overrides (dict | None): Per-tool concurrency limits, keyed by tool name.
+        """
+        self.mode = mode
+        self.default_concurrency = default_concurrency
+        self.concurrency_overrides = concurrency_overrides or {}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        self._semaphores = {}
+        self._metrics = {}
+
+    def _semaphore(self, name: str) -> asyncio.Semaphore:
+        if name not in self._semaphores:
+            limit = self.concurrency_overrides.get(name, self.default_concurrency)
+            self._semaphores[name] = asyncio.Semaphore(limit)
+        return self._semaphores[name]
+
+    def _tool_metrics(self, name: str) -> dict:
+        if name not in self._metrics:
+            self._metrics[name] = {
+                "queued": 0,
+                "max_queued": 0,
+                "running": 0,
+                "completed": 0,
+                "wait_seconds": 0.0,
+                "run_seconds": 0.0,
+            }
+        return self._metrics[name]
+
+    def offload(self, fn):
+        """Wraps a blocking tool function into an async handler with the same signature."""
+        name = fn.__name__
+
+        @functools.wraps(fn)
+        async def handler(*args, **kwargs):
+            if self.mode != "threaded":
+                with tracer.span(f"tool.{name}", "tool", parent=incoming_traceparent()):
+                    return fn(*args, **kwargs)
+
+            #The metrics are only touched from the event loop, so they need no lock
+            metrics = self._tool_metrics(name)
+            metrics["queued"] += 1
+            metrics["max_queued"] = max(metrics["max_queued"], metrics["queued"])
+            queued_at = time.perf_counter()
+
+            async with self._semaphore(name):
+                metrics["queued"] -= 1
+                metrics["running"] += 1
+                started_at = time.perf_counter()
+                metrics["wait_seconds"] += started_at - queued_at
+                try:
+                    with tracer.span(f"tool.{name}", "tool", parent=incoming_traceparent(), wait_ms=(started_at - queued_at) * 1000):
+                        #Copying the context keeps the tool span as the parent of the Google API spans in the thread
+                        call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+                        return await asyncio.get_running_loop().run_in_executor(self._pool, call)
+                finally:
+                    metrics["running"] -= 1
+                    metrics["completed"] += 1
+                    metrics["run_seconds"] += time.perf_counter() - started_at
+
+        return handler
+
+    def reset(self) -> None:
+        """Drops the semaphores and metrics, e.g. after changing the limits or the event loop."""
+        self._semaphores.clear()
+        self._metrics.clear()
+
+    def stats(self) -> dict:
+        return {name: dict(metrics) for name, metrics in self._metrics.items()}
@@ -0,0 +1,131 @@
+import re
+import itertools
+import multiprocessing
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+from utils.config_loader import config
+
+#The SSE transport tells the client where to post its messages in the endpoint event
+ENDPOINT_DATA = re.compile(r"^data: (/\S*)$")
+
+
+def run_worker(index: int, host: str, port: int, workers: int = 1) -> None:
+    #Imported in the worker process, so every worker builds its own server
+    from src.mcp_server import tool_server
+
+    tool_server.setup_server(workers)
+    if index == 0:
+        tool_server.start_background_jobs()
+    tool_server.mcp.run(transport="sse", host=host, port=port)
+
+
+class Dispatcher:
+    def __init__(self, worker_urls: list[str]):
+        """Routes MCP SSE sessions to worker processes behind one shared port.
+
+        A new SSE connection is assigned to the next worker, and the message endpoint the
+        worker announces is rewritten to /w<index>/messages/..., so every later post of that
+        session reaches the same worker without the dispatcher keeping any session state.
+
+        Args:
+            worker_urls (list[str]): The base urls of the workers, e.g. http://127.0.0.1:8001.
+        """
+        self.worker_urls = worker_urls
+        self._next_worker = itertools.cycle(range(len(worker_urls)))
+        self._client = httpx.AsyncClient(timeout=httpx.Timeout(30.0, read=None))
+
+    def _forward_headers(self, request: Request) -> dict:
+        return {key: value for key, value in request.headers.items() if key.lower() not in ("host", "content-length")}
+
+    async def sse(self, request: Request) -> Response:
+        index = next(self._next_worker)
+        upstream = await self._client.send(
+            self._client.build_request("GET", f"{self.worker_urls[index]}/sse", headers=self._forward_headers(request)),
+            stream=True,
+        )
+
+        async def events():
+            async for line in upstream.aiter_lines():
+                match = ENDPOINT_DATA.match(line)
+                if match:
+                    line = f"data: /w{index}{match.group(1)}"
+                yield line + "\n"
+
+        return StreamingResponse(
+            events(),
+            status_code=upstream.status_code,
+            media_type="text/event-stream",
+            background=BackgroundTask(upstream.aclose),
+        )
+
+    async def forward(self, request: Request) -> Response:
+        index = int(request.path_params["index"])
+        if index >= len(self.worker_urls):
+            return Response("Unknown worker", status_code=404)
+
+        url = f"{self.worker_urls[index]}/{request.path_params['path']}"
+        upstream = await self._client.request(
+            request.method,
+            url,
+            params=request.query_params,
+            headers=self._forward_headers(request),
+            content=await request.body(),
+        )
+        return Response(upstream.content, status_code=upstream.status_code, headers={
+            key: value for key, value in upstream.headers.items()
+            if key.lower() not in ("content-length", "transfer-encoding", "content-encoding")
+        })
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[
+            Route("/sse", self.sse, methods=["GET"]),
+            Route("/w{index:int}/{path:path}", self.forward, methods=["GET", "POST", "DELETE"]),
+        ])
+
+
+def serve(host: str | None = None, port: int | None = None, workers: int | None = None) -> None:
+    """
+    Runs the tool server with the host, port and number of workers from config.yaml.
+
+    A single worker serves host:port directly. With more workers, every worker listens on
+    127.0.0.1 on the ports after `port`, and a dispatcher on host:port routes the sessions.
+
+    Args:
+        host (str | None): Overrides the configured host.
+        port (int | None): Overrides the configured port.
+        workers (int | None): Overrides the configured number of worker processes.
+    """
+    host = host or config.get_mcp_host()
+    port = port or config.get_mcp_port()
+    workers = workers or config.get_mcp_workers()
+
+    if workers <= 1:
+        run_worker(0, host, port)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    worker_ports = [port + 1 + index for index in range(workers)]
+    processes = [
+        context.Process(target=run_worker, args=(index, "127.0.0.1", worker_port, workers), daemon=True)
+        for index, worker_port in enumerate(worker_ports)
+    ]
+    for process in processes:
+        process.start()
+
+    dispatcher = Dispatcher([f"http://127.0.0.1:{worker_port}" for worker_port in worker_ports])
+    try:
+        uvicorn.run(dispatcher.app(), host=host, port=port)
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    serve()
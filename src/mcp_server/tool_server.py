@@ -1,23 +1,35 @@
 import os
+import time
 import base64
-import email
+import threading
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from dotenv import load_dotenv
 from typing import List, Union, Optional
 
-from googleapiclient.discovery import build
 from dataclasses import dataclass
 from fastmcp import FastMCP
-from textwrap import dedent
+from starlette.requests import Request
+from starlette.responses import JSONResponse
 from googleapiclient.errors import HttpError
 from email.mime.text import MIMEText
 
-from src.utils.completion_utils import call_groq_api
-from utils.google_api_utils import initialize_creds
+from src.utils.completion_utils import call_groq_api, get_completion_cache
+from utils.google_api_utils import get_service, service_pool, credential_manager, shared_store
+from utils.cache_utils import TTLCache
+from utils.mirror_utils import LocalMirror
+from utils.search_utils import MailSearchIndex
+from utils.retrieval_utils import load_embedder
+from utils.config_loader import config
+from src.mcp_server.executor import ToolExecutor
 from src.utils.tools_utils import (
     delete_appointment, 
     create_appointment, 
-    get_appointments, 
-    get_emails, scrape_news
+    update_appointment,
+    list_appointments,
+    format_appointments,
+    events_in_window,
+    get_emails, format_emails, format_search_results, read_message, scrape_news
 )
 
 load_dotenv()
@@ -26,29 +38,162 @@ mcp = FastMCP(
     name="agent_assistanc"
 )
 
-@mcp.tool
-def get_upcoming_appointments(days_into_the_future: int) -> str:
+tool_executor = ToolExecutor(
+    mode=config.get_tool_execution_mode(),
+    max_workers=config.get_tool_workers(),
+    default_concurrency=config.get_tool_concurrency(),
+    concurrency_overrides=config.get_tool_concurrency_overrides(),
+)
+
+MIRROR_SERVICES = {"calendar": ("calendar", "v3"), "gmail": ("gmail", "v1")}
+
+#Built by setup_server, once per worker process
+read_cache = None
+message_cache = None
+briefing_executor = None
+mirror = None
+search_index = None
+#With several workers the write tools expire the cached reads of the other workers through the shared store
+shared_invalidation = False
+
+def setup_server(workers: int = 1) -> None:
+    """
+    Builds the caches, the executors, the local mirror and the search index of this process.
+
+    Under spawn a worker runs the launching module as __mp_main__ before it imports this one,
+    so nothing expensive happens at import and every worker calls this exactly once.
+
+    Args:
+        workers (int): The number of worker processes serving the tools.
+    """
+    global read_cache, message_cache, briefing_executor, mirror, search_index, shared_invalidation
+
+    #Results of the read tools, write tools invalidate the namespace they touch
+    read_cache = TTLCache(
+        max_entries=config.get_cache_max_entries(),
+        ttl=config.get_cache_ttl(),
+        stale_ttl=config.get_cache_revalidate_window(),
+    )
+    #Message bodies are immutable, so they only need a size bound
+    message_cache = TTLCache(max_entries=config.get_cache_max_entries(), ttl=None)
+    briefing_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="briefing")
+    #Optional local copy of the calendar and the recent mail, the reads answer from it once it is synced
+    mirror = LocalMirror(config.get_mirror_path(), gmail_window_days=config.get_mirror_gmail_window()) if config.get_mirror_enabled() else None
+    #Full-text index of the recent mail for search_emails
+    search_index = MailSearchIndex(
+        config.get_search_path(),
+        window_days=config.get_search_window(),
+        body_token_budget=config.get_search_body_token_budget(),
+        batch_size=config.get_gmail_batch_size(),
+        embedder=load_embedder(config.get_search_embedding_model()),
+    ) if config.get_search_enabled() else None
+    shared_invalidation = workers > 1
+
+def read_generation(namespace: str) -> int:
+    #Part of the cache keys, a write in any worker moves the reads of all workers to new keys
+    if not shared_invalidation:
+        return 0
+    return shared_store.get(f"generation-{namespace}", 0)
+
+def invalidate_reads(*namespaces: str) -> None:
+    for namespace in namespaces:
+        read_cache.invalidate(namespace)
+        if shared_invalidation:
+            shared_store.set(f"generation-{namespace}", time.time_ns())
+
+def invalidate_calendar_reads():
+    #The briefing lists today's appointments as well
+    invalidate_reads("calendar", "briefing")
+    shared_store.delete("briefing")
+    if mirror is not None:
+        mirror.invalidate("calendar")
+
+def invalidate_mail_reads():
+    #The briefing lists the recent emails as well
+    invalidate_reads("emails", "briefing")
+    shared_store.delete("briefing")
+    if mirror is not None:
+        mirror.invalidate("gmail")
+
+def sync_mirror(source: str) -> None:
+    mirror.sync(source, get_service(*MIRROR_SERVICES[source]))
+
+def use_mirror(source: str, force_refresh: bool = False) -> bool:
+    #Before the first sync finished the reads go to Google directly
+    if mirror is None or not mirror.is_ready(source):
+        return False
+    if force_refresh or mirror.is_stale(source):
+        sync_mirror(source)
+    return True
+
+def cached_appointments(days_into_the_future: int, force_refresh: bool = False) -> str:
+    if use_mirror("calendar", force_refresh):
+        return format_appointments(days_into_the_future, mirror.list_events(days_into_the_future))
+
+    key = ("calendar", read_generation("calendar"), days_into_the_future)
+    listing = None if force_refresh else read_cache.get(key)
+
+    if listing is None:
+        #An expired listing is revalidated with its ETag instead of being downloaded again.
+        #A 304 only says the calendar did not change, so the listing reaches beyond the window by as
+        #long as it may be reused, and is only revalidated while it still covers the current window
+        margin = config.get_cache_ttl() + config.get_cache_revalidate_window()
+        stale_listing = read_cache.get_stale(key)
+        if stale_listing is not None and time.time() - stale_listing[2] > margin:
+            stale_listing = None
+        try:
+            _, events, etag = list_appointments(
+                days_into_the_future,
+                get_service("calendar", "v3"),
+                etag=stale_listing[1] if stale_listing else None,
+                margin_seconds=margin,
+            )
+            listing = (events, etag, time.time())
+        except HttpError as error:
+            if stale_listing is None or error.resp.status != 304:
+                raise
+            listing = stale_listing
+        read_cache.set(key, listing)
+
+    events, _, _ = listing
+    #Events which ended since the listing was fetched are dropped, those beyond the window as well
+    return format_appointments(days_into_the_future, events_in_window(events, days_into_the_future))
+
+def cached_emails(days_into_the_past: int, force_refresh: bool = False) -> str:
+    if mirror is not None and mirror.covers_emails(days_into_the_past) and use_mirror("gmail", force_refresh):
+        return format_emails(mirror.list_threads(days_into_the_past))
+
+    key = ("emails", read_generation("emails"), days_into_the_past)
+    result = None if force_refresh else read_cache.get(key)
+
+    if result is None:
+        result = get_emails(days_into_the_past, get_service("gmail", "v1"))
+        read_cache.set(key, result)
+    return result
+
+@mcp.tool(annotations={"readOnlyHint": True})
+@tool_executor.offload
+def get_upcoming_appointments(days_into_the_future: int, force_refresh: bool = False) -> str:
     """
     Fetches and formats upcoming Google Calendar appointments within a specified time range.
 
     Parameters:
         days_into_the_future (int): The number of days into the future to look for upcoming appointments.
+        force_refresh (bool): Check Google for changes instead of answering from a recent copy.
 
     Returns:
         str: A formatted string listing all appointments within the given range, or a message
              indicating that no appointments are scheduled.
     """
-    creds = initialize_creds()
-
     try:
-        service = build("calendar", "v3", credentials=creds)
-        result = get_appointments(days_into_the_future, service)
+        result = cached_appointments(days_into_the_future, force_refresh)
         return result
     except HttpError as error:
         print("An error occurred:", error)
         return "An error occurred while retrieving appointments."
 
-@mcp.tool
+@mcp.tool(annotations={"readOnlyHint": False})
+@tool_executor.offload
 def delete_upcoming_appointments(appointment_ids: Union[str, List[str]]) -> str:
     """
     Deletes one or multiple upcoming Google Calendar appointments by their appointment ID(s).
@@ -60,17 +205,17 @@ def delete_upcoming_appointments(appointment_ids: Union[str, List[str]]) -> str:
     Returns:
         str: A message indicating whether the deletion was successful or if an error occurred.
     """
-    creds = initialize_creds()
-
     try:
-        service = build("calendar", "v3", credentials=creds)
+        service = get_service("calendar", "v3")
         result = delete_appointment(appointment_ids= appointment_ids, service=service)
+        invalidate_calendar_reads()
         return result
     except HttpError as error:
         print("An error occurred:", error)
         return "An error occurred while deleting appointments."
 
-@mcp.tool
+@mcp.tool(annotations={"readOnlyHint": False})
+@tool_executor.offload
 def create_upcoming_appointment(
     appointment_name: str,
     appointment_start_date: str,
@@ -91,22 +236,22 @@ def create_upcoming_appointment(
     Returns:
         str: A message confirming the appointment creation or reporting an error.
     """
-    creds = initialize_creds()
-
     try:
-        service = build("calendar", "v3", credentials=creds)
+        service = get_service("calendar", "v3")
         result = create_appointment(appointment_name=appointment_name,
                                     appointment_description=appointment_description,
                                     appointment_start_date=appointment_start_date,
                                     appointment_end_date=appointment_end_date,
                                     location=location,
                                     service=service)
+        invalidate_calendar_reads()
         return result
     except HttpError as error:
         print("An error occurred:", error)
         return "An error occurred while creating the appointment."
 
-@mcp.tool
+@mcp.tool(annotations={"readOnlyHint": False})
+@tool_executor.offload
 def update_upcoming_appointment(
     appointment_id: str,
     new_appointment_name: Optional[str] = "",
@@ -116,133 +261,124 @@ def update_upcoming_appointment(
     new_location: Optional[str] = ""
 ) -> str:
     """
-    Creates a new appointment in the user's Google Calendar.
+    Updates an existing appointment in the user's Google Calendar. Only the given fields are changed.
 
     Parameters:
-        appointment_name (str): The title or summary of the appointment.
-        appointment_description (Optional[str]): An optional description of the appointment. Place an empty string if no further information is provided.
-        appointment_start_date (str): The start datetime in ISO 8601 format (e.g., '2025-04-24T14:00:00+02:00').
-        appointment_end_date (str): The end datetime in ISO 8601 format (e.g., '2025-04-24T16:00:00+02:00').
-        location (Optional[str]): An optional location for the appointment. Place an empty string if no further information is provided.
+        appointment_id (str): The ID of the appointment to update.
+        new_appointment_name (Optional[str]): The new title of the appointment. Place an empty string to keep the current one.
+        new_appointment_description (Optional[str]): The new description. Place an empty string to keep the current one.
+        new_appointment_start_date (Optional[str]): The new start datetime in ISO 8601 format (e.g., '2025-04-24T14:00:00+02:00'). Place an empty string to keep the current one.
+        new_appointment_end_date (Optional[str]): The new end datetime in ISO 8601 format (e.g., '2025-04-24T16:00:00+02:00'). Place an empty string to keep the current one.
+        new_location (Optional[str]): The new location. Place an empty string to keep the current one.
 
     Returns:
-        str: A message confirming the appointment creation or reporting an error.
+        str: A message confirming the update or reporting an error.
     """
-    creds = initialize_creds()
-
     try:
-        service = build("calendar", "v3", credentials=creds)
-        event = service.events().get(calendarId="primary", eventId=appointment_id).execute()
-
-        appointment_name = event['summary']
-        appointment_start_date = event['start']['dateTime']
-        appointment_end_date = event['end']['dateTime']
-
-        if 'description' in event.keys():
-            appointment_description = event['description']
-        else:
-            appointment_description = ""
-
-        if 'location' in event.keys():
-            location = event['location']
-        else:
-            location = ""
-
-        if len(new_appointment_name) == 0:
-            new_appointment_name = appointment_name
-
-        if len(new_appointment_description) == 0:
-            new_appointment_description = appointment_description
-
-        if len(new_appointment_start_date) == 0:
-            new_appointment_start_date = appointment_start_date
-
-        if len(new_appointment_end_date) == 0:
-            new_appointment_end_date = appointment_end_date
-
-        if len(new_location) == 0:
-            new_location = location
-
-        create_appointment(
-            new_appointment_name, 
-            new_appointment_description,
-            new_appointment_start_date,
-            new_appointment_end_date,
-            new_location,
-            service
-        )    
-        delete_appointment(appointment_ids=appointment_id, service=service)    
+        service = get_service("calendar", "v3")
+        result = update_appointment(
+            appointment_id,
+            service,
+            appointment_name=new_appointment_name,
+            appointment_description=new_appointment_description,
+            appointment_start_date=new_appointment_start_date,
+            appointment_end_date=new_appointment_end_date,
+            location=new_location
+        )
+        invalidate_calendar_reads()
+        return result
     except HttpError as error:
         print("An error occurred:", error)
-        return "An error occurred while creating the appointment."
+        return "An error occurred while updating the appointment."
 
-@mcp.tool
-def display_recent_emails(days_into_the_past: int) -> str:
+@mcp.tool(annotations={"readOnlyHint": True})
+@tool_executor.offload
+def display_recent_emails(days_into_the_past: int, force_refresh: bool = False) -> str:
     """
     Displays the subject lines and thread IDs of recent emails in the Gmail account
     based on the number of days provided.
 
     Args:
         days_into_the_past (int): The number of days in the past to search for emails.
+        force_refresh (bool): Check Gmail for new emails instead of answering from a recent copy.
     
     Returns:
         str: A string containing thread IDs and subjects of the emails. Returns None if no emails are found or an error occurs.
     """
-    creds = initialize_creds()
-
     try:
-        service = build("gmail", "v1", credentials=creds)
-        result = get_emails(days_into_the_past, service)
+        result = cached_emails(days_into_the_past, force_refresh)
         return result
     except HttpError as error:
         print(f"An error occurred: {error}")
         return f"An error occured when fetching emails of the last {days_into_the_past} days"
 
-@mcp.tool
+@mcp.tool(annotations={"readOnlyHint": True})
+@tool_executor.offload
 def read_mail(thread_id: str) -> str:
     """
-    Retrieves and decodes the plain text content of an email from Gmail using its thread ID.
+    Retrieves the plain text content of an email from Gmail using its thread ID.
+    Attachments are not downloaded and long emails are shortened.
 
     Args:
         thread_id (str): The ID of the email thread to read.
 
     Returns:
-        str: The decoded plain text body of the email, or None if an error occurs
-        or the body is not found.
+        str: The plain text body of the email, or None if the body is not found.
 
     """
-    creds = initialize_creds()
+    decoded_msg = message_cache.get(("message", thread_id))
+    if decoded_msg is None and mirror is not None:
+        decoded_msg = mirror.get_message_text(thread_id)
+    if decoded_msg is not None:
+        message_cache.set(("message", thread_id), decoded_msg)
+        return decoded_msg
 
     try:
-        service = build("gmail", "v1", credentials=creds)
-        email_message = service.users().messages().get(userId='me', id=thread_id, format='raw').execute()
-
-        msg_str = base64.urlsafe_b64decode(email_message['raw'].encode('ASCII'))
-        mime_msg = email.message_from_bytes(msg_str)
-        
-        def get_mime_body(mime_msg):
-            if mime_msg.is_multipart():
-                for part in mime_msg.walk():
-                    ctype = part.get_content_type()
-                    dispo = str(part.get('Content-Disposition') or '')
-                    if "attachment" in dispo:
-                        continue
-                    if ctype == 'text/plain':
-                        return part.get_payload(decode=True).decode(errors="replace")
-                for part in mime_msg.walk():
-                    if part.get_content_type() == 'text/html':
-                        return part.get_payload(decode=True).decode(errors="replace")
-            else:
-                return mime_msg.get_payload(decode=True).decode(errors="replace")
-            return None
-        
-        decoded_msg = get_mime_body(mime_msg)
+        decoded_msg = read_message(thread_id, get_service("gmail", "v1"))
+        if decoded_msg is not None:
+            message_cache.set(("message", thread_id), decoded_msg)
+            if mirror is not None:
+                mirror.set_message_text(thread_id, decoded_msg)
         return decoded_msg
     except HttpError as error:
         print(f"An error occurred: {error}")
         return f"An error occured when reading an email."
 
-@mcp.tool
+def update_search_index() -> int:
+    #One process downloads the new messages, the others pick them up from the shared file
+    with shared_store.lock("search-index"):
+        return search_index.update(get_service("gmail", "v1"))
+
+@mcp.tool(annotations={"readOnlyHint": True})
+@tool_executor.offload
+def search_emails(query: str, top_k: int = 5) -> str:
+    """
+    Searches the emails of the last months for words of their sender, subject or text.
+    Use it to find specific emails instead of listing all recent ones.
+
+    Args:
+        query (str): The words to look for, e.g. "invoice dentist".
+        top_k (int): The number of emails to return.
+
+    Returns:
+        str: The best matching emails with an excerpt, best match first. Pass the message ID to read_mail for the full text.
+    """
+    if search_index is None:
+        return "The email search is not enabled."
+    try:
+        #The first search builds the index, later ones are kept current in the background
+        if not search_index.is_ready():
+            update_search_index()
+        results = search_index.search(query, top_k)
+    except HttpError as error:
+        print(f"An error occurred: {error}")
+        return "An error occured when searching the emails."
+    if not results:
+        return f"No emails match '{query}'."
+    return format_search_results(results)
+
+@mcp.tool(annotations={"readOnlyHint": False})
+@tool_executor.offload
 def send_mail(message_text: str, to: str, subject: str) -> str:
     """
     Sends an email using the Gmail API.
@@ -262,17 +398,105 @@ def send_mail(message_text: str, to: str, subject: str) -> str:
     raw = base64.urlsafe_b64encode(message.as_bytes())
     raw = raw.decode()
     body = {'raw': raw}
-    creds = initialize_creds()
-
     try:
-        service = build("gmail", "v1", credentials=creds)
+        service = get_service("gmail", "v1")
         message = service.users().messages().send(userId="me", body=body).execute()
+        invalidate_mail_reads()
         return "The email was successfully sent!"
     except HttpError as error:
         print('An error occurred: %s' % error)
         return None
 
-@mcp.tool
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics(request: Request) -> JSONResponse:
+    return JSONResponse({
+        "tools": tool_executor.stats(),
+        "service_pool": service_pool.stats(),
+        "credentials": credential_manager.stats(),
+        "read_cache": read_cache.stats(),
+        "message_cache": message_cache.stats(),
+        "mirror": mirror.stats() if mirror is not None else None,
+        "search": search_index.stats() if search_index is not None else None,
+        "completion_cache": get_completion_cache().stats() if get_completion_cache() is not None else None,
+    })
+
+def gather_briefing_sources() -> tuple[dict, list[str]]:
+    #The sources are independent, so they are fetched at the same time.
+    #A source which fails or misses the deadline is reported as unavailable instead of failing the briefing,
+    #the names of these sources are returned next to the results.
+    sources = {
+        "Past Emails": lambda: cached_emails(days_into_the_past=3),
+        "Future Appointments": lambda: cached_appointments(days_into_the_future=1),
+    }
+    if config.get_briefing_include_news():
+        sources["News Headlines"] = scrape_news
+
+    futures = {name: briefing_executor.submit(fetch) for name, fetch in sources.items()}
+    deadline = time.monotonic() + config.get_briefing_source_timeout()
+    results, failed = {}, []
+
+    for name, future in futures.items():
+        try:
+            results[name] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FuturesTimeoutError:
+            results[name] = f"({name} are currently unavailable: the request timed out)"
+        except Exception as error:
+            results[name] = f"({name} are currently unavailable: {error})"
+        else:
+            #scrape_news returns None instead of raising
+            if results[name] is not None:
+                continue
+            results[name] = f"({name} are currently unavailable)"
+        failed.append(name)
+    return results, failed
+
+def build_morning_briefing() -> str:
+    sources, failed = gather_briefing_sources()
+    prompt = "\n\n".join(f"{name}:\n{content}" for name, content in sources.items())
+
+    message = {'role': 'user', 'content': f'Create a morning briefing using the following information: {prompt}'}
+    morning_briefing = call_groq_api(message)
+    #A briefing missing a source is not cached, the next request tries the source again
+    if not failed:
+        #The shared store makes a briefing prepared by one worker available to all of them
+        read_cache.set(("briefing", read_generation("briefing")), morning_briefing, ttl=config.get_briefing_cache_ttl())
+        shared_store.set("briefing", morning_briefing, ttl=config.get_briefing_cache_ttl())
+    return morning_briefing
+
+def schedule_morning_briefing(times: list[str]) -> threading.Thread:
+    """
+    Prepares the morning briefing in the background every day at the given local times,
+    so that the morning request is answered from the cache.
+
+    Args:
+        times (list[str]): Local times in HH:MM format.
+
+    Returns:
+        threading.Thread: The started daemon thread.
+    """
+    def seconds_until_next_run() -> float:
+        now = dt.datetime.now()
+        runs = []
+        for time_of_day in times:
+            hour, minute = map(int, time_of_day.split(":"))
+            run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            runs.append(run if run > now else run + dt.timedelta(days=1))
+        return (min(runs) - now).total_seconds()
+
+    def run_forever():
+        while True:
+            time.sleep(seconds_until_next_run())
+            try:
+                build_morning_briefing()
+            except Exception as error:
+                print(f"Failed to prepare the morning briefing: {error}")
+
+    thread = threading.Thread(target=run_forever, name="briefing-scheduler", daemon=True)
+    thread.start()
+    return thread
+
+@mcp.tool(annotations={"readOnlyHint": True})
+@tool_executor.offload
 def create_morning_briefing() -> str:
     """
     Generates a morning briefing containing:
@@ -283,32 +507,75 @@ def create_morning_briefing() -> str:
     Returns:
         A formatted string with the summarized information.
     """
-    creds = initialize_creds()
+    morning_briefing = read_cache.get(("briefing", read_generation("briefing"))) or shared_store.get("briefing")
+    if morning_briefing is not None:
+        return morning_briefing
 
     try:
-        mail_service = build("gmail", "v1", credentials=creds)
-        calendar_service = build("calendar", "v3", credentials=creds)
-        past_emails = get_emails(days_into_the_past=3, service=mail_service)
-        future_appointments = get_appointments(days_into_the_future=1, service=calendar_service)
-        #The news_headlines should be added to the prompt, 
-        #but I cant access more tokens due to my free grok tier.
-        #news_headlines = scrape_news()
-
-        prompt = dedent(f"""
-        Past Emails:
-        {past_emails}
-
-        Future Appointments:
-        {future_appointments}
-        """).strip()
-
-        message = {'role': 'user', 'content': f'Create a morning briefing using the following information: {prompt}'}
-        morning_briefing = call_groq_api(message)
-        return morning_briefing
+        return build_morning_briefing()
     except Exception as e:
         return f"Failed to generate morning briefing: {str(e)}"
-    except:
-        print("An error occured!")
+
+def schedule_mirror_sync(interval: float) -> threading.Thread:
+    """
+    Keeps the local mirror current by pulling the changes of calendar and mail every interval.
+    The first run copies everything, later runs only fetch the deltas.
+
+    Args:
+        interval (float): Seconds between two syncs.
+
+    Returns:
+        threading.Thread: The started daemon thread.
+    """
+    def run_forever():
+        while True:
+            for source in MIRROR_SERVICES:
+                try:
+                    sync_mirror(source)
+                except Exception as error:
+                    print(f"Failed to sync the {source} mirror: {error}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run_forever, name="mirror-sync", daemon=True)
+    thread.start()
+    return thread
+
+def schedule_search_indexing(interval: float) -> threading.Thread:
+    """
+    Adds the new messages to the search index every interval.
+
+    Args:
+        interval (float): Seconds between two updates.
+
+    Returns:
+        threading.Thread: The started daemon thread.
+    """
+    def run_forever():
+        while True:
+            try:
+                update_search_index()
+            except Exception as error:
+                print(f"Failed to update the search index: {error}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run_forever, name="search-indexer", daemon=True)
+    thread.start()
+    return thread
+
+def start_background_jobs():
+    #With several workers only the first one runs the jobs
+    if config.get_briefing_precompute_times():
+        schedule_morning_briefing(config.get_briefing_precompute_times())
+    if mirror is not None:
+        schedule_mirror_sync(config.get_mirror_sync_interval())
+    if search_index is not None:
+        schedule_search_indexing(config.get_search_index_interval())
 
 if __name__ == '__main__':
-    mcp.run(transport="sse", host="127.0.0.1", port=8000)
\ No newline at end of file
+    if config.get_mcp_workers() > 1:
+        from src.mcp_server.serve import serve
+        serve()
+    else:
+        setup_server()
+        start_background_jobs()
+        mcp.run(transport="sse", host=config.get_mcp_host(), port=config.get_mcp_port())
@@ -0,0 +1,304 @@
+from typing import AsyncIterator
+from dataclasses import dataclass, field
+import asyncio
+import json
+import re
+
+from agent import Agent, AgentEvent, latest_user_message
+from utils.completion_utils import build_prompt_structure, CompletionBackend, get_default_backend
+from utils.retrieval_utils import Embedder
+from utils.extraction_utils import extract_tags
+from utils.tracing_utils import tracer, Span
+
+SUPERVISOR_SYSTEM_PROMPT = """
+You are the supervisor of a team of assistants. Every assistant can only use its own tools:
+
+<workers>
+%s
+</workers>
+
+Split the request of the user into subtasks for the assistants which are needed, at most one per assistant.
+The assistants work at the same time and do not see each other's results, so every task has to be
+understandable on its own and must contain all values from the request it needs.
+
+Answer with a JSON list within <plan></plan> tags as follows:
+
+<plan>
+[{"worker": <assistant-name>, "task": <task-description>}]
+</plan>
+
+Example:
+
+<question>What do I have planned tomorrow and did Anna answer my mail?</question>
+
+<plan>
+[{"worker": "calendar", "task": "List my appointments of tomorrow."}, {"worker": "mail", "task": "Check whether Anna answered my last email and summarize her answer."}]
+</plan>
+
+If no assistant is needed, respond directly within <response></response> tags.
+"""
+
+ROUTED_TASK = """%s
+
+Only do the part of this request your tools are made for and leave out the rest."""
+
+MERGE_SYSTEM_PROMPT = """
+You are a personal assistant. Your team has worked on the parts of the user's question and reports its results.
+Answer the question of the user with these results in one coherent answer. Do not mention the team.
+"""
+
+
+@dataclass
+class WorkerSpec:
+    """
+    A data class to represent a specialized worker agent of the supervisor.
+
+    Attributes:
+        name (str): The name the supervisor plans with.
+        description (str): What the worker can do, shown to the supervisor.
+        tools (list[str]): The names of the MCP tools the worker may use.
+        keywords (list[str]): Word beginnings which show that a request concerns the worker.
+    """
+
+    name: str
+    description: str
+    tools: list[str] = field(default_factory=list)
+    keywords: list[str] = field(default_factory=list)
+
+
+DEFAULT_WORKERS = [
+    WorkerSpec(
+        "mail",
+        "Lists, searches, reads and sends emails.",
+        ["display_recent_emails", "search_emails", "read_mail", "send_mail"],
+        ["mail", "email", "inbox", "send", "reply", "replied", "answer", "wrote", "sender"],
+    ),
+    WorkerSpec(
+        "calendar",
+        "Lists, creates, updates and deletes appointments in the calendar.",
+        ["get_upcoming_appointments", "create_upcoming_appointment", "update_upcoming_appointment", "delete_upcoming_appointments"],
+        ["calendar", "appointment", "meeting", "schedule", "event", "planned", "week", "tomorrow", "today"],
+    ),
+    WorkerSpec(
+        "news",
+        "Creates the morning briefing with emails, appointments and news headlines.",
+        ["create_morning_briefing"],
+        ["briefing", "news", "headline"],
+    ),
+]
+
+
+class Supervisor:
+
+    def __init__(
+        self,
+        model: str = "llama3-70b-8192",
+        workers: list[WorkerSpec] | None = None,
+        backend: CompletionBackend | None = None,
+        max_subtasks: int = 4,
+        context_token_budget: int | None = 6000,
+        tool_mode: str = "xml",
+        tool_top_k: int | None = None,
+        tool_embedder: Embedder | None = None,
+        speculative_tools: list[str] | None = None,
+    ):
+        """Splits a request into subtasks and runs specialized worker agents on them concurrently.
+
+        The keywords of the workers pick the workers a request concerns. A request of one worker
+        goes to it directly, without planning or merging. A request of several workers goes to
+        each of them, the workers run at the same time over the shared MCP session, and one more
+        completion merges their results. Only a request no keyword points to is planned by a
+        completion; a single planned subtask is answered by its worker directly, and requests the
+        plan cannot be read from are handled by a generalist agent with all tools.
+
+        Args:
+            model (str): The model of the supervisor and the workers.
+            workers (list[WorkerSpec] | None): The workers, by default mail, calendar and news.
+            backend (CompletionBackend | None): Shared by the supervisor and all workers.
+            max_subtasks (int): The maximum number of subtasks of one plan.
+            context_token_budget (int | None): The context budget of every agent.
+            tool_mode (str): How the workers call their tools, 'xml' or 'native'.
+            tool_top_k (int | None): Agents with more tools only see this many per question.
+            tool_embedder (Embedder | None): Optional embedding model of the tool retrieval.
+            speculative_tools (list[str] | None): Side-effect-free tools the agents may call while their completion streams.
+        """
+        self.model = model
+        self.backend = backend or get_default_backend()
+        self.worker_specs = workers if workers is not None else DEFAULT_WORKERS
+        self.max_subtasks = max_subtasks
+        self.context_token_budget = context_token_budget
+        #Shared by the generalist and the workers
+        self.agent_options = {
+            "context_token_budget": context_token_budget,
+            "tool_mode": tool_mode,
+            "tool_top_k": tool_top_k,
+            "tool_embedder": tool_embedder,
+            "speculative_tools": speculative_tools,
+        }
+        self.tools = None
+        self.workers = {}
+        self.keywords = {}
+        self.system_prompt = ""
+        self.generalist = Agent(model=model, backend=self.backend, **self.agent_options)
+        self.merger = Agent(model=model, system_prompt=MERGE_SYSTEM_PROMPT, backend=self.backend, context_token_budget=context_token_budget)
+
+    def bind_tools(self, tools: list):
+        """Gives every worker the subset of the tools it is specialized in. Workers without tools are left out."""
+        self.tools = tools
+        tools_by_name = {tool.name: tool for tool in tools}
+        self.workers = {}
+        self.keywords = {}
+        descriptions = []
+
+        for spec in self.worker_specs:
+            worker_tools = [tools_by_name[name] for name in spec.tools if name in tools_by_name]
+            if not worker_tools:
+                continue
+            worker = Agent(model=self.model, backend=self.backend, **self.agent_options)
+            worker.bind_tools(worker_tools)
+            self.workers[spec.name] = worker
+            self.keywords[spec.name] = tuple(keyword.lower() for keyword in spec.keywords)
+            descriptions.append(f"{spec.name}: {spec.description}")
+
+        self.generalist.bind_tools(tools)
+        self.system_prompt = SUPERVISOR_SYSTEM_PROMPT % "\n".join(descriptions)
+
+    def _route(self, message) -> list[str]:
+        #The workers whose keywords the request contains, none if it needs the planner
+        words = re.findall(r"[a-z]+", latest_user_message(message).lower())
+        matches = [name for name, keywords in self.keywords.items() if keywords and any(word.startswith(keywords) for word in words)]
+        return matches[:self.max_subtasks]
+
+    @staticmethod
+    def _routed_subtasks(message, workers: list[str]) -> list[dict]:
+        #Without a plan every worker gets the whole request and only does its own part
+        task = ROUTED_TASK % latest_user_message(message)
+        return [{"worker": worker, "task": task} for worker in workers]
+
+    async def _plan(self, message: str, parent: Span) -> tuple[list[dict] | None, str | None]:
+        #Returns the subtasks, or a direct response, or neither if the plan cannot be read
+        history = [
+            build_prompt_structure(self.system_prompt, "system"),
+            build_prompt_structure(message, "user", tag="question"),
+        ]
+        with tracer.span("supervisor.plan", "agent", parent=parent) as span:
+            completion = await self.backend.complete(history, self.model)
+            tags = extract_tags(str(completion.content), ("plan", "response"))
+
+            if tags["response"].found and not tags["plan"].found:
+                return [], tags["response"].content[0]
+            try:
+                plan = json.loads(tags["plan"].content[0]) if tags["plan"].found else None
+            except json.JSONDecodeError:
+                plan = None
+            if not isinstance(plan, list):
+                span.set(fallback=True)
+                return None, None
+
+            subtasks = [
+                subtask for subtask in plan
+                if isinstance(subtask, dict) and subtask.get("worker") in self.workers and subtask.get("task")
+            ][:self.max_subtasks]
+            span.set(subtasks=len(subtasks))
+            return (subtasks or None), None
+
+    async def _run_worker(self, subtask: dict, session, parent: Span) -> str:
+        with tracer.span("supervisor.worker", "agent", parent=parent, worker=subtask["worker"]):
+            try:
+                return str(await self.workers[subtask["worker"]].invoke(subtask["task"], session))
+            except Exception as error:
+                return f"The {subtask['worker']} assistant failed: {error}"
+
+    @staticmethod
+    def _merge_message(message: str, subtasks: list[dict], results: list[str]) -> str:
+        reports = "\n\n".join(
+            f"{subtask['worker']} ({subtask['task']}):\n{result}"
+            for subtask, result in zip(subtasks, results)
+        )
+        return f"{message}\n\nResults of the team:\n\n{reports}"
+
+    async def invoke(self, message: str, session) -> str:
+        """Answers a request with the workers.
+
+        Args:
+            message (str): The user request.
+            session (ClientSession): The MCP session shared by the workers.
+
+        Returns:
+            str: The answer.
+        """
+        with tracer.span("supervisor.invoke", "agent", model=self.model) as root:
+            workers = self._route(message)
+            root.set(routed=workers)
+            if len(workers) == 1:
+                return await self.workers[workers[0]].invoke(message, session)
+
+            subtasks, response = (self._routed_subtasks(message, workers), None) if workers else await self._plan(message, root)
+            if response is not None:
+                return response
+            if subtasks is None:
+                return await self.generalist.invoke(message, session)
+
+            results = await asyncio.gather(*(self._run_worker(subtask, session, root) for subtask in subtasks))
+            if len(results) == 1:
+                return results[0]
+            with tracer.span("supervisor.merge", "agent"):
+                return await self.merger.invoke(self._merge_message(message, subtasks, results), session)
+
+    async def invoke_stream(self, message: str, session) -> AsyncIterator[AgentEvent]:
+        """Like invoke, but reports every subtask as a tool call and streams the merged answer.
+
+        Args:
+            message (str): The user request.
+            session (ClientSession): The MCP session shared by the workers.
+
+        Yields:
+            AgentEvent: A tool_call_start and tool_call_end per subtask, the observation and the response deltas.
+        """
+        root = tracer.start("supervisor.invoke_stream", "agent", model=self.model)
+        error = None
+        try:
+            workers = self._route(message)
+            root.set(routed=workers)
+            if len(workers) == 1:
+                async for event in self.workers[workers[0]].invoke_stream(message, session):
+                    yield event
+                return
+
+            subtasks, response = (self._routed_subtasks(message, workers), None) if workers else await self._plan(message, root)
+            if response is not None:
+                yield AgentEvent("response_delta", response)
+                return
+            if subtasks is None:
+                async for event in self.generalist.invoke_stream(message, session):
+                    yield event
+                return
+
+            tasks = [asyncio.create_task(self._run_worker(subtask, session, root)) for subtask in subtasks]
+            pending = {}
+            for i, (subtask, task) in enumerate(zip(subtasks, tasks)):
+                pending[task] = {"id": i, "name": subtask["worker"], "arguments": {"task": subtask["task"]}}
+                yield AgentEvent("tool_call_start", data=pending[task])
+
+            try:
+                while pending:
+                    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield AgentEvent("tool_call_end", task.result(), data=pending.pop(task))
+            finally:
+                #A caller which stops listening also stops the workers
+                for task in pending:
+                    task.cancel()
+
+            results = [task.result() for task in tasks]
+            yield AgentEvent("observation", f"{dict(enumerate(results))}")
+            if len(results) == 1:
+                yield AgentEvent("response_delta", results[0])
+                return
+            async for event in self.merger.invoke_stream(self._merge_message(message, subtasks, results), session):
+                yield event
+        except Exception as exception:
+            error = exception
+            raise
+        finally:
+            tracer.end(root, error)
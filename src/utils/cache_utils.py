@@ -0,0 +1,256 @@
+import os
+import json
+import time
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    #File locks are only needed when several worker processes share a store, which is not supported on Windows
+    fcntl = None
+
+
+class TTLCache:
+    def __init__(self, max_entries: int = 256, ttl: float | None = 60.0, stale_ttl: float = 0.0):
+        """Thread-safe LRU cache whose entries expire after a time to live.
+
+        Keys are tuples whose first element is a namespace, so that all entries of one kind
+        can be invalidated at once. Expired entries are kept for another `stale_ttl` seconds
+        and can be fetched with get_stale, e.g. to revalidate them with an ETag.
+
+        Args:
+            max_entries (int): The maximum number of entries before the least recently used is dropped.
+            ttl (float | None): Seconds an entry stays fresh, None for entries which never expire.
+            stale_ttl (float): Seconds an expired entry is kept for revalidation.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, key: tuple, allow_stale: bool):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        value, expires_at = entry
+        now = time.monotonic()
+        if expires_at is not None and now > expires_at:
+            if now > expires_at + self.stale_ttl:
+                del self._entries[key]
+                return None
+            if not allow_stale:
+                return None
+
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key: tuple, default=None):
+        """Returns the fresh value for the key, or default if there is none."""
+        with self._lock:
+            entry = self._lookup(key, allow_stale=False)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[0]
+
+    def get_stale(self, key: tuple, default=None):
+        """Returns the value for the key even if it expired, as long as it is within the stale window."""
+        with self._lock:
+            entry = self._lookup(key, allow_stale=True)
+            return default if entry is None else entry[0]
+
+    def set(self, key: tuple, value, ttl: float | None = -1) -> None:
+        """Stores a value.
+
+        Args:
+            key (tuple): The key, starting with its namespace.
+            value: The value to store.
+            ttl (float | None): Overrides the time to live of the cache for this entry.
+        """
+        ttl = self.ttl if ttl == -1 else ttl
+        with self._lock:
+            self._entries[key] = (value, None if ttl is None else time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, namespace: str) -> None:
+        """Drops all entries whose key starts with the namespace."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == namespace]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+class CompletionCache:
+    def __init__(self, max_entries: int = 512, ttl: float = 600.0, path: str | None = None):
+        """Two-tier cache of LLM completions: an in-memory LRU and an optional SQLite file.
+
+        The file tier outlives restarts and is shared by the processes of one node. Entries
+        found on disk are copied to memory for the rest of their time to live. Every entry
+        records how long its completion took, which is counted as saved on a hit.
+
+        Args:
+            max_entries (int): The maximum number of entries kept in memory.
+            ttl (float): Seconds a completion may be served from the cache.
+            path (str | None): The SQLite file of the second tier, None to keep completions in memory only.
+        """
+        self.ttl = ttl
+        self._memory = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._lock = threading.Lock()
+        self._connection = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.saved_ms = 0.0
+
+    def _disk_get(self, key: str):
+        with self._lock:
+            row = self._connection.execute("SELECT value, expires_at FROM completions WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        value = json.loads(row[0])
+        self._memory.set(("completion", key), value, ttl=row[1] - time.time())
+        return value
+
+    def get(self, keys: list[str]) -> dict | None:
+        """Returns the completion stored under the first of the keys which has one."""
+        for key in keys:
+            value = self._memory.get(("completion", key))
+            if value is None and self._connection is not None:
+                value = self._disk_get(key)
+            if value is not None:
+                with self._lock:
+                    self.hits += 1
+                    self.saved_ms += value.get("latency_ms", 0.0)
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, keys: list[str], value: dict) -> None:
+        """Stores a JSON serialisable completion under all keys."""
+        for key in keys:
+            self._memory.set(("completion", key), value)
+        if self._connection is not None:
+            with self._lock:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO completions (key, value, expires_at) VALUES (?, ?, ?)",
+                    [(key, json.dumps(value), time.time() + self.ttl) for key in keys],
+                )
+                self._connection.execute("DELETE FROM completions WHERE expires_at < ?", (time.time(),))
+
+    def bypass(self) -> None:
+        with self._lock:
+            self.bypassed += 1
+
+    def clear(self) -> None:
+        self._memory.clear()
+        if self._connection is not None:
+            with self._lock:
+                self._connection.execute("DELETE FROM completions")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "saved_ms": round(self.saved_ms, 1),
+            }
+
+
+class FileStore:
+    def __init__(self, directory: str):
+        """Small JSON key/value store on disk, shared by the worker processes of one node.
+
+        Every key is one file which is replaced atomically, so readers never see a half
+        written value. lock() serialises work across processes, e.g. an OAuth token refresh.
+
+        Args:
+            directory (str): The directory the store lives in. It is created if needed.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str, default=None):
+        """Returns the stored value, or default if there is none or it expired."""
+        try:
+            with open(self._path(key)) as file:
+                entry = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return default
+
+        if entry["expires_at"] is not None and time.time() > entry["expires_at"]:
+            return default
+        return entry["value"]
+
+    def set(self, key: str, value, ttl: float | None = None) -> None:
+        """Stores a JSON serialisable value, optionally expiring after ttl seconds."""
+        entry = {"value": value, "expires_at": None if ttl is None else time.time() + ttl}
+        write_atomically(self._path(key), json.dumps(entry))
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def lock(self, name: str):
+        """Holds an exclusive lock shared by all processes using this store."""
+        with open(os.path.join(self.directory, f"{name}.lock"), "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_atomically(path: str, content: str) -> None:
+    """
+    Writes a file through a temporary file and a rename, so the file is never seen half written.
+
+    Args:
+        path (str): The file to write.
+        content (str): The new content.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    file_descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(file_descriptor, "w") as file:
+            file.write(content)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
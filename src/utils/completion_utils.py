@@ -1,55 +1,194 @@
 import os
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+from dataclasses import dataclass, field, asdict
+from collections import deque
+from typing import AsyncIterator, Callable, Protocol
 from dotenv import load_dotenv
 
-from groq import Groq
+import httpx
+from groq import Groq, AsyncGroq, APIConnectionError, InternalServerError, RateLimitError
+
+from utils.cache_utils import CompletionCache
+from utils.config_loader import config
 
 load_dotenv()
 
+RETRYABLE_ERRORS = (RateLimitError, InternalServerError, APIConnectionError)
+
+
+def approximate_token_count(text: str) -> int:
+    """
+    Estimates the number of tokens of a text with the rule of thumb of four characters per token.
+
+    Args:
+        text (str): The text to count.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return (len(text) + 3) // 4
+
+def truncate_observation(text: str, max_tokens: int) -> str:
+    """
+    Shortens an observation to roughly max_tokens tokens and marks the cut.
+
+    Args:
+        text (str): The observation.
+        max_tokens (int): The number of tokens to keep.
+
+    Returns:
+        str: The shortened observation.
+    """
+    keep = max_tokens * 4
+    if len(text) <= keep:
+        return text
+    return text[:keep] + "\n[... observation truncated to fit the context window ...]"
+
+
+def message_text(message: dict) -> str:
+    """The text of a chat message which counts towards the context, including its native tool calls."""
+    content = str(message.get("content") or "")
+    if message.get("tool_calls"):
+        content += json.dumps(message["tool_calls"])
+    return content
 
-class ChatHistory(list):
-    def __init__(self, messages: list | None = None, total_length: int = -1):
-        """Initialise the queue with a fixed total length.
+
+class ContextWindow:
+    def __init__(
+        self,
+        messages: list | None = None,
+        token_budget: int | None = None,
+        pinned: int = 1,
+        tokenizer: Callable[[str], int] = approximate_token_count,
+        summarizer: Callable[[str, int], str] = truncate_observation,
+        summary_tokens: int = 200,
+    ):
+        """Chat history which fits itself into a token budget.
+
+        The first `pinned` messages (the system prompt, and usually the question) are never touched.
+        When the budget is exceeded, the oldest observations are summarized first, and if that is
+        not enough the oldest unpinned messages are evicted, each together with its observations.
+        The newest message is always kept, an observation is only summarized to the budget the other
+        messages leave free. Should the last turn alone exceed the budget, its observations are
+        summarized below summary_tokens until it fits.
 
         Args:
-            messages (list | None): A list of initial messages
-            total_length (int): The maximum number of messages the chat history can hold.
+            messages (list | None): A list of initial messages.
+            token_budget (int | None): The maximum number of tokens of all messages, None for no limit.
+            pinned (int): The number of leading messages which are never summarized or evicted.
+            tokenizer (Callable[[str], int]): Counts the tokens of a message content.
+            summarizer (Callable[[str, int], str]): Shortens an observation to about the given number of tokens.
+            summary_tokens (int): The least observations are summarized to. An observation keeps
+                                  more if the other messages leave more of the budget free.
         """
         if messages is None:
             messages = []
 
-        super().__init__(messages)
-        self.total_length = total_length
+        self.token_budget = token_budget
+        self.tokenizer = tokenizer
+        self.summarizer = summarizer
+        self.summary_tokens = summary_tokens
+        self.total_tokens = 0
+        self._pinned = []
+        self._messages = deque()
 
-    def append(self, msg: str):
-        """Add a message to the queue.
+        for msg in messages[:pinned]:
+            self._pinned.append(msg)
+            self.total_tokens += self.tokenizer(message_text(msg))
 
-        Args:
-            msg (str): The message to be added to the queue
-        """
-        if len(self) == self.total_length:
-            self.pop(0)
-        super().append(msg)
-    
-class InitializeChatHistory(ChatHistory):
-    def __init__(self, messages: list | None = None, total_length: int = -1):
-        """Initialise the queue with a fixed total length.
+        for msg in messages[pinned:]:
+            self.append(msg)
 
-        Args:
-            messages (list | None): A list of initial messages
-            total_length (int): The maximum number of messages the chat history can hold.
-        """
-        super().__init__(messages)
-        self.total_length = total_length
+    @staticmethod
+    def _is_observation(msg: dict) -> bool:
+        return msg["role"] == "tool" or (msg["role"] == "user" and str(msg["content"]).startswith("<observation>"))
+
+    def _summarize(self, msg: dict, target_tokens: int) -> dict:
+        if msg["role"] == "tool":
+            return {**msg, "content": self.summarizer(str(msg["content"]), target_tokens)}
+        content = "<observation>" + self.summarizer(str(msg["content"])[len("<observation>"):], target_tokens)
+        if not content.endswith("</observation>"):
+            content += "</observation>"
+        return {**msg, "content": content}
 
-    def append(self, msg: str):
-        """Add a message to the queue. The first messaage will always stay fixed.
+    def append(self, msg: dict):
+        """Add a message and shrink the history until it fits into the token budget again.
 
         Args:
-            msg (str): The message to be added to the queue
+            msg (dict): The message to be added.
         """
-        if len(self) == self.total_length:
-            self.pop(1)
-        super().append(msg)
+        tokens = self.tokenizer(message_text(msg))
+        self._messages.append([msg, tokens, False])
+        self.total_tokens += tokens
+        self._fit()
+
+    def _fit(self):
+        if self.token_budget is None or self.total_tokens <= self.token_budget:
+            return
+
+        #Older observations are summarized first, the newest one keeps what the others leave free
+        for entry in list(self._messages)[:-1]:
+            if self.total_tokens <= self.token_budget:
+                return
+            self._summarize_entry(entry, self.summary_tokens)
+
+        newest = self._messages[-1]
+        if self.total_tokens > self.token_budget:
+            self._summarize_entry(newest, self.token_budget - (self.total_tokens - newest[1]))
+
+        #A message is evicted together with the observations which answer it, so no observation
+        #is left without its tool call. The last turn is kept.
+        last_turn = self._last_turn_length()
+        while self.total_tokens > self.token_budget and len(self._messages) > last_turn:
+            _, tokens, _ = self._messages.popleft()
+            self.total_tokens -= tokens
+            while len(self._messages) > last_turn and self._is_observation(self._messages[0][0]):
+                _, tokens, _ = self._messages.popleft()
+                self.total_tokens -= tokens
+
+        #If the last turn alone is still too large, its observations go below the summary size
+        for entry in list(self._messages):
+            if self.total_tokens <= self.token_budget:
+                return
+            self._summarize_entry(entry, entry[1] - (self.total_tokens - self.token_budget), min_tokens=0)
+
+    def _last_turn_length(self) -> int:
+        #The newest message, and if it is an observation the ones before it and the message which called the tools
+        length = 0
+        for msg, _, _ in reversed(self._messages):
+            length += 1
+            if not self._is_observation(msg):
+                break
+        return length
+
+    def _summarize_entry(self, entry: list, target_tokens: int, min_tokens: int | None = None) -> None:
+        msg, tokens, _ = entry
+        min_tokens = self.summary_tokens if min_tokens is None else min_tokens
+        target_tokens = max(min_tokens, target_tokens)
+        if not self._is_observation(msg) or tokens <= target_tokens:
+            return
+        summary = self._summarize(msg, target_tokens)
+        #The tags and the truncation marker count as well, so an overshoot is taken off once more
+        overshoot = self.tokenizer(message_text(summary)) - target_tokens
+        if overshoot > 0 and target_tokens - overshoot >= min_tokens:
+            summary = self._summarize(msg, target_tokens - overshoot)
+        entry[0] = summary
+        entry[1] = self.tokenizer(message_text(summary))
+        entry[2] = True
+        self.total_tokens += entry[1] - tokens
+
+    def __iter__(self):
+        yield from self._pinned
+        for msg, _, _ in self._messages:
+            yield msg
+
+    def __len__(self) -> int:
+        return len(self._pinned) + len(self._messages)
 
 def build_prompt_structure(prompt: str, role: str, tag: str = "") -> dict:
     """
@@ -77,11 +216,377 @@ def update_chat_history(history: list, msg: str, role: str):
     """
     history.append(build_prompt_structure(prompt=msg, role=role))
 
+_groq_client = None
+
 def call_groq_api(message: str) -> str:
-    client = Groq(api_key=os.environ.get("groq_api_key"))    
-    chat_completion = client.chat.completions.create(
+    global _groq_client
+    model = "llama3-70b-8192"
+    cache = get_completion_cache()
+    policy = CachePolicy()
+    keys = None
+    if cache is not None:
+        if policy.bypasses([message]):
+            cache.bypass()
+        else:
+            keys = completion_keys([message], model)
+            cached = cache.get(keys)
+            if cached is not None:
+                return cached["content"]
+
+    #One client keeps its connection pool across calls
+    if _groq_client is None:
+        _groq_client = Groq(api_key=os.environ.get("groq_api_key"))
+    start = time.perf_counter()
+    chat_completion = _groq_client.chat.completions.create(
         messages=[message],
-        model="llama3-70b-8192",
+        model=model,
     )
     response = chat_completion.choices[0].message.content
-    return response
\ No newline at end of file
+    if keys is not None and policy.is_cacheable(response):
+        cache.set(keys, {"content": response, "latency_ms": (time.perf_counter() - start) * 1000})
+    return response
+
+
+@dataclass
+class ToolCall:
+    """
+    A data class to represent a structured tool call of a native function-calling completion.
+
+    Attributes:
+        id (str): The id the tool result has to reference.
+        name (str): The name of the tool.
+        arguments (dict): The arguments of the call.
+    """
+
+    id: str
+    name: str
+    arguments: dict = field(default_factory=dict)
+
+    def to_message(self) -> dict:
+        #The shape of a tool call in an assistant message of the chat completions API
+        return {"id": self.id, "type": "function", "function": {"name": self.name, "arguments": json.dumps(self.arguments)}}
+
+
+def parse_tool_arguments(arguments: str | None) -> dict:
+    try:
+        parsed = json.loads(arguments or "{}")
+    except json.JSONDecodeError:
+        return {}
+    return parsed if isinstance(parsed, dict) else {}
+
+
+@dataclass
+class CompletionResult:
+    """
+    A data class to represent a chat completion returned by a completion backend.
+
+    Attributes:
+        content (str): The text of the completion.
+        prompt_tokens (int): The number of prompt tokens reported by the backend.
+        completion_tokens (int): The number of completion tokens reported by the backend.
+        cached (bool): Whether the completion was served from the completion cache.
+        tool_calls (list[ToolCall]): The structured tool calls, only with native function calling.
+    """
+
+    content: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached: bool = False
+    tool_calls: list[ToolCall] = field(default_factory=list)
+
+
+class CompletionBackend(Protocol):
+    async def complete(self, messages: list, model: str, **options) -> CompletionResult:
+        ...
+
+    def stream(self, messages: list, model: str, **options) -> AsyncIterator[str | ToolCall]:
+        ...
+
+
+class AsyncGroqBackend:
+    def __init__(
+        self,
+        api_key: str | None = None,
+        max_concurrency: int = 8,
+        max_retries: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+    ):
+        """Non-blocking Groq completion backend.
+
+        All agents sharing a backend share its pooled HTTP connections and its concurrency cap.
+        Rate limits (429), server errors (5xx) and connection errors are retried with
+        exponential backoff and full jitter.
+
+        Args:
+            api_key (str | None): The Groq api key. Defaults to the groq_api_key environment variable.
+            max_concurrency (int): The maximum number of completions in flight at once.
+            max_retries (int): How often a failed completion is retried.
+            base_delay (float): The backoff delay in seconds before the first retry.
+            max_delay (float): The upper bound of the backoff delay in seconds.
+        """
+        self.client = AsyncGroq(
+            api_key=api_key or os.environ.get("groq_api_key"),
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+            ),
+        )
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_delay)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def _create(self, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self.client.chat.completions.create(**kwargs)
+            except RETRYABLE_ERRORS as error:
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self._backoff(attempt, error))
+
+    async def complete(self, messages: list, model: str, **options) -> CompletionResult:
+        """Returns one completion. Options like tools are passed on to the chat completions API."""
+        async with self._semaphore:
+            chat_completion = await self._create(messages=messages, model=model, **options)
+
+        message = chat_completion.choices[0].message
+        usage = chat_completion.usage
+        return CompletionResult(
+            content=message.content or "",
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0,
+            tool_calls=[
+                ToolCall(tool_call.id, tool_call.function.name, parse_tool_arguments(tool_call.function.arguments))
+                for tool_call in message.tool_calls or []
+            ],
+        )
+
+    async def stream(self, messages: list, model: str, **options) -> AsyncIterator[str | ToolCall]:
+        """Yields the completion token by token. Only opening the stream is retried.
+
+        Native tool calls arrive in fragments by index, one is yielded as ToolCall as soon as the
+        fragments of the next one start, the last one once the stream ends.
+        """
+        tool_calls = {}
+        async with self._semaphore:
+            chunks = await self._create(messages=messages, model=model, stream=True, **options)
+            async for chunk in chunks:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    yield delta.content
+                for fragment in delta.tool_calls or []:
+                    for index in [index for index in tool_calls if index < fragment.index]:
+                        tool_call = tool_calls.pop(index)
+                        yield ToolCall(tool_call["id"], tool_call["name"], parse_tool_arguments(tool_call["arguments"]))
+                    tool_call = tool_calls.setdefault(fragment.index, {"id": "", "name": "", "arguments": ""})
+                    tool_call["id"] = fragment.id or tool_call["id"]
+                    if fragment.function is not None:
+                        tool_call["name"] += fragment.function.name or ""
+                        tool_call["arguments"] += fragment.function.arguments or ""
+
+        for index in sorted(tool_calls):
+            tool_call = tool_calls[index]
+            yield ToolCall(tool_call["id"], tool_call["name"], parse_tool_arguments(tool_call["arguments"]))
+
+
+#Longer questions are generated prompts, e.g. the briefing sources, not something a user retypes
+MAX_NORMALIZED_QUESTION_CHARS = 2000
+
+def is_question(message: dict) -> bool:
+    return message["role"] == "user" and not str(message["content"]).startswith("<observation>")
+
+def normalize_content(text: str) -> str:
+    #Case, whitespace and punctuation do not change what is asked
+    return " ".join(re.sub(r"\W+", " ", str(text).lower()).split())
+
+def _digest(parts: list[str]) -> str:
+    #Long contents are hashed piecewise instead of being encoded as a whole
+    digest = hashlib.sha256()
+    for part in parts:
+        for start in range(0, len(part), 65536):
+            digest.update(part[start:start + 65536].encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def completion_keys(messages: list, model: str, options: dict | None = None) -> list[str]:
+    """
+    Builds the cache keys of a completion request: the exact one and, for short questions, the one
+    with normalized questions. Observations and completions stay exact, they hold data in which
+    punctuation matters.
+
+    Args:
+        messages (list): The chat messages.
+        model (str): The model name.
+        options (dict | None): Further request parameters, e.g. the tools, which are hashed into the key.
+
+    Returns:
+        list[str]: The exact key, followed by the normalized key if there is one.
+    """
+    tool_set = json.dumps(options or {}, sort_keys=True, default=str)
+    exact = [model, tool_set]
+    normalized = [model, tool_set]
+    for message in messages:
+        content = message_text(message)
+        exact += [message["role"], content]
+        if normalized is not None and is_question(message):
+            if len(content) > MAX_NORMALIZED_QUESTION_CHARS:
+                normalized = None
+                continue
+            content = normalize_content(content)
+        if normalized is not None:
+            normalized += [message["role"], content]
+
+    keys = [_digest(exact)]
+    if normalized is not None:
+        keys.append(_digest(normalized))
+    return keys
+
+
+class CachePolicy:
+    def __init__(self, bypass_pattern: str | None = None, write_tools: list[str] | None = None):
+        """Decides which completions may be cached.
+
+        Requests whose questions match the bypass pattern ask for something new every time, e.g. a
+        joke, and are never answered from the cache. Generated prompts above the length of a typed
+        question are not matched. Completions which call a write tool are not
+        stored, because replaying them would repeat the side effect.
+
+        Args:
+            bypass_pattern (str | None): Regular expression for questions which are never cached. Defaults to the config.
+            write_tools (list[str] | None): The tools with side effects. Defaults to the config.
+        """
+        pattern = bypass_pattern if bypass_pattern is not None else config.get_completion_cache_bypass_pattern()
+        self.bypass_pattern = re.compile(pattern, re.IGNORECASE) if pattern else None
+        self.write_tools = write_tools if write_tools is not None else config.get_completion_cache_write_tools()
+
+    def bypasses(self, messages: list) -> bool:
+        if self.bypass_pattern is None:
+            return False
+        questions = (str(message["content"]) for message in messages if is_question(message))
+        return any(
+            self.bypass_pattern.search(question)
+            for question in questions if len(question) <= MAX_NORMALIZED_QUESTION_CHARS
+        )
+
+    def is_cacheable(self, content: str, tool_calls: list[ToolCall] | None = None) -> bool:
+        if any(tool_call.name in self.write_tools for tool_call in tool_calls or []):
+            return False
+        return not any(f'"{tool}"' in content for tool in self.write_tools)
+
+
+class CachedBackend:
+    def __init__(self, backend: CompletionBackend, cache: CompletionCache, policy: CachePolicy | None = None):
+        """Completion backend which answers repeated requests from a completion cache.
+
+        A request is looked up by its exact messages first and with normalized questions second.
+        Streams of cached completions are replayed in one chunk.
+
+        Args:
+            backend (CompletionBackend): The backend asked on a miss.
+            cache (CompletionCache): The cache of the completions.
+            policy (CachePolicy | None): The bypass rules, by default those of the config.
+        """
+        self.backend = backend
+        self.cache = cache
+        self.policy = policy or CachePolicy()
+
+    def _keys(self, messages: list, model: str, options: dict) -> list[str] | None:
+        if self.policy.bypasses(messages):
+            self.cache.bypass()
+            return None
+        return completion_keys(messages, model, options)
+
+    def _store(self, keys: list[str], result: CompletionResult, latency: float) -> None:
+        if self.policy.is_cacheable(result.content, result.tool_calls):
+            self.cache.set(keys, {
+                "content": result.content,
+                "prompt_tokens": result.prompt_tokens,
+                "completion_tokens": result.completion_tokens,
+                "tool_calls": [asdict(tool_call) for tool_call in result.tool_calls],
+                "latency_ms": latency * 1000,
+            })
+
+    async def complete(self, messages: list, model: str, **options) -> CompletionResult:
+        keys = self._keys(messages, model, options)
+        if keys is None:
+            return await self.backend.complete(messages, model, **options)
+
+        cached = self.cache.get(keys)
+        if cached is not None:
+            return CompletionResult(
+                cached["content"], cached["prompt_tokens"], cached["completion_tokens"], cached=True,
+                tool_calls=[ToolCall(**tool_call) for tool_call in cached.get("tool_calls", [])],
+            )
+
+        start = time.perf_counter()
+        result = await self.backend.complete(messages, model, **options)
+        self._store(keys, result, time.perf_counter() - start)
+        return result
+
+    async def stream(self, messages: list, model: str, **options) -> AsyncIterator[str | ToolCall]:
+        keys = self._keys(messages, model, options)
+        cached = self.cache.get(keys) if keys is not None else None
+        if cached is not None:
+            if cached["content"]:
+                yield cached["content"]
+            for tool_call in cached.get("tool_calls", []):
+                yield ToolCall(**tool_call)
+            return
+
+        chunks, tool_calls = [], []
+        start = time.perf_counter()
+        async for chunk in self.backend.stream(messages, model, **options):
+            if isinstance(chunk, ToolCall):
+                tool_calls.append(chunk)
+            else:
+                chunks.append(chunk)
+            yield chunk
+        #Only streams which were read to the end are stored
+        if keys is not None:
+            content = "".join(chunks)
+            result = CompletionResult(content, completion_tokens=approximate_token_count(content), tool_calls=tool_calls)
+            self._store(keys, result, time.perf_counter() - start)
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+
+_completion_cache = None
+
+def get_completion_cache() -> CompletionCache | None:
+    """Returns the process-wide completion cache, or None if it is disabled in the config."""
+    global _completion_cache
+    if _completion_cache is None and config.get_completion_cache_enabled():
+        _completion_cache = CompletionCache(
+            max_entries=config.get_completion_cache_max_entries(),
+            ttl=config.get_completion_cache_ttl(),
+            path=config.get_completion_cache_path(),
+        )
+    return _completion_cache
+
+
+_default_backend = None
+
+def get_default_backend() -> CompletionBackend:
+    """Returns the process-wide backend, so that all agents share one connection pool and concurrency cap."""
+    global _default_backend
+    if _default_backend is None:
+        _default_backend = AsyncGroqBackend()
+        cache = get_completion_cache()
+        if cache is not None:
+            _default_backend = CachedBackend(_default_backend, cache)
+    return _default_backend
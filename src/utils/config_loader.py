@@ -12,16 +12,136 @@ class ConfigLoader(object):
         with open(config_path) as file:
             self._config = yaml.safe_load(file)
 
+    def get_agent_mode(self):
+        return self._config["agent"]["mode"]
+
+    def get_agent_tool_mode(self):
+        return self._config["agent"]["tool_mode"]
+
+    def get_agent_tool_top_k(self):
+        return self._config["agent"]["tool_top_k"] or None
+
+    def get_agent_speculative_tools(self):
+        return self._config["agent"].get("speculative_tools") or []
+
     def get_mcp_endpoint(self):
         return self._config["mcp"]["mcp_endpoint"]
     
+    def get_mcp_host(self):
+        return self._config["mcp"]["host"]
+
+    def get_mcp_port(self):
+        return self._config["mcp"]["port"]
+
+    def get_mcp_workers(self):
+        return self._config["mcp"]["workers"]
+
+    def get_shared_store_path(self):
+        return self._config["mcp"]["shared_store"]
+
+    def get_tool_execution_mode(self):
+        return self._config["mcp"]["execution_mode"]
+
+    def get_tool_workers(self):
+        return self._config["mcp"]["tool_workers"]
+
+    def get_tool_concurrency(self):
+        return self._config["mcp"]["tool_concurrency"]
+
+    def get_tool_concurrency_overrides(self):
+        return self._config["mcp"].get("tool_concurrency_overrides") or {}
+
     def get_news_endpoint(self):
         return self._config["tools"]["news_endpoint"]
+
+    def get_news_cache_ttl(self):
+        return self._config["tools"]["news_cache_seconds"]
+
+    def get_briefing_include_news(self):
+        return self._config["briefing"]["include_news"]
+
+    def get_briefing_source_timeout(self):
+        return self._config["briefing"]["source_timeout_seconds"]
+
+    def get_briefing_precompute_times(self):
+        return self._config["briefing"]["precompute_at"]
+
+    def get_briefing_cache_ttl(self):
+        return self._config["briefing"]["cache_seconds"]
     
     def get_google_scopes(self):
         return [
             self._config["google_api"]["calendar_endpoint"],
             self._config["google_api"]["gmail_endpoint"]
         ]
+
+    def get_gmail_batch_size(self):
+        return self._config["google_api"].get("gmail_batch_size", 100)
+
+    def get_completion_cache_enabled(self):
+        return self._config["completion_cache"]["enabled"]
+
+    def get_completion_cache_max_entries(self):
+        return self._config["completion_cache"]["max_entries"]
+
+    def get_completion_cache_ttl(self):
+        return self._config["completion_cache"]["ttl_seconds"]
+
+    def get_completion_cache_path(self):
+        return self._config["completion_cache"].get("path") or None
+
+    def get_completion_cache_bypass_pattern(self):
+        return self._config["completion_cache"].get("bypass_pattern") or None
+
+    def get_completion_cache_write_tools(self):
+        return self._config["completion_cache"].get("write_tools") or []
+
+    def get_mirror_enabled(self):
+        return self._config["mirror"]["enabled"]
+
+    def get_mirror_path(self):
+        return self._config["mirror"]["path"]
+
+    def get_mirror_sync_interval(self):
+        return self._config["mirror"]["sync_interval_seconds"]
+
+    def get_mirror_gmail_window(self):
+        return self._config["mirror"]["gmail_window_days"]
+
+    def get_search_enabled(self):
+        return self._config["search"]["enabled"]
+
+    def get_search_path(self):
+        return self._config["search"]["path"]
+
+    def get_search_window(self):
+        return self._config["search"]["window_days"]
+
+    def get_search_index_interval(self):
+        return self._config["search"]["index_interval_seconds"]
+
+    def get_search_body_token_budget(self):
+        return self._config["search"]["body_token_budget"]
+
+    def get_search_embedding_model(self):
+        return self._config["search"].get("embedding_model") or None
+
+    def get_tracing_enabled(self):
+        return self._config["tracing"]["enabled"]
+
+    def get_tracing_path(self):
+        return self._config["tracing"]["path"]
+
+    def get_read_mail_token_budget(self):
+        return self._config["google_api"].get("read_mail_token_budget", 2000)
+
+    def get_cache_ttl(self):
+        return self._config["cache"]["ttl_seconds"]
+
+    def get_cache_revalidate_window(self):
+        return self._config["cache"]["revalidate_seconds"]
+
+    def get_cache_max_entries(self):
+        return self._config["cache"]["max_entries"]
             
 config = ConfigLoader(config_path="config/config.yaml")
\ No newline at end of file
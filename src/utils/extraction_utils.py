@@ -1,5 +1,8 @@
 import re
 from dataclasses import dataclass
+from functools import lru_cache
+
+REACT_TAGS = ("thought", "tool_call", "response")
 
 
 @dataclass
@@ -29,9 +32,169 @@ def extract_tag_content(text: str, tag: str) -> TagContentResult:
             - 'content' (list): A list of strings containing the content found between the specified tags.
             - 'found' (bool): A flag indicating whether any content was found for the given tag.
     """
-    tag_pattern = rf"<{tag}>(.*?)</{tag}>"
-    matched_contents = re.findall(tag_pattern, text, re.DOTALL)
+    matched_contents = _closed_tag_pattern(tag).findall(text)
     return TagContentResult(
         content=[content.strip() for content in matched_contents],
         found=bool(matched_contents),
-    )
\ No newline at end of file
+    )
+
+@lru_cache(maxsize=None)
+def _closed_tag_pattern(tag: str) -> re.Pattern:
+    return re.compile(rf"<{tag}>(.*?)</{tag}>", re.DOTALL)
+
+
+@lru_cache(maxsize=None)
+def _tag_marker_pattern(tags: tuple[str, ...]) -> re.Pattern:
+    names = "|".join(re.escape(tag) for tag in tags)
+    return re.compile(rf"<(/?)({names})>", re.IGNORECASE)
+
+
+@lru_cache(maxsize=None)
+def _tolerant_tag_pattern(tags: tuple[str, ...]) -> re.Pattern:
+    #A tag ends at its closing tag, at the next known opening tag or at the end of the text
+    names = "|".join(re.escape(tag) for tag in tags)
+    return re.compile(rf"<({names})>([^<]*(?:<(?!/\1>|(?:{names})>)[^<]*)*)(?:</\1>)?", re.IGNORECASE)
+
+
+@lru_cache(maxsize=None)
+def _closing_marker_pattern(tags: tuple[str, ...]) -> re.Pattern:
+    names = "|".join(re.escape(tag) for tag in tags)
+    return re.compile(rf"</(?:{names})>", re.IGNORECASE)
+
+
+def extract_tags(text: str, tags: tuple[str, ...] = REACT_TAGS) -> dict[str, TagContentResult]:
+    """
+    Extracts the content of all given tags in a single pass over the text.
+
+    Unlike extract_tag_content this tolerates malformed output of the model: a tag without
+    closing tag ends at the next known opening tag or the end of the text, tag names are
+    case-insensitive and closing tags which do not match the open tag are dropped.
+
+    Parameters:
+        text (str): The input string containing multiple potential tags.
+        tags (tuple[str, ...]): The names of the tags to extract.
+
+    Returns:
+        dict[str, TagContentResult]: The result for every tag, keyed by the tag name.
+    """
+    found = {tag: [] for tag in tags}
+    closing_marker = _closing_marker_pattern(tags)
+
+    for match in _tolerant_tag_pattern(tags).finditer(text):
+        content = match.group(2)
+        #Only closing tags of other tags can be left inside the content
+        if "</" in content:
+            content = closing_marker.sub("", content)
+        found[match.group(1).lower()].append(content.strip())
+
+    return {
+        tag: TagContentResult(content=content, found=bool(content))
+        for tag, content in found.items()
+    }
+
+
+@dataclass
+class TagEvent:
+    """
+    A data class to represent an event emitted by the TagStreamParser.
+
+    Attributes:
+        kind (str): One of 'open', 'delta' or 'close'.
+        tag (str | None): The tag the event belongs to, None for text outside of any known tag.
+        text (str): The new text for 'delta' events, the whole tag content for 'close' events.
+    """
+
+    kind: str
+    tag: str | None
+    text: str = ""
+
+
+class TagStreamParser:
+    def __init__(self, tags: tuple[str, ...] = REACT_TAGS):
+        """Incrementally splits streamed text into the content of known tags.
+
+        Partial tags at the end of a chunk are held back until the next chunk decides them.
+        Malformed output is handled like extract_tags does: opening a tag while another one is
+        still open implicitly closes the first one, tag names are case-insensitive and closing
+        tags which do not match the open tag are dropped.
+
+        Args:
+            tags (tuple[str, ...]): The names of the tags to recognise.
+        """
+        self._pattern = _tag_marker_pattern(tuple(tags))
+        markers = [f"<{tag}>" for tag in tags] + [f"</{tag}>" for tag in tags]
+        #Every beginning of a marker, which may be completed by the next chunk
+        self._marker_prefixes = {marker[:length] for marker in markers for length in range(1, len(marker))}
+        self._buffer = ""
+        self._current = None
+        self._content = []
+        self._found = {tag: [] for tag in tags}
+
+    def _text(self, text: str, events: list) -> None:
+        if text:
+            events.append(TagEvent("delta", self._current, text))
+            if self._current is not None:
+                self._content.append(text)
+
+    def _close(self, events: list) -> None:
+        content = "".join(self._content).strip()
+        self._found[self._current].append(content)
+        events.append(TagEvent("close", self._current, content))
+        self._current = None
+        self._content = []
+
+    def feed(self, chunk: str) -> list[TagEvent]:
+        """Consumes the next chunk of text.
+
+        Args:
+            chunk (str): The new text.
+
+        Returns:
+            list[TagEvent]: The events which the chunk completed.
+        """
+        events = []
+        #Most chunks of a stream hold no tag at all
+        if not self._buffer and "<" not in chunk:
+            self._text(chunk, events)
+            return events
+
+        text = self._buffer + chunk
+        position = 0
+
+        for marker in self._pattern.finditer(text):
+            self._text(text[position:marker.start()], events)
+            position = marker.end()
+            tag = marker.group(2).lower()
+            if not marker.group(1):
+                if self._current is not None:
+                    self._close(events)
+                self._current = tag
+                events.append(TagEvent("open", tag))
+            elif self._current == tag:
+                self._close(events)
+
+        #Only the last "<" can begin a marker the next chunk completes, it is held back
+        held = text.rfind("<", position)
+        if held != -1 and text[held:].lower() in self._marker_prefixes:
+            self._text(text[position:held], events)
+            self._buffer = text[held:]
+        else:
+            self._text(text[position:], events)
+            self._buffer = ""
+        return events
+
+    def close(self) -> list[TagEvent]:
+        """Flushes held back text and closes a tag the stream left open."""
+        events = []
+        self._text(self._buffer, events)
+        self._buffer = ""
+        if self._current is not None:
+            self._close(events)
+        return events
+
+    def results(self) -> dict[str, TagContentResult]:
+        """Returns the content of all tags closed so far, in the format of extract_tags."""
+        return {
+            tag: TagContentResult(content=list(content), found=bool(content))
+            for tag, content in self._found.items()
+        }
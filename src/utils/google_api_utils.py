@@ -1,28 +1,214 @@
 import os.path
+import threading
+import datetime as dt
 
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest
 
-from config_loader import config
+from utils.config_loader import config
+from utils.cache_utils import FileStore, write_atomically
+from utils.tracing_utils import tracer
 
 #Set manually because the project is not that big
 SCOPES = config.get_google_scopes()
 
-def initialize_creds():
-    creds = None
-    
-    if os.path.exists("token.json"):
-        creds = Credentials.from_authorized_user_file("token.json")
+#Shared by all worker processes of the tool server on this node
+shared_store = FileStore(config.get_shared_store_path())
+
+
+class CredentialManager:
+    def __init__(self, refresh_margin: float = 300.0, store: FileStore = shared_store):
+        """Keeps Google credentials in memory and refreshes them shortly before they expire.
+
+        The token file of an account is only read once. A refresh starts `refresh_margin`
+        seconds before expiry and is single-flight: one thread refreshes while the others keep
+        using the still valid token. Across processes the refresh runs under a file lock, the
+        token file is replaced atomically, and a process which finds a token another one has
+        already refreshed adopts it instead of calling the token endpoint again.
+
+        Args:
+            refresh_margin (float): Seconds before expiry at which the credentials are refreshed.
+            store (FileStore): The store whose lock serialises refreshes across processes.
+        """
+        self.refresh_margin = dt.timedelta(seconds=refresh_margin)
+        self._store = store
+        self._creds = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.disk_reads = 0
+        self.refreshes = 0
+        self.adopted = 0
+
+    @staticmethod
+    def token_path(identity: str) -> str:
+        """The token file of an account. The default account keeps using token.json."""
+        if identity == "default":
+            return "token.json"
+        return os.path.join("tokens", f"{identity}.json")
+
+    def _identity_lock(self, identity: str) -> threading.Lock:
+        with self._lock:
+            if identity not in self._locks:
+                self._locks[identity] = threading.Lock()
+            return self._locks[identity]
+
+    def _needs_refresh(self, creds) -> bool:
+        if not creds.token:
+            return True
+        if creds.expiry is None:
+            return False
+        #google-auth keeps the expiry as naive UTC
+        now = dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+        return creds.expiry - now < self.refresh_margin
+
+    def _load(self, identity: str):
+        path = self.token_path(identity)
+        if os.path.exists(path):
+            self.disk_reads += 1
+            return Credentials.from_authorized_user_file(path)
+        return self._authorize(identity)
+
+    def _authorize(self, identity: str):
+        #Runs the OAuth consent flow in the browser and stores the new token
+        path = self.token_path(identity)
+        flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
+        creds = flow.run_local_server(port=0)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        write_atomically(path, creds.to_json())
+        return creds
+
+    def _refresh(self, identity: str, creds) -> None:
+        path = self.token_path(identity)
+        with self._store.lock(f"token-{identity}"):
+            if os.path.exists(path):
+                self.disk_reads += 1
+                stored = Credentials.from_authorized_user_file(path)
+                if stored.refresh_token == creds.refresh_token and not self._needs_refresh(stored):
+                    creds.token = stored.token
+                    creds.expiry = stored.expiry
+                    self.adopted += 1
+                    return
 
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
+            self.refreshes += 1
+            write_atomically(path, creds.to_json())
+
+    def get(self, identity: str = "default"):
+        """Returns the credentials of an account, loading or refreshing them only when needed.
+
+        Args:
+            identity (str): The account, 'default' for the account of token.json.
+
+        Returns:
+            Credentials: The credentials. Refreshes update this object in place, a new consent
+                without a refresh token replaces it.
+        """
+        creds = self._creds.get(identity)
+        if creds is not None and not self._needs_refresh(creds):
+            return creds
+
+        lock = self._identity_lock(identity)
+        if creds is not None and creds.valid:
+            #Another thread is already refreshing and the current token still works
+            if not lock.acquire(blocking=False):
+                return creds
         else:
-            flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
-            creds = flow.run_local_server(port=0)
+            lock.acquire()
+
+        try:
+            creds = self._creds.get(identity)
+            if creds is None:
+                creds = self._load(identity)
+            if self._needs_refresh(creds):
+                if creds.refresh_token:
+                    self._refresh(identity, creds)
+                else:
+                    #Without a refresh token only a new consent gives a working token
+                    creds = self._authorize(identity)
+            self._creds[identity] = creds
+            return creds
+        finally:
+            lock.release()
+
+    def stats(self) -> dict:
+        return {"disk_reads": self.disk_reads, "refreshes": self.refreshes, "adopted": self.adopted}
+
+
+credential_manager = CredentialManager()
+
+def initialize_creds(identity: str = "default"):
+    return credential_manager.get(identity)
+
+
+class TracedHttpRequest(HttpRequest):
+    """HttpRequest which records every execution as a span of the current trace."""
+
+    def execute(self, http=None, num_retries=0):
+        with tracer.span("google_api.request", "google_api", method=self.methodId or "", http_method=self.method):
+            return super().execute(http=http, num_retries=num_retries)
+
+
+class ServicePool:
+    def __init__(self, credentials: CredentialManager = credential_manager):
+        """Process-wide pool of Google API service objects.
+
+        Services are built once per (api name, version, account) and reused across tool
+        calls. googleapiclient services wrap an httplib2 connection which is not
+        thread-safe, so every thread gets its own instance of a pooled service.
+
+        Args:
+            credentials (CredentialManager): Provides the credentials of the accounts.
+        """
+        self._credentials = credentials
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, api_name: str, version: str, identity: str = "default"):
+        """Returns a service for the given api, building it only on the first request.
+
+        The credentials are looked up on every call so they get refreshed before they
+        expire. Refreshes update the credentials object the service was built with, and a
+        service whose credentials were replaced by a new consent is built again.
+
+        Args:
+            api_name (str): The name of the Google API, e.g. 'gmail' or 'calendar'.
+            version (str): The version of the Google API, e.g. 'v1'.
+            identity (str): The account whose credentials are used.
+
+        Returns:
+            Resource: The googleapiclient service object.
+        """
+        creds = self._credentials.get(identity)
+
+        key = (api_name, version, identity)
+        services = getattr(self._local, "services", None)
+        if services is None:
+            services = self._local.services = {}
+
+        built_with, service = services.get(key, (None, None))
+        hit = built_with is creds
+        if not hit:
+            service = build(api_name, version, credentials=creds, cache_discovery=False, requestBuilder=TracedHttpRequest)
+            services[key] = (creds, service)
+
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return service
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
 
-        with open("token.json", "w") as token:
-            token.write(creds.to_json())
+service_pool = ServicePool()
 
-    return creds
\ No newline at end of file
+def get_service(api_name: str, version: str, identity: str = "default"):
+    return service_pool.get(api_name, version, identity)
@@ -0,0 +1,70 @@
+from dataclasses import dataclass
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.cache_utils import TTLCache
+
+
+@dataclass
+class FetchResult:
+    """
+    A data class to represent the result of a cached HTTP GET.
+
+    Attributes:
+        status_code (int): The HTTP status, 200 when the cached copy was revalidated with a 304.
+        text (str): The body of the response.
+        from_cache (bool): Whether the body came from the cache.
+    """
+
+    status_code: int
+    text: str
+    from_cache: bool = False
+
+
+class CachedFetcher:
+    def __init__(self, ttl: float = 900.0, revalidate_window: float = 86400.0, timeout: float = 10.0, pool_size: int = 8):
+        """HTTP GET with a pooled requests.Session, a TTL cache and conditional revalidation.
+
+        Fresh responses are served from memory. Once they expired, the next request sends
+        If-None-Match / If-Modified-Since, and a 304 answer reuses the cached body.
+
+        Args:
+            ttl (float): Seconds a response is served without asking the server.
+            revalidate_window (float): Seconds an expired response is kept for conditional requests.
+            timeout (float): The request timeout in seconds.
+            pool_size (int): The number of pooled connections per host.
+        """
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._cache = TTLCache(max_entries=64, ttl=ttl, stale_ttl=revalidate_window)
+
+    def get(self, url: str) -> FetchResult:
+        cached = self._cache.get(("url", url))
+        if cached is not None:
+            return FetchResult(200, cached["text"], from_cache=True)
+
+        headers = {}
+        stale = self._cache.get_stale(("url", url))
+        if stale is not None:
+            if stale["etag"]:
+                headers["If-None-Match"] = stale["etag"]
+            if stale["last_modified"]:
+                headers["If-Modified-Since"] = stale["last_modified"]
+
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+
+        if response.status_code == 304 and stale is not None:
+            self._cache.set(("url", url), stale)
+            return FetchResult(200, stale["text"], from_cache=True)
+
+        if response.status_code == 200:
+            self._cache.set(("url", url), {
+                "text": response.text,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            })
+        return FetchResult(response.status_code, response.text)
@@ -0,0 +1,288 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import datetime as dt
+
+from googleapiclient.errors import HttpError
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_state (source TEXT PRIMARY KEY, token TEXT NOT NULL, synced_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS events (id TEXT PRIMARY KEY, start_ts REAL, end_ts REAL, resource TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS events_by_start ON events (start_ts);
+CREATE TABLE IF NOT EXISTS threads (id TEXT PRIMARY KEY, subject TEXT, labels TEXT, last_ms INTEGER);
+CREATE INDEX IF NOT EXISTS threads_by_date ON threads (last_ms);
+CREATE TABLE IF NOT EXISTS message_texts (id TEXT PRIMARY KEY, text TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS invalidations (source TEXT PRIMARY KEY, generation INTEGER NOT NULL, synced_generation INTEGER NOT NULL);
+"""
+
+#Gmail files the mails of the primary inbox tab under this label
+PRIMARY_LABEL = "CATEGORY_PERSONAL"
+
+
+def event_timestamp(moment: dict) -> float | None:
+    """Converts the start or end of a Calendar event to a unix timestamp. All-day events start at local midnight."""
+    if "dateTime" in moment:
+        return dt.datetime.fromisoformat(moment["dateTime"].replace("Z", "+00:00")).timestamp()
+    if "date" in moment:
+        return dt.datetime.fromisoformat(moment["date"]).timestamp()
+    return None
+
+
+class LocalMirror:
+    def __init__(self, path: str, gmail_window_days: int = 30, batch_size: int = 100):
+        """Local SQLite copy of the calendar and the recent mail threads, kept current with deltas.
+
+        The calendar is synced with the syncToken of events().list, Gmail with history().list.
+        A full sync only happens on the first run or when Google invalidates the token. Reads
+        answer from indexed tables, so they do not wait on Google at all.
+
+        Several worker processes may share one file: a sync only commits its changes if no other
+        process advanced the token in the meantime, and an invalidation is stored in the file, so
+        a write in one process makes every process sync before its next read.
+
+        Args:
+            path (str): The SQLite file.
+            gmail_window_days (int): How many days of mail threads a full Gmail sync copies.
+            batch_size (int): The number of thread lookups per batch request.
+        """
+        self.path = path
+        self.gmail_window_days = gmail_window_days
+        self.batch_size = batch_size
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._sync_locks = {"calendar": threading.Lock(), "gmail": threading.Lock()}
+        self.full_syncs = 0
+        self.delta_syncs = 0
+
+    def _query(self, sql: str, parameters: tuple = ()) -> list:
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def _commit_sync(self, source: str, previous_token: str | None, token: str, apply, generation: int = 0) -> bool:
+        #Commits the changes of a sync unless another process synced the source in the meantime.
+        #The sync covers the invalidations up to the generation it saw when it started
+        with self._lock:
+            connection = self._connection
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute("SELECT token FROM sync_state WHERE source = ?", (source,)).fetchone()
+                if (row[0] if row else None) != previous_token:
+                    connection.execute("ROLLBACK")
+                    return False
+                apply(connection)
+                connection.execute(
+                    "INSERT OR REPLACE INTO sync_state (source, token, synced_at) VALUES (?, ?, ?)",
+                    (source, token, time.time()),
+                )
+                connection.execute(
+                    "UPDATE invalidations SET synced_generation = MAX(synced_generation, ?) WHERE source = ?",
+                    (generation, source),
+                )
+                connection.execute("COMMIT")
+                return True
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    def token(self, source: str) -> str | None:
+        rows = self._query("SELECT token FROM sync_state WHERE source = ?", (source,))
+        return rows[0][0] if rows else None
+
+    def is_ready(self, source: str) -> bool:
+        """Whether the source was synced at least once."""
+        return self.token(source) is not None
+
+    def _generations(self, source: str) -> tuple[int, int]:
+        rows = self._query("SELECT generation, synced_generation FROM invalidations WHERE source = ?", (source,))
+        return rows[0] if rows else (0, 0)
+
+    def invalidate(self, source: str) -> None:
+        """Marks a source as outdated, e.g. after a write tool changed it, so the next read of every process syncs first."""
+        self._query(
+            "INSERT INTO invalidations (source, generation, synced_generation) VALUES (?, 1, 0) "
+            "ON CONFLICT (source) DO UPDATE SET generation = generation + 1",
+            (source,),
+        )
+
+    def is_stale(self, source: str) -> bool:
+        generation, synced_generation = self._generations(source)
+        return generation > synced_generation
+
+    def sync(self, source: str, service) -> None:
+        """Pulls the changes of 'calendar' or 'gmail' since the last sync."""
+        with self._sync_locks[source]:
+            #An invalidation which arrives while the sync runs keeps the source stale
+            generation = self._generations(source)[0]
+            if source == "calendar":
+                self._sync_calendar(service, generation)
+            else:
+                self._sync_gmail(service, generation)
+
+    def _sync_calendar(self, service, generation: int = 0) -> None:
+        previous_token = self.token("calendar")
+        full = previous_token is None
+        changed, page_token = [], None
+
+        while True:
+            if full:
+                request = service.events().list(calendarId="primary", singleEvents=True, maxResults=2500, pageToken=page_token)
+            else:
+                request = service.events().list(calendarId="primary", singleEvents=True, syncToken=previous_token, pageToken=page_token)
+            try:
+                result = request.execute()
+            except HttpError as error:
+                #410 Gone: the sync token expired, so everything is downloaded again
+                if full or error.resp.status != 410:
+                    raise
+                full, changed, page_token = True, [], None
+                continue
+
+            changed.extend(result.get("items", []))
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                break
+
+        def apply(connection):
+            if full:
+                connection.execute("DELETE FROM events")
+            for event in changed:
+                if event.get("status") == "cancelled":
+                    connection.execute("DELETE FROM events WHERE id = ?", (event["id"],))
+                    continue
+                connection.execute(
+                    "INSERT OR REPLACE INTO events (id, start_ts, end_ts, resource) VALUES (?, ?, ?, ?)",
+                    (event["id"], event_timestamp(event["start"]), event_timestamp(event["end"]), json.dumps(event)),
+                )
+
+        if self._commit_sync("calendar", previous_token, result["nextSyncToken"], apply, generation):
+            if full:
+                self.full_syncs += 1
+            else:
+                self.delta_syncs += 1
+
+    def _fetch_threads(self, service, thread_ids: list[str]) -> tuple[dict, list]:
+        #Returns the metadata of the threads and the ids of the threads which no longer exist
+        threads, missing = {}, []
+
+        def collect(request_id, response, exception):
+            if exception is None:
+                threads[request_id] = response
+            elif isinstance(exception, HttpError) and exception.resp.status == 404:
+                missing.append(request_id)
+            else:
+                raise exception
+
+        for start in range(0, len(thread_ids), self.batch_size):
+            batch = service.new_batch_http_request(callback=collect)
+            for thread_id in thread_ids[start:start + self.batch_size]:
+                batch.add(
+                    service.users().threads().get(userId="me", id=thread_id, format="metadata", metadataHeaders=["Subject"]),
+                    request_id=thread_id,
+                )
+            batch.execute()
+        return threads, missing
+
+    def _sync_gmail(self, service, generation: int = 0) -> None:
+        previous_token = self.token("gmail")
+        thread_ids, full = [], previous_token is None
+
+        if not full:
+            try:
+                history_id, page_token = previous_token, None
+                while True:
+                    result = service.users().history().list(userId="me", startHistoryId=previous_token, pageToken=page_token).execute()
+                    for record in result.get("history", []):
+                        for key in ("messagesAdded", "messagesDeleted", "labelsAdded", "labelsRemoved"):
+                            thread_ids.extend(item["message"]["threadId"] for item in record.get(key, []))
+                    history_id = result.get("historyId", history_id)
+                    page_token = result.get("nextPageToken")
+                    if not page_token:
+                        break
+            except HttpError as error:
+                #404: the history id is too old, so the window is downloaded again
+                if error.resp.status != 404:
+                    raise
+                full, thread_ids = True, []
+
+        if full:
+            #The profile's history id is taken first, so no change between it and the listing is lost
+            history_id = service.users().getProfile(userId="me").execute()["historyId"]
+            page_token = None
+            while True:
+                result = service.users().threads().list(
+                    userId="me", q=f"newer_than:{self.gmail_window_days}d", maxResults=500, pageToken=page_token
+                ).execute()
+                thread_ids.extend(thread["id"] for thread in result.get("threads", []))
+                page_token = result.get("nextPageToken")
+                if not page_token:
+                    break
+
+        threads, missing = self._fetch_threads(service, list(dict.fromkeys(thread_ids)))
+
+        def apply(connection):
+            if full:
+                connection.execute("DELETE FROM threads")
+            for thread_id in missing:
+                connection.execute("DELETE FROM threads WHERE id = ?", (thread_id,))
+            for thread_id, thread in threads.items():
+                messages = thread.get("messages", [])
+                if not messages:
+                    connection.execute("DELETE FROM threads WHERE id = ?", (thread_id,))
+                    continue
+                headers = messages[0]["payload"].get("headers", [])
+                subject = next((h["value"] for h in headers if h["name"] == "Subject"), "(No Subject)")
+                labels = {label for message in messages for label in message.get("labelIds", [])}
+                last_ms = max(int(message.get("internalDate", 0)) for message in messages)
+                connection.execute(
+                    "INSERT OR REPLACE INTO threads (id, subject, labels, last_ms) VALUES (?, ?, ?, ?)",
+                    (thread_id, subject, "," + ",".join(sorted(labels)) + ",", last_ms),
+                )
+
+        if self._commit_sync("gmail", previous_token, str(history_id), apply, generation):
+            if full:
+                self.full_syncs += 1
+            else:
+                self.delta_syncs += 1
+
+    def list_events(self, days_into_the_future: int, limit: int = 100) -> list[dict]:
+        """Returns the events overlapping the next days, ordered by their start like events().list."""
+        now = time.time()
+        rows = self._query(
+            "SELECT resource FROM events WHERE start_ts < ? AND end_ts > ? ORDER BY start_ts LIMIT ?",
+            (now + days_into_the_future * 86400, now, limit),
+        )
+        return [json.loads(resource) for (resource,) in rows]
+
+    def covers_emails(self, days_into_the_past: int) -> bool:
+        return days_into_the_past <= self.gmail_window_days
+
+    def list_threads(self, days_into_the_past: int) -> list[tuple[str, str]]:
+        """Returns (thread id, subject) of the primary inbox threads of the last days, newest first."""
+        since_ms = int((time.time() - days_into_the_past * 86400) * 1000)
+        return self._query(
+            "SELECT id, subject FROM threads WHERE last_ms >= ? AND labels LIKE ? ORDER BY last_ms DESC",
+            (since_ms, f"%,{PRIMARY_LABEL},%"),
+        )
+
+    def get_message_text(self, message_id: str) -> str | None:
+        rows = self._query("SELECT text FROM message_texts WHERE id = ?", (message_id,))
+        return rows[0][0] if rows else None
+
+    def set_message_text(self, message_id: str, text: str) -> None:
+        #Message bodies never change, so they are stored when they are first read
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO message_texts (id, text) VALUES (?, ?)", (message_id, text))
+
+    def stats(self) -> dict:
+        rows = dict(self._query("SELECT source, synced_at FROM sync_state"))
+        return {
+            "full_syncs": self.full_syncs,
+            "delta_syncs": self.delta_syncs,
+            "seconds_since_sync": {source: round(time.time() - synced_at, 1) for source, synced_at in rows.items()},
+        }
@@ -0,0 +1,181 @@
+import re
+import math
+import heapq
+from collections import Counter
+
+#Letters and digits, so snake_case names split into their words
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """In-memory inverted index which ranks documents with Okapi BM25.
+
+        Documents can be added and removed one at a time, so the index grows with the data
+        instead of being rebuilt.
+
+        Args:
+            k1 (float): How quickly repeated terms stop adding to the score.
+            b (float): How strongly long documents are penalised.
+        """
+        self.k1 = k1
+        self.b = b
+        self._postings = {}
+        self._terms = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._terms
+
+    def add(self, doc_id: str, text: str) -> None:
+        if doc_id in self._terms:
+            self.remove(doc_id)
+        counts = Counter(tokenize(text))
+        for term, frequency in counts.items():
+            self._postings.setdefault(term, {})[doc_id] = frequency
+        self._terms[doc_id] = (list(counts), sum(counts.values()))
+        self._total_length += self._terms[doc_id][1]
+
+    def remove(self, doc_id: str) -> None:
+        terms, length = self._terms.pop(doc_id)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= length
+
+    def search(self, query: str, k: int = 10) -> list[tuple[str, float]]:
+        """Returns the ids and scores of the k best matching documents, best first."""
+        if not self._terms:
+            return []
+        n_docs = len(self._terms)
+        average_length = self._total_length / n_docs or 1
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                length = self._terms[doc_id][1]
+                weight = frequency * (self.k1 + 1) / (frequency + self.k1 * (1 - self.b + self.b * length / average_length))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * weight
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+class Embedder:
+    def __init__(self, model_name: str):
+        """Sentence embeddings of a small fastembed model, computed on the CPU with ONNX Runtime."""
+        import numpy
+        from fastembed import TextEmbedding
+
+        self._numpy = numpy
+        self._model = TextEmbedding(model_name)
+
+    def embed(self, texts: list[str]):
+        vectors = self._numpy.array(list(self._model.embed(texts)), dtype=self._numpy.float32)
+        return vectors / self._numpy.linalg.norm(vectors, axis=1, keepdims=True).clip(1e-12)
+
+    def from_bytes(self, blob: bytes):
+        return self._numpy.frombuffer(blob, dtype=self._numpy.float32)
+
+    def stack(self, vectors: list):
+        return self._numpy.stack(vectors)
+
+
+def load_embedder(model_name: str | None) -> Embedder | None:
+    """Returns the embedder of the model, or None if no model is set or fastembed is not installed."""
+    if not model_name:
+        return None
+    try:
+        return Embedder(model_name)
+    except ImportError:
+        print("fastembed is not installed, the search only ranks by words (pip install fastembed)")
+        return None
+
+
+class VectorIndex:
+    def __init__(self, embedder: Embedder):
+        """Normalised embeddings of documents, ranked by cosine similarity to the query."""
+        self.embedder = embedder
+        self._vectors = {}
+        self._ids = []
+        self._matrix = None
+
+    def add(self, doc_id: str, vector) -> None:
+        self._vectors[doc_id] = vector
+        self._matrix = None
+
+    def remove(self, doc_id: str) -> None:
+        self._vectors.pop(doc_id, None)
+        self._matrix = None
+
+    def search(self, query: str, k: int = 10) -> list[tuple[str, float]]:
+        if not self._vectors:
+            return []
+        if self._matrix is None:
+            #Stacked once per change of the documents, a search is one matrix product
+            self._ids = list(self._vectors)
+            self._matrix = self.embedder.stack([self._vectors[doc_id] for doc_id in self._ids])
+        scores = self._matrix @ self.embedder.embed([query])[0]
+        return heapq.nlargest(k, zip(self._ids, scores.tolist()), key=lambda item: item[1])
+
+
+def reciprocal_rank_fusion(rankings: list[list[tuple[str, float]]], k: int = 60) -> list[str]:
+    """Merges rankings of different scorers by the ranks of the documents, the scores are not comparable."""
+    fused = {}
+    for ranking in rankings:
+        for rank, (doc_id, _) in enumerate(ranking):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1 / (k + rank + 1)
+    return sorted(fused, key=fused.get, reverse=True)
+
+
+def tool_document(tool) -> str:
+    """The text a tool is found by: its name, its description and the names and descriptions of its parameters."""
+    properties = (tool.inputSchema or {}).get("properties", {})
+    parameters = " ".join(f"{name} {spec.get('description', '')}" for name, spec in properties.items())
+    return f"{tool.name} {tool.description or ''} {parameters}"
+
+
+def _stem(text: str) -> str:
+    #Plural and singular match, "emails" finds a tool about an "email"
+    return " ".join(term[:-1] if len(term) > 3 and term.endswith("s") else term for term in tokenize(text))
+
+
+class ToolRetriever:
+    def __init__(self, tools: list, embedder: Embedder | None = None):
+        """Ranks MCP tools by how well their name, description and parameters match a question.
+
+        An agent with many tools only shows the best ones to the model, so its prompt stays the
+        same size however many tools the server offers.
+
+        Args:
+            tools (list): The MCP tools.
+            embedder (Embedder | None): Optional embedding model, its ranking is fused with the BM25 one.
+        """
+        self.tools = {tool.name: tool for tool in tools}
+        self._bm25 = BM25Index()
+        for tool in tools:
+            self._bm25.add(tool.name, _stem(tool_document(tool)))
+
+        self._vectors = None
+        if embedder is not None and tools:
+            self._vectors = VectorIndex(embedder)
+            for tool, vector in zip(tools, embedder.embed([tool_document(tool) for tool in tools])):
+                self._vectors.add(tool.name, vector)
+
+    def select(self, query: str, k: int) -> list:
+        """Returns the k tools which match the query best, best first. Tools without any matching word are left out."""
+        rankings = [self._bm25.search(_stem(query), k)]
+        if self._vectors is not None:
+            rankings.append(self._vectors.search(query, k))
+        ranked = reciprocal_rank_fusion(rankings) if len(rankings) > 1 else [name for name, _ in rankings[0]]
+        return [self.tools[name] for name in ranked[:k]]
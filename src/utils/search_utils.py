@@ -0,0 +1,270 @@
+import os
+import time
+import sqlite3
+import threading
+
+from googleapiclient.errors import HttpError
+
+from utils.tools_utils import find_body_part, decode_body
+from utils.retrieval_utils import BM25Index, Embedder, VectorIndex, reciprocal_rank_fusion, tokenize
+
+#seq never repeats, unlike a plain rowid which SQLite hands out again once the newest row is deleted,
+#so refresh() can read the rows it has not seen by seq alone
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL UNIQUE, thread_id TEXT NOT NULL, sender TEXT, subject TEXT, date_ms INTEGER, body TEXT, vector BLOB
+);
+CREATE INDEX IF NOT EXISTS messages_by_date ON messages (date_ms);
+CREATE TABLE IF NOT EXISTS index_state (key TEXT PRIMARY KEY, value REAL NOT NULL);
+"""
+
+
+def make_snippet(text: str, query: str, width: int = 24) -> str:
+    """Returns the `width` words of the text which contain the most query terms."""
+    words = text.split()
+    if len(words) <= width:
+        return " ".join(words)
+    terms = set(tokenize(query))
+    hits = [1 if terms.intersection(tokenize(word)) else 0 for word in words]
+    window = sum(hits[:width])
+    best, best_start = window, 0
+    for start in range(1, len(words) - width + 1):
+        window += hits[start + width - 1] - hits[start - 1]
+        if window > best:
+            best, best_start = window, start
+    prefix = "... " if best_start > 0 else ""
+    suffix = " ..." if best_start + width < len(words) else ""
+    return prefix + " ".join(words[best_start:best_start + width]) + suffix
+
+
+class MailSearchIndex:
+    def __init__(
+        self,
+        path: str,
+        window_days: int = 90,
+        body_token_budget: int = 1000,
+        batch_size: int = 100,
+        embedder: Embedder | None = None,
+        sweep_every: int = 12,
+    ):
+        """Local full-text search over the sender, subject and body of the recent mail.
+
+        The messages are stored in SQLite and ranked from an in-memory BM25 index. With an
+        embedder the ranking of the embeddings is fused with the BM25 ranking. An update only
+        downloads the messages which are not indexed yet, and worker processes sharing the file
+        pick up the messages another process indexed without asking Google.
+
+        Args:
+            path (str): The SQLite file.
+            window_days (int): How many days of mail are indexed.
+            body_token_budget (int): The number of tokens of every body which are indexed.
+            batch_size (int): The number of message lookups per batch request.
+            embedder (Embedder | None): Computes the embeddings for the semantic ranking.
+            sweep_every (int): Every how many updates the whole window is listed to find deleted messages.
+        """
+        self.path = path
+        self.window_days = window_days
+        self.body_token_budget = body_token_budget
+        self.batch_size = batch_size
+        self.embedder = embedder
+        self.sweep_every = sweep_every
+        self._updates = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+        self._connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._bm25 = BM25Index()
+        self._vectors = VectorIndex(embedder) if embedder is not None else None
+        self._dates = {}
+        self._last_seq = 0
+        self.indexed = 0
+        self.searches = 0
+
+    def _migrate(self) -> None:
+        #Files of the schema without seq are dropped, the next update indexes the window again
+        columns = [row[1] for row in self._connection.execute("PRAGMA table_info(messages)").fetchall()]
+        if columns and "seq" not in columns:
+            self._connection.executescript("DROP TABLE messages; DELETE FROM index_state WHERE key = 'indexed_at';")
+
+    def _cutoff_ms(self) -> int:
+        return int((time.time() - self.window_days * 86400) * 1000)
+
+    def _query(self, sql: str, parameters: tuple = ()) -> list:
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def is_ready(self) -> bool:
+        """Whether the mailbox was indexed at least once."""
+        return bool(self._query("SELECT 1 FROM index_state WHERE key = 'indexed_at'"))
+
+    def refresh(self) -> None:
+        """Adds the messages other processes stored since the last refresh and drops the expired ones."""
+        rows = self._query(
+            "SELECT seq, id, sender, subject, date_ms, body, vector FROM messages WHERE seq > ? ORDER BY seq",
+            (self._last_seq,),
+        )
+        cutoff = self._cutoff_ms()
+        with self._lock:
+            for seq, message_id, sender, subject, date_ms, body, vector in rows:
+                self._last_seq = max(self._last_seq, seq)
+                if date_ms < cutoff:
+                    continue
+                #Sender and subject are short, repeating them weighs them more than a word of the body
+                self._bm25.add(message_id, f"{sender} {subject} {sender} {subject} {body}")
+                if self._vectors is not None and vector is not None:
+                    self._vectors.add(message_id, self.embedder.from_bytes(vector))
+                self._dates[message_id] = date_ms
+
+            for message_id in [message_id for message_id, date_ms in self._dates.items() if date_ms < cutoff]:
+                self._bm25.remove(message_id)
+                if self._vectors is not None:
+                    self._vectors.remove(message_id)
+                del self._dates[message_id]
+
+    def _list_message_ids(self, service, stored: set, sweep: bool) -> list[str]:
+        message_ids, page_token = [], None
+        while True:
+            result = service.users().messages().list(
+                userId="me", q=f"newer_than:{self.window_days}d", maxResults=500, pageToken=page_token
+            ).execute()
+            page = [message["id"] for message in result.get("messages", [])]
+            message_ids.extend(page)
+            page_token = result.get("nextPageToken")
+            #The listing is newest first, so after a page of known messages only known ones follow
+            if not page_token or (not sweep and stored.issuperset(page)):
+                return message_ids
+
+    def _fetch_messages(self, service, message_ids: list[str]) -> list[tuple]:
+        rows = []
+
+        def collect(request_id, response, exception):
+            #Messages deleted since the listing are skipped
+            if exception is not None:
+                if isinstance(exception, HttpError) and exception.resp.status == 404:
+                    return
+                raise exception
+            headers = {header["name"].lower(): header["value"] for header in response.get("payload", {}).get("headers", [])}
+            part = find_body_part(response.get("payload", {}))
+            data = part.get("body", {}).get("data") if part is not None else None
+            #Large text parts are left out of format='full', their snippet stands in for them
+            body = decode_body(part, data, self.body_token_budget, marker=False) if data else response.get("snippet", "")
+            rows.append((
+                response["id"],
+                response.get("threadId", response["id"]),
+                headers.get("from", ""),
+                headers.get("subject", "(No Subject)"),
+                int(response.get("internalDate", 0)),
+                body,
+            ))
+
+        for start in range(0, len(message_ids), self.batch_size):
+            batch = service.new_batch_http_request(callback=collect)
+            for message_id in message_ids[start:start + self.batch_size]:
+                batch.add(service.users().messages().get(userId="me", id=message_id, format="full"), request_id=message_id)
+            batch.execute()
+        return rows
+
+    def update(self, service) -> int:
+        """Indexes the messages of the window which are not indexed yet.
+
+        Usually only the newest pages of the listing are read. Every `sweep_every` updates the
+        whole window is listed, and the messages which were deleted in Gmail are forgotten.
+
+        Args:
+            service: The Gmail service object.
+
+        Returns:
+            int: The number of newly indexed messages.
+        """
+        self.refresh()
+        stored = {message_id for (message_id,) in self._query("SELECT id FROM messages")}
+        sweep = self._updates % self.sweep_every == 0
+        self._updates += 1
+        listed = self._list_message_ids(service, stored, sweep)
+        rows = self._fetch_messages(service, [message_id for message_id in listed if message_id not in stored])
+
+        vectors = [None] * len(rows)
+        if self.embedder is not None and rows:
+            embeddings = self.embedder.embed([f"{row[3]}\n{row[5]}" for row in rows])
+            vectors = [vector.tobytes() for vector in embeddings]
+
+        listed = set(listed)
+        cutoff = self._cutoff_ms()
+        with self._lock:
+            connection = self._connection
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.executemany(
+                    "INSERT OR IGNORE INTO messages (id, thread_id, sender, subject, date_ms, body, vector) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [row + (vector,) for row, vector in zip(rows, vectors)],
+                )
+                connection.execute("DELETE FROM messages WHERE date_ms < ?", (cutoff,))
+                deleted = [(message_id,) for message_id in stored if sweep and message_id not in listed]
+                connection.executemany("DELETE FROM messages WHERE id = ?", deleted)
+                connection.execute(
+                    "INSERT OR REPLACE INTO index_state (key, value) VALUES ('indexed_at', ?)", (time.time(),)
+                )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            for (message_id,) in deleted:
+                if message_id in self._dates:
+                    self._bm25.remove(message_id)
+                    if self._vectors is not None:
+                        self._vectors.remove(message_id)
+                    del self._dates[message_id]
+
+        self.refresh()
+        self.indexed += len(rows)
+        return len(rows)
+
+    def search(self, query: str, top_k: int = 5) -> list[dict]:
+        """Returns the best matching messages with a snippet of their body, best first.
+
+        Args:
+            query (str): The words to look for.
+            top_k (int): The number of messages to return.
+
+        Returns:
+            list[dict]: id, thread_id, sender, subject, date_ms and snippet of every message.
+        """
+        self.refresh()
+        with self._lock:
+            #Messages another process deleted are only noticed below, so a few more are ranked
+            rankings = [self._bm25.search(query, top_k * 2)]
+            if self._vectors is not None:
+                rankings.append(self._vectors.search(query, top_k * 2))
+            self.searches += 1
+        ranked = reciprocal_rank_fusion(rankings) if len(rankings) > 1 else [doc_id for doc_id, _ in rankings[0]]
+
+        results = []
+        for message_id in ranked:
+            rows = self._query("SELECT thread_id, sender, subject, date_ms, body FROM messages WHERE id = ?", (message_id,))
+            if not rows:
+                continue
+            thread_id, sender, subject, date_ms, body = rows[0]
+            results.append({
+                "id": message_id,
+                "thread_id": thread_id,
+                "sender": sender,
+                "subject": subject,
+                "date_ms": date_ms,
+                "snippet": make_snippet(body, query),
+            })
+            if len(results) == top_k:
+                break
+        return results
+
+    def stats(self) -> dict:
+        rows = self._query("SELECT value FROM index_state WHERE key = 'indexed_at'")
+        return {
+            "messages": len(self._dates),
+            "indexed": self.indexed,
+            "searches": self.searches,
+            "semantic": self._vectors is not None,
+            "seconds_since_update": round(time.time() - rows[0][0], 1) if rows else None,
+        }
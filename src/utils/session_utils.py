@@ -0,0 +1,197 @@
+import asyncio
+import threading
+from contextlib import suppress
+
+import anyio
+import httpx
+from mcp import ClientSession, types
+from mcp.client.sse import sse_client
+
+#Errors which mean the SSE connection to the MCP server is gone
+CONNECTION_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError, httpx.TransportError, ConnectionError)
+
+
+class MCPSessionManager:
+    def __init__(self, endpoint: str):
+        """Keeps one long-lived MCP ClientSession on a background event loop.
+
+        The session and its SSE connection are opened on first use and reused for every
+        message. The tool list is cached until the server announces a change through a
+        tools/list_changed notification or the connection is re-established.
+
+        Args:
+            endpoint (str): The SSE endpoint of the MCP server.
+        """
+        self.endpoint = endpoint
+        self.tools_version = 0
+        self._session = None
+        self._tools = None
+        self._connection = None
+        self._closed = asyncio.Event()
+        self._connect_lock = asyncio.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="mcp-session-loop", daemon=True)
+        self._thread.start()
+
+    def run(self, coro, timeout: float | None = None):
+        """Runs a coroutine on the background loop and blocks until it finished.
+
+        Args:
+            coro (Coroutine): The coroutine to run.
+            timeout (float | None): Seconds to wait for the result.
+
+        Returns:
+            The result of the coroutine.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    def iterate(self, async_iterable):
+        """Consumes an async iterable on the background loop from synchronous code.
+
+        Args:
+            async_iterable (AsyncIterable): The async iterable, e.g. Agent.invoke_stream(...).
+
+        Yields:
+            The items of the async iterable.
+        """
+        iterator = async_iterable.__aiter__()
+        exhausted = object()
+
+        async def next_item():
+            try:
+                return await iterator.__anext__()
+            except StopAsyncIteration:
+                return exhausted
+
+        while True:
+            try:
+                item = self.run(next_item())
+            except Exception as error:
+                if self._is_connection_error(error):
+                    self.run(self._drop_connection())
+                raise
+            if item is exhausted:
+                return
+            yield item
+
+    async def _handle_message(self, message) -> None:
+        if isinstance(message, types.ServerNotification) and isinstance(message.root, types.ToolListChangedNotification):
+            self._tools = None
+
+    async def _hold_connection(self, ready: asyncio.Future) -> None:
+        #The sse_client and ClientSession contexts have to be entered and left by the same task,
+        #so this task owns them for the whole lifetime of the connection.
+        try:
+            async with sse_client(url=self.endpoint) as (read, write):
+                async with ClientSession(read, write, message_handler=self._handle_message) as session:
+                    await session.initialize()
+                    self._session = session
+                    ready.set_result(session)
+                    await self._closed.wait()
+        except Exception as error:
+            if not ready.done():
+                ready.set_exception(error)
+            raise
+        finally:
+            if not ready.done():
+                ready.cancel()
+            self._session = None
+            self._tools = None
+
+    async def _connect(self) -> None:
+        self._closed = asyncio.Event()
+        ready = self._loop.create_future()
+        self._connection = asyncio.create_task(self._hold_connection(ready))
+        #The error of a failed connection reaches the caller through ready
+        self._connection.add_done_callback(lambda task: task.cancelled() or task.exception())
+        await ready
+
+    async def _disconnect(self) -> None:
+        if self._connection is not None:
+            self._closed.set()
+            with suppress(Exception, asyncio.CancelledError):
+                await self._connection
+            self._connection = None
+
+    async def get_session(self) -> ClientSession:
+        """Returns the open session, (re)connecting if there is none or the connection died."""
+        async with self._connect_lock:
+            if self._session is None or self._connection is None or self._connection.done():
+                await self._disconnect()
+                await self._connect()
+            return self._session
+
+    async def reconnect(self) -> ClientSession:
+        async with self._connect_lock:
+            await self._disconnect()
+            await self._connect()
+            return self._session
+
+    async def list_tools(self) -> list:
+        """Returns the cached tool list, fetching it from the server when it is unknown or stale."""
+        session = await self.get_session()
+        if self._tools is None:
+            self._tools = (await session.list_tools()).tools
+            self.tools_version += 1
+        return self._tools
+
+    async def call(self, fn):
+        """Runs fn(session) on the open session.
+
+        A broken connection is dropped so that the next call reconnects, but the call itself
+        is not retried since it may already have triggered write tools on the server.
+
+        Args:
+            fn (Callable): An async function taking the ClientSession.
+
+        Returns:
+            The result of fn.
+        """
+        session = await self.get_session()
+        try:
+            return await fn(session)
+        except Exception as error:
+            if self._is_connection_error(error):
+                await self._drop_connection()
+            raise
+
+    def _is_connection_error(self, error: BaseException) -> bool:
+        #anyio task groups wrap the errors of the transport in exception groups
+        if isinstance(error, BaseExceptionGroup):
+            return any(self._is_connection_error(inner) for inner in error.exceptions)
+        return isinstance(error, CONNECTION_ERRORS) or self._connection is None or self._connection.done()
+
+    async def _drop_connection(self) -> None:
+        async with self._connect_lock:
+            await self._disconnect()
+
+    def close(self) -> None:
+        self.run(self._disconnect())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+async def call_tool(session: ClientSession, name: str, arguments: dict | None = None, traceparent: str | None = None) -> types.CallToolResult:
+    """
+    Calls a tool like ClientSession.call_tool, passing the trace context in the _meta of the request.
+
+    Args:
+        session (ClientSession): The open MCP session.
+        name (str): The name of the tool.
+        arguments (dict | None): The arguments of the tool.
+        traceparent (str | None): The W3C traceparent the tool server continues the trace with.
+
+    Returns:
+        CallToolResult: The result of the tool.
+    """
+    if traceparent is None:
+        return await session.call_tool(name, arguments=arguments)
+
+    return await session.send_request(
+        types.ClientRequest(
+            types.CallToolRequest(
+                method="tools/call",
+                params=types.CallToolRequestParams(name=name, arguments=arguments, _meta={"traceparent": traceparent}),
+            )
+        ),
+        types.CallToolResult,
+    )
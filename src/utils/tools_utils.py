@@ -1,12 +1,18 @@
+import re
 import json
+import base64
 from typing import Callable, List, Union
-import requests
 import datetime as dt
 from datetime import timedelta
 
 from bs4 import BeautifulSoup
 
 from utils.config_loader import config
+from utils.http_utils import CachedFetcher
+from utils.mirror_utils import event_timestamp
+from utils.tracing_utils import tracer
+
+news_fetcher = CachedFetcher(ttl=config.get_news_cache_ttl())
 
 
 class Tool:
@@ -65,25 +71,58 @@ def validate_arguments(tool_call: dict, tool_signature: dict) -> dict:
             tool_call["arguments"][arg_name] = type_mapping[expected_type](arg_value)
     return tool_call
 
-def delete_appointment(appointment_ids: Union[str, List[str]], service):
+def delete_appointment(appointment_ids: Union[str, List[str]], service, batch_size: int = 50) -> str:
+    """
+    Deletes appointments with Calendar batch requests, up to `batch_size` deletions per round trip.
+
+    Args:
+        appointment_ids (Union[str, List[str]]): A single appointment ID or a list of appointment IDs.
+        service: The Calendar service object.
+        batch_size (int): The number of deletions per batch request (Google recommends at most 50).
+
+    Returns:
+        str: A report with the outcome of every deletion.
+    """
     if isinstance(appointment_ids, str):
-        service.events().delete(
-            calendarId="primary",
-            eventId=appointment_ids,
-            sendNotifications=False
-        ).execute()
-        return "Appointment successfully deleted!"
-    elif isinstance(appointment_ids, list):
-        for appointment_id in appointment_ids:
-            service.events().delete(
-                calendarId="primary",
-                eventId=appointment_id,
-                sendNotifications=False
-            ).execute()
-        return "Appointments successfully deleted!"
-    else:
+        appointment_ids = [appointment_ids]
+    elif not isinstance(appointment_ids, list):
         return "Invalid input type. Please provide a string or list of strings."
 
+    #Batch request ids have to be unique
+    appointment_ids = list(dict.fromkeys(appointment_ids))
+    errors = {}
+
+    def collect_result(request_id, response, exception):
+        errors[request_id] = exception
+
+    for start in range(0, len(appointment_ids), batch_size):
+        chunk = appointment_ids[start:start + batch_size]
+        batch = service.new_batch_http_request(callback=collect_result)
+        for appointment_id in chunk:
+            batch.add(
+                service.events().delete(
+                    calendarId="primary",
+                    eventId=appointment_id,
+                    sendNotifications=False
+                ),
+                request_id=appointment_id
+            )
+        with tracer.span("google_api.batch", "google_api", method="calendar.events.delete", size=len(chunk)):
+            batch.execute()
+
+    failed = {appointment_id: error for appointment_id, error in errors.items() if error is not None}
+    if not failed:
+        return "Appointment successfully deleted!" if len(appointment_ids) == 1 else "Appointments successfully deleted!"
+
+    out_string = ""
+    for appointment_id in appointment_ids:
+        error = errors.get(appointment_id)
+        if error is None:
+            out_string += f"Appointment {appointment_id}: deleted\n"
+        else:
+            out_string += f"Appointment {appointment_id}: not deleted ({getattr(error, 'reason', error)})\n"
+    return out_string
+
 def create_appointment(appointment_name: str, 
                        appointment_description: str, 
                        appointment_start_date: str, 
@@ -111,23 +150,91 @@ def create_appointment(appointment_name: str,
     created_event = service.events().insert(calendarId='primary', body=event).execute()
     return f"Appointment created successfully! View it here: {created_event.get('htmlLink')}"
 
-def get_appointments(days_into_the_future: int, service) -> str:
-    output_string = ""
+def update_appointment(appointment_id: str,
+                       service,
+                       appointment_name: str = "",
+                       appointment_description: str = "",
+                       appointment_start_date: str = "",
+                       appointment_end_date: str = "",
+                       location: str = "") -> str:
+    """
+    Updates an appointment in place with a single events().patch request.
+
+    Only the non-empty fields are sent, everything else, including the event id,
+    attendees and reminders, stays as it is.
+
+    Returns:
+        str: A message confirming the update.
+    """
+    changes = {}
+    if appointment_name:
+        changes['summary'] = appointment_name
+    if appointment_description:
+        changes['description'] = appointment_description
+    if location:
+        changes['location'] = location
+    if appointment_start_date:
+        changes['start'] = {'dateTime': appointment_start_date}
+    if appointment_end_date:
+        changes['end'] = {'dateTime': appointment_end_date}
+
+    if not changes:
+        return "Nothing to update, no new values were given."
+
+    updated_event = service.events().patch(
+        calendarId='primary',
+        eventId=appointment_id,
+        body=changes,
+        sendUpdates='none'
+    ).execute()
+    return f"Appointment updated successfully! View it here: {updated_event.get('htmlLink')}"
+
+def list_appointments(days_into_the_future: int, service, etag: str | None = None, margin_seconds: float = 0.0) -> tuple[str, list, str]:
+    """
+    Lists the upcoming events of the primary calendar.
+
+    Args:
+        days_into_the_future (int): The number of days into the future to look for events.
+        service: The Calendar service object.
+        etag (str | None): The ETag of an earlier listing. If the calendar did not change since,
+                           Google answers with 304 Not Modified, which raises an HttpError.
+        margin_seconds (float): Extends the listing beyond the window, so it still covers the
+                                window when it is reused later.
+
+    Returns:
+        tuple[str, list, str]: The current time, the events and the ETag of the listing.
+    """
     now = dt.datetime.now()
-    end_time = (now + timedelta(days=days_into_the_future)).isoformat() + "Z"
+    end_time = (now + timedelta(days=days_into_the_future, seconds=margin_seconds)).isoformat() + "Z"
     now = now.isoformat() + "Z"
-    output_string += f"Today's time is: {now}\n"
 
-    event_result = service.events().list(
+    request = service.events().list(
         calendarId="primary",
         timeMin=now,
         timeMax=end_time,
         maxResults=100,
         singleEvents=True,
         orderBy="startTime"
-    ).execute()
+    )
+    if etag:
+        request.headers["If-None-Match"] = etag
+    event_result = request.execute()
+
+    return now, event_result.get("items", []), event_result.get("etag")
 
-    events = event_result.get("items", [])
+def events_in_window(events: list, days_into_the_future: int) -> list:
+    """Keeps the events which have not ended yet and start within the next days, e.g. of a listing fetched earlier."""
+    now = dt.datetime.now().timestamp()
+    end = now + days_into_the_future * 86400
+    return [
+        event for event in events
+        if (event_timestamp(event["end"]) or end) > now and (event_timestamp(event["start"]) or now) < end
+    ]
+
+def format_appointments(days_into_the_future: int, events: list, now: str | None = None) -> str:
+    if now is None:
+        now = dt.datetime.now().isoformat() + "Z"
+    output_string = f"Today's time is: {now}\n"
 
     if not events:
         if days_into_the_future == 1:
@@ -144,27 +251,204 @@ def get_appointments(days_into_the_future: int, service) -> str:
 
     return output_string
 
-def get_emails(days_into_the_past: int, service):
-        out_string = ""
+def get_appointments(days_into_the_future: int, service) -> str:
+    now, events, _ = list_appointments(days_into_the_future, service)
+    return format_appointments(days_into_the_future, events, now)
+
+def get_emails(days_into_the_past: int, service, batch_size: int = config.get_gmail_batch_size()):
+        """
+        Lists the threads of the last days and fetches their subjects with Gmail batch requests.
+
+        Only the Subject header is requested (format=metadata), and up to `batch_size` thread
+        lookups share one HTTP round trip, so N threads cost about N/batch_size + 1 requests.
+
+        Args:
+            days_into_the_past (int): The number of days in the past to search for emails.
+            service: The Gmail service object.
+            batch_size (int): The number of thread lookups per batch request (Gmail allows up to 100).
+
+        Returns:
+            str: A string containing thread IDs and subjects of the emails, followed by the number
+                of threads which could not be loaded if a lookup failed twice.
+        """
         query = f'category:primary newer_than:{days_into_the_past}d'
-        threads_result = service.users().threads().list(userId='me', q=query).execute()
-        threads = threads_result.get('threads', [])
+        threads = []
+        page_token = None
 
-        for thread in threads:
-            thread_id = thread['id']
-            thread_data = service.users().threads().get(userId='me', id=thread_id).execute()
-            messages = thread_data.get('messages', [])
+        while True:
+            threads_result = service.users().threads().list(
+                userId='me', q=query, maxResults=500, pageToken=page_token
+            ).execute()
+            threads.extend(threads_result.get('threads', []))
+            page_token = threads_result.get('nextPageToken')
+            if not page_token:
+                break
 
+        subjects = {}
+        failed = []
+
+        def collect_subject(request_id, response, exception):
+            if exception is not None:
+                failed.append(request_id)
+                return
+            messages = response.get('messages', [])
             if messages:
-                first_message = messages[0]
-                headers = first_message['payload']['headers']
-                subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '(No Subject)')
-                out_string += f"Thread ID: {thread_id}, Subject: {subject} \n"
-        return out_string
+                headers = messages[0]['payload'].get('headers', [])
+                subjects[request_id] = next((h['value'] for h in headers if h['name'] == 'Subject'), '(No Subject)')
+
+        def fetch_subjects(thread_ids):
+            for start in range(0, len(thread_ids), batch_size):
+                chunk = thread_ids[start:start + batch_size]
+                batch = service.new_batch_http_request(callback=collect_subject)
+                for thread_id in chunk:
+                    batch.add(
+                        service.users().threads().get(
+                            userId='me', id=thread_id, format='metadata', metadataHeaders=['Subject']
+                        ),
+                        request_id=thread_id
+                    )
+                with tracer.span("google_api.batch", "google_api", method="gmail.users.threads.get", size=len(chunk)):
+                    batch.execute()
+
+        fetch_subjects([thread['id'] for thread in threads])
+
+        #Single items of a batch can be rate limited, those get one more try
+        if failed:
+            retry_ids, failed[:] = list(failed), []
+            fetch_subjects(retry_ids)
+
+        #Threads which failed twice are reported, so the list does not look complete without them
+        return format_emails(
+            [(thread['id'], subjects[thread['id']]) for thread in threads if thread['id'] in subjects],
+            unloaded=len(failed)
+        )
+
+def format_emails(threads: list[tuple[str, str]], unloaded: int = 0) -> str:
+    text = "".join(f"Thread ID: {thread_id}, Subject: {subject} \n" for thread_id, subject in threads)
+    if unloaded:
+        text += f"{unloaded} emails could not be loaded, the list above is incomplete. \n"
+    return text
+
+def format_search_results(results: list[dict]) -> str:
+    lines = []
+    for result in results:
+        date = dt.datetime.fromtimestamp(result["date_ms"] / 1000).strftime("%Y-%m-%d %H:%M")
+        lines.append(
+            f"Message ID: {result['id']}, Thread ID: {result['thread_id']}, From: {result['sender']}, "
+            f"Date: {date}, Subject: {result['subject']}\n    {result['snippet']}\n"
+        )
+    return "".join(lines)
+
+def find_body_part(payload: dict) -> dict | None:
+    """
+    Finds the part of a format='full' message payload which holds the readable body.
+
+    The first text/plain part wins, a text/html part is the fallback. Attachments are skipped.
+
+    Args:
+        payload (dict): The payload of a Gmail message resource.
+
+    Returns:
+        dict | None: The part, or None if the message has no text part.
+    """
+    html_part = None
+    stack = [payload]
+    while stack:
+        part = stack.pop(0)
+        if part.get("parts"):
+            stack[:0] = part["parts"]
+            continue
+
+        headers = {header["name"].lower(): header["value"] for header in part.get("headers", [])}
+        if part.get("filename") or "attachment" in headers.get("content-disposition", ""):
+            continue
+        if part.get("mimeType") == "text/plain":
+            return part
+        if part.get("mimeType") == "text/html" and html_part is None:
+            html_part = part
+    return html_part
+
+def html_to_text(html: str) -> str:
+    soup = BeautifulSoup(html, "html.parser")
+    for element in soup(["script", "style", "head"]):
+        element.decompose()
+    #Block elements end a line, inline elements like <b> stay part of it
+    for element in soup(["br", "p", "div", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6"]):
+        element.insert_after("\n")
+    for element in soup(["td", "th"]):
+        element.insert_after(" ")
+    lines = (" ".join(line.split()) for line in soup.get_text().splitlines())
+    return "\n".join(line for line in lines if line)
+
+def read_message(message_id: str, service, token_budget: int = config.get_read_mail_token_budget()) -> str | None:
+    """
+    Reads the text body of a Gmail message without downloading its attachments.
+
+    The message is fetched with format='full', which lists the parts but leaves out the
+    content of attachments. Only the text part is decoded, HTML is converted to text,
+    and the result is cut to the token budget with a marker.
+
+    Args:
+        message_id (str): The ID of the message.
+        service: The Gmail service object.
+        token_budget (int): The maximum number of tokens of the returned text.
+
+    Returns:
+        str | None: The text of the message, or None if it has no text part.
+    """
+    message = service.users().messages().get(userId='me', id=message_id, format='full').execute()
+    part = find_body_part(message.get('payload', {}))
+    if part is None:
+        return None
+
+    body = part.get('body', {})
+    data = body.get('data')
+    if data is None and body.get('attachmentId'):
+        #Gmail leaves large text parts out of format='full' as well
+        data = service.users().messages().attachments().get(
+            userId='me', messageId=message_id, id=body['attachmentId']
+        ).execute()['data']
+    if not data:
+        return ""
+    return decode_body(part, data, token_budget)
+
+def decode_body(part: dict, data: str, token_budget: int, marker: bool = True) -> str:
+    """
+    Decodes the base64url data of a message part to text, cut to the token budget with a marker.
+
+    Args:
+        part (dict): The part of the message payload, see find_body_part.
+        data (str): The base64url encoded content of the part.
+        token_budget (int): The maximum number of tokens of the returned text.
+        marker (bool): Whether a cut text ends with a note that it was truncated.
+
+    Returns:
+        str: The text of the part.
+    """
+    keep = token_budget * 4
+    if part['mimeType'] == 'text/plain':
+        #A character takes at most four bytes, so this prefix holds more than `keep` characters
+        needed = (keep + 1) * 4
+        data = data[:(needed + 2) // 3 * 4]
+
+    headers = {header['name'].lower(): header['value'] for header in part.get('headers', [])}
+    charset = re.search(r'charset="?([\w-]+)', headers.get('content-type', ''))
+    raw = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+    try:
+        text = raw.decode(charset.group(1) if charset else "utf-8", errors="replace")
+    except LookupError:
+        text = raw.decode("utf-8", errors="replace")
+
+    if part['mimeType'] == 'text/html':
+        text = html_to_text(text)
+
+    if len(text) <= keep or not marker:
+        return text[:keep]
+    return text[:keep] + f"\n[... email truncated after {token_budget} tokens ...]"
 
 def scrape_news() -> str:
     #I could definitely change from gmx news to something more serious haha
-    response = requests.get(config.get_news_endpoint())
+    response = news_fetcher.get(config.get_news_endpoint())
 
     if response.status_code == 200:
         soup = BeautifulSoup(response.text, 'html.parser')
@@ -0,0 +1,237 @@
+import os
+import sys
+import json
+import math
+import time
+import secrets
+import threading
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from utils.config_loader import config
+
+#The span which new spans are attached to, copied into tasks and tool threads with the context
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+@dataclass
+class Span:
+    """
+    A data class to represent one timed operation of a trace.
+
+    Attributes:
+        name (str): What was timed, e.g. 'llm.complete' or 'tool.read_mail'.
+        kind (str): The span type the report groups by, e.g. 'llm', 'mcp' or 'google_api'.
+        trace_id (str): 32 hex digits shared by all spans of one request.
+        span_id (str): 16 hex digits identifying this span.
+        parent_id (str | None): The span_id of the parent span, None for the root.
+        start_ns (int): The start as unix time in nanoseconds.
+        end_ns (int): The end as unix time in nanoseconds, 0 while the span is open.
+        attributes (dict): Additional values, e.g. token counts or the tool name.
+        error (str | None): The exception which ended the span, if any.
+    """
+
+    name: str
+    kind: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None = None
+    start_ns: int = 0
+    end_ns: int = 0
+    attributes: dict = field(default_factory=dict)
+    error: str | None = None
+
+    @property
+    def traceparent(self) -> str:
+        """The W3C traceparent header which continues this trace in another process."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def to_otlp(self) -> dict:
+        """Encodes the span with the field names of the OTLP JSON format."""
+        def encode(value):
+            if isinstance(value, bool):
+                return {"boolValue": value}
+            if isinstance(value, int):
+                return {"intValue": str(value)}
+            if isinstance(value, float):
+                return {"doubleValue": value}
+            return {"stringValue": str(value)}
+
+        attributes = {"span.kind": self.kind, **self.attributes}
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": encode(value)} for key, value in attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+
+
+def parse_traceparent(traceparent: str | None) -> tuple[str, str] | None:
+    """
+    Returns the (trace id, parent span id) of a W3C traceparent header, None if it is invalid.
+    """
+    parts = (traceparent or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+class JsonlExporter:
+    def __init__(self, path: str):
+        """Appends finished spans as OTLP JSON lines to a file.
+
+        Every span is written with a single append, so the client and all tool server
+        workers can share one file.
+
+        Args:
+            path (str): The file the spans are appended to. Its directory is created if needed.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_otlp()) + "\n"
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._file = open(self.path, "a", buffering=1)
+            self._file.write(line)
+
+
+class Tracer:
+    def __init__(self, exporter: JsonlExporter | None = None):
+        """Creates spans and hands the finished ones to the exporter.
+
+        Without an exporter spans are still created, so trace context keeps propagating,
+        but nothing is written.
+
+        Args:
+            exporter (JsonlExporter | None): Receives the finished spans.
+        """
+        self.exporter = exporter
+
+    def start(self, name: str, kind: str, parent: "Span | str | None" = None, **attributes) -> Span:
+        """Opens a span without making it the current one, e.g. for spans which outlive a yield.
+
+        Args:
+            name (str): The name of the span.
+            kind (str): The span type.
+            parent (Span | str | None): The parent span or a traceparent header.
+                Defaults to the current span.
+            **attributes: Initial attributes of the span.
+
+        Returns:
+            Span: The open span, to be finished with end().
+        """
+        if parent is None:
+            parent = _current_span.get()
+
+        if isinstance(parent, Span):
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        else:
+            trace_id, parent_id = parse_traceparent(parent) or (secrets.token_hex(16), None)
+
+        return Span(
+            name=name,
+            kind=kind,
+            trace_id=trace_id,
+            span_id=secrets.token_hex(8),
+            parent_id=parent_id,
+            start_ns=time.time_ns(),
+            attributes=attributes,
+        )
+
+    def end(self, span: Span, error: BaseException | None = None) -> None:
+        span.end_ns = time.time_ns()
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        if self.exporter is not None:
+            self.exporter.export(span)
+
+    @contextmanager
+    def span(self, name: str, kind: str, parent: "Span | str | None" = None, **attributes):
+        """Times the enclosed block as the current span. See start() for the arguments."""
+        span = self.start(name, kind, parent, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as error:
+            self.end(span, error)
+            raise
+        else:
+            self.end(span)
+        finally:
+            _current_span.reset(token)
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    #Nearest rank, so every reported value was actually observed
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def summarize(path: str) -> dict:
+    """
+    Computes the latency percentiles per span kind, and per span name within it, from an exported trace file.
+
+    Args:
+        path (str): The JSONL file written by JsonlExporter.
+
+    Returns:
+        dict: For every span kind its count and p50/p95/p99 in milliseconds, and the same for
+            each of its span names under "spans".
+    """
+    durations = defaultdict(lambda: defaultdict(list))
+    with open(path) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            span = json.loads(line)
+            attributes = {attribute["key"]: attribute["value"] for attribute in span.get("attributes", [])}
+            kind = attributes.get("span.kind", {}).get("stringValue", "")
+            duration = (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6
+            durations[kind][span["name"]].append(duration)
+
+    def percentiles(values: list[float]) -> dict:
+        values = sorted(values)
+        return {
+            "count": len(values),
+            "p50": percentile(values, 0.50),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99),
+        }
+
+    report = {}
+    for kind, names in sorted(durations.items()):
+        report[kind] = percentiles([value for values in names.values() for value in values])
+        report[kind]["spans"] = {name: percentiles(values) for name, values in sorted(names.items())}
+    return report
+
+
+def format_report(report: dict) -> str:
+    lines = [f"{'span':<40}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+
+    def format_row(label: str, row: dict) -> str:
+        return f"{label:<40}{row['count']:>8}{row['p50']:>10.1f}{row['p95']:>10.1f}{row['p99']:>10.1f}"
+
+    for kind, row in report.items():
+        lines.append(format_row(kind, row))
+        for name, span_row in row["spans"].items():
+            lines.append(format_row(f"  {name}", span_row))
+    return "\n".join(lines)
+
+tracer = Tracer(JsonlExporter(config.get_tracing_path()) if config.get_tracing_enabled() else None)
+
+
+if __name__ == "__main__":
+    #python src/utils/tracing_utils.py [trace file]
+    print(format_report(summarize(sys.argv[1] if len(sys.argv) > 1 else config.get_tracing_path())))